@@ -26,8 +26,8 @@ class AlertAcknowledgmentAdmin(admin.ModelAdmin):
 
 @admin.register(AlertLog)
 class AlertLogAdmin(admin.ModelAdmin):
-    list_display = ['alert', 'user', 'delivery_method', 'was_successful', 'delivered_at']
-    list_filter = ['delivery_method', 'was_successful', 'delivered_at']
+    list_display = ['alert', 'user', 'delivery_method', 'delivery_status', 'was_successful', 'delivered_at']
+    list_filter = ['delivery_method', 'delivery_status', 'was_successful', 'delivered_at']
     raw_id_fields = ['alert', 'user']
     date_hierarchy = 'delivered_at'
     ordering = ['-delivered_at']
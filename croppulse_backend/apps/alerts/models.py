@@ -3,6 +3,7 @@ Alert models for CropPulse Africa
 """
 from django.db import models
 from django.conf import settings
+from core.validators import validate_geofence
 
 
 class Alert(models.Model):
@@ -43,6 +44,10 @@ class Alert(models.Model):
     # Target area
     counties = models.JSONField(default=list, help_text='Affected counties')
     subcounties = models.JSONField(default=list, blank=True, help_text='Affected subcounties')
+    geofence = models.JSONField(
+        default=dict, blank=True, validators=[validate_geofence],
+        help_text='Optional circle or polygon; when set, only farms inside it are targeted'
+    )
     
     # Validity period
     start_time = models.DateTimeField()
@@ -68,6 +73,10 @@ class Alert(models.Model):
     # Acknowledgment tracking
     require_acknowledgment = models.BooleanField(default=False)
     acknowledgment_count = models.IntegerField(default=0)
+    escalated_at = models.DateTimeField(
+        blank=True, null=True,
+        help_text='When SMS reminders went to recipients who had not acknowledged'
+    )
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -119,10 +128,22 @@ class AlertLog(models.Model):
     alert = models.ForeignKey(Alert, on_delete=models.CASCADE, related_name='delivery_logs')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     
+    # Provider-reported outcome, updated from status callbacks
+    DELIVERY_STATUSES = [
+        ('queued', 'Queued'),
+        ('sent', 'Sent'),
+        ('delivered', 'Delivered'),
+        ('read', 'Read'),
+        ('undelivered', 'Undelivered'),
+        ('failed', 'Failed'),
+    ]
+    
     delivery_method = models.CharField(max_length=10, choices=DELIVERY_METHODS)
     delivered_at = models.DateTimeField(auto_now_add=True)
     was_successful = models.BooleanField(default=True)
     error_message = models.TextField(blank=True)
+    delivery_status = models.CharField(max_length=12, choices=DELIVERY_STATUSES, default='sent')
+    status_updated_at = models.DateTimeField(blank=True, null=True)
     
     class Meta:
         db_table = 'alert_logs'
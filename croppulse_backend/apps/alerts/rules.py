@@ -0,0 +1,282 @@
+"""
+Threshold rules that turn forecasts and observations into alerts
+
+Forecasts are loaded as [cell x day] arrays (one cell per forecast
+lat/lon) and every rule is evaluated across all cells at once. Triggered
+cells are rolled up to counties; one alert or advisory is created per
+rule, covering every county not already under an active one.
+"""
+import time
+from datetime import datetime, time as dt_time, timedelta
+from typing import Dict
+from django.db import transaction
+from django.utils import timezone
+from .models import Alert
+from apps.weather.models import WeatherData, WeatherForecast, WeatherAdvisory
+from apps.users.services import OutboxService, DashboardFragmentService
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# source: 'forecast' rules test daily values over the next FORECAST_DAYS,
+# requiring `days` consecutive days over threshold; 'observed' rules test
+# the sum of station readings over the last 24 hours.
+WEATHER_RULES = [
+    {
+        'code': 'heavy_rain_forecast',
+        'source': 'forecast',
+        'field': 'rainfall',
+        'threshold': 50,
+        'days': 1,
+        'creates': 'alert',
+        'alert_type': 'flood',
+        'severity': 'high',
+        'title': 'Heavy rainfall expected',
+        'message': 'Forecast rainfall of up to {value:.0f} mm in 24 hours. Risk of flooding and waterlogging.',
+        'recommendations': 'Clear drainage channels, delay fertiliser application and move stored harvest to high ground.',
+    },
+    {
+        'code': 'heavy_rain_observed',
+        'source': 'observed',
+        'field': 'rainfall',
+        'threshold': 50,
+        'creates': 'alert',
+        'alert_type': 'flood',
+        'severity': 'critical',
+        'title': 'Heavy rainfall recorded',
+        'message': 'Stations recorded {value:.0f} mm of rain in the last 24 hours. Flooding is likely.',
+        'recommendations': 'Avoid flooded fields and river crossings. Check crops and livestock once water recedes.',
+    },
+    {
+        'code': 'heat_wave',
+        'source': 'forecast',
+        'field': 'temp_max',
+        'threshold': 35,
+        'days': 3,
+        'creates': 'alert',
+        'alert_type': 'drought',
+        'severity': 'high',
+        'title': 'Heat wave expected',
+        'message': 'Maximum temperatures above 35°C (up to {value:.0f}°C) for 3 or more days.',
+        'recommendations': 'Irrigate early or late in the day, mulch to retain moisture and provide shade and water for livestock.',
+    },
+    {
+        'code': 'persistent_rain',
+        'source': 'forecast',
+        'field': 'pop',
+        'threshold': 80,
+        'days': 3,
+        'creates': 'advisory',
+        'severity': 'watch',
+        'title': 'Persistent rain expected',
+        'message': 'High chance of rain (up to {value:.0f}%) for 3 or more consecutive days.',
+        'recommendations': 'Postpone spraying and harvesting, and watch for fungal diseases.',
+    },
+]
+
+FORECAST_DAYS = 7
+FORECAST_FIELDS = ['temp_max', 'rainfall', 'pop']
+
+
+class WeatherRuleEngine:
+    """Evaluates WEATHER_RULES against the latest weather data"""
+
+    @staticmethod
+    def load_forecasts(today) -> Dict:
+        """
+        Latest forecasts as arrays shaped [cells, FORECAST_DAYS]
+
+        Returns:
+            dict: counties per cell plus one array per forecast field
+        """
+        rows = list(
+            WeatherForecast.objects
+            .filter(forecast_date__gte=today, forecast_date__lt=today + timedelta(days=FORECAST_DAYS))
+            .values_list('latitude', 'longitude', 'county', 'forecast_date', *FORECAST_FIELDS)
+        )
+        if not rows:
+            return {'counties': np.empty(0, dtype=object), 'rows': 0}
+
+        coords = np.array([(row[0], row[1]) for row in rows], dtype=float)
+        cells, cell_index = np.unique(coords, axis=0, return_inverse=True)
+        cell_index = cell_index.reshape(-1)
+        day_index = np.array([(row[3] - today).days for row in rows])
+
+        counties = np.empty(len(cells), dtype=object)
+        counties[cell_index] = [row[2] for row in rows]
+
+        data = {'counties': counties, 'rows': len(rows)}
+        for offset, field in enumerate(FORECAST_FIELDS, start=4):
+            grid = np.full((len(cells), FORECAST_DAYS), np.nan)
+            grid[cell_index, day_index] = np.array([row[offset] for row in rows], dtype=float)
+            data[field] = grid
+        return data
+
+    @staticmethod
+    def load_observations(since) -> Dict:
+        """24h totals per observed lat/lon cell"""
+        rows = list(
+            WeatherData.objects
+            .filter(recorded_at__gte=since)
+            .exclude(county='')
+            .values_list('latitude', 'longitude', 'county', 'rainfall')
+        )
+        if not rows:
+            return {'counties': np.empty(0, dtype=object), 'rows': 0}
+
+        coords = np.array([(row[0], row[1]) for row in rows], dtype=float)
+        cells, cell_index = np.unique(coords, axis=0, return_inverse=True)
+        cell_index = cell_index.reshape(-1)
+
+        counties = np.empty(len(cells), dtype=object)
+        counties[cell_index] = [row[2] for row in rows]
+        rainfall = np.bincount(
+            cell_index,
+            weights=np.array([row[3] or 0 for row in rows], dtype=float),
+            minlength=len(cells)
+        )
+        return {'counties': counties, 'rows': len(rows), 'rainfall': rainfall}
+
+    @staticmethod
+    def evaluate(rule: Dict, data: Dict) -> Dict[str, Dict]:
+        """
+        Counties where a rule fires
+
+        Returns:
+            dict: county -> {'value': worst value, 'last_day': last day over threshold}
+        """
+        if not data['rows']:
+            return {}
+
+        values = data[rule['field']]
+        over = np.nan_to_num(values, nan=-np.inf) > rule['threshold']
+
+        if rule['source'] == 'observed':
+            fired = over
+            worst = values
+            last_day = np.zeros(len(values), dtype=int)
+        else:
+            days = rule['days']
+            if days > 1:
+                windows = np.lib.stride_tricks.sliding_window_view(over, days, axis=1).all(axis=2)
+                fired = windows.any(axis=1)
+            else:
+                fired = over.any(axis=1)
+            worst = np.nanmax(np.where(over, values, np.nan), axis=1, initial=-np.inf)
+            last_day = over.shape[1] - 1 - np.argmax(over[:, ::-1], axis=1)
+
+        triggered = {}
+        for cell in np.flatnonzero(fired):
+            hit = triggered.setdefault(data['counties'][cell], {'value': -np.inf, 'last_day': 0})
+            hit['value'] = max(hit['value'], float(worst[cell]))
+            hit['last_day'] = max(hit['last_day'], int(last_day[cell]))
+        return triggered
+
+    @staticmethod
+    def covered_counties(now) -> Dict[str, set]:
+        """Counties already under an active alert/advisory, keyed by rule title"""
+        titles = [rule['title'] for rule in WEATHER_RULES]
+        covered = {title: set() for title in titles}
+
+        for title, counties in (
+            Alert.objects
+            .filter(title__in=titles, status='active', end_time__gte=now)
+            .values_list('title', 'counties')
+        ):
+            covered[title].update(counties)
+
+        for title, counties in (
+            WeatherAdvisory.objects
+            .filter(title__in=titles, is_active=True, valid_until__gte=now)
+            .values_list('title', 'counties')
+        ):
+            covered[title].update(counties)
+
+        return covered
+
+    @staticmethod
+    def run() -> Dict:
+        """
+        Evaluate every rule and create the resulting alerts and advisories
+
+        Returns:
+            dict: Rows loaded, rules fired, objects created and per-stage timings
+        """
+        started = time.perf_counter()
+        now = timezone.now()
+        today = timezone.localdate()
+
+        data = {
+            'forecast': WeatherRuleEngine.load_forecasts(today),
+            'observed': WeatherRuleEngine.load_observations(now - timedelta(hours=24)),
+        }
+        loaded = time.perf_counter()
+
+        covered = WeatherRuleEngine.covered_counties(now)
+        alerts, advisories = [], []
+        for rule in WEATHER_RULES:
+            triggered = WeatherRuleEngine.evaluate(rule, data[rule['source']])
+            new = {
+                county: hit for county, hit in triggered.items()
+                if county and county not in covered[rule['title']]
+            }
+            if not new:
+                continue
+
+            end_day = today + timedelta(days=max(hit['last_day'] for hit in new.values()) + 1)
+            fields = {
+                'title': rule['title'],
+                'message': rule['message'].format(value=max(hit['value'] for hit in new.values())),
+                'counties': sorted(new),
+                'recommendations': rule['recommendations'],
+            }
+            valid_until = timezone.make_aware(datetime.combine(end_day, dt_time.min))
+
+            if rule['creates'] == 'alert':
+                alerts.append(Alert(
+                    alert_type=rule['alert_type'],
+                    severity=rule['severity'],
+                    start_time=now,
+                    end_time=valid_until,
+                    status='active',
+                    **fields
+                ))
+            else:
+                advisories.append(WeatherAdvisory(
+                    severity=rule['severity'],
+                    valid_from=now,
+                    valid_until=valid_until,
+                    **fields
+                ))
+        evaluated = time.perf_counter()
+
+        with transaction.atomic():
+            alerts = Alert.objects.bulk_create(alerts)
+            advisories = WeatherAdvisory.objects.bulk_create(advisories)
+            for alert in alerts:
+                OutboxService.publish('alerts.alert_created', {'alert_id': alert.id})
+            for advisory in advisories:
+                OutboxService.publish('weather.advisory_created', {'advisory_id': advisory.id})
+            # bulk_create skips the signals that drop dashboard alert counts
+            counties = {county for alert in alerts for county in alert.counties}
+            transaction.on_commit(lambda: DashboardFragmentService.invalidate('alerts', counties))
+        written = time.perf_counter()
+
+        stats = {
+            'forecast_rows': data['forecast']['rows'],
+            'observed_rows': data['observed']['rows'],
+            'rules': len(WEATHER_RULES),
+            'alerts_created': len(alerts),
+            'advisories_created': len(advisories),
+            'load_ms': round((loaded - started) * 1000, 2),
+            'evaluate_ms': round((evaluated - loaded) * 1000, 2),
+            'write_ms': round((written - evaluated) * 1000, 2),
+        }
+        logger.info(
+            f'Weather rules created {stats["alerts_created"]} alerts and '
+            f'{stats["advisories_created"]} advisories in '
+            f'{round((written - started) * 1000, 2)}ms'
+        )
+        return stats
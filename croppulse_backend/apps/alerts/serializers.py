@@ -3,6 +3,7 @@ Serializers for Alerts app
 """
 from rest_framework import serializers
 from .models import Alert, AlertAcknowledgment, AlertLog
+from core.validators import validate_geofence
 
 
 class AlertSerializer(serializers.ModelSerializer):
@@ -13,7 +14,7 @@ class AlertSerializer(serializers.ModelSerializer):
         model = Alert
         fields = [
             'id', 'alert_type', 'severity', 'title', 'message', 'description',
-            'counties', 'subcounties', 'start_time', 'end_time', 'status',
+            'counties', 'subcounties', 'geofence', 'start_time', 'end_time', 'status',
             'recommendations', 'action_required', 'action_description',
             'created_by', 'created_by_name', 'recipients_count',
             'require_acknowledgment', 'acknowledgment_count',
@@ -44,3 +45,13 @@ class AlertLogSerializer(serializers.ModelSerializer):
         model = AlertLog
         fields = ['id', 'alert', 'user', 'user_name', 'delivery_method', 'delivered_at', 'was_successful', 'error_message']
         read_only_fields = ['id', 'delivered_at']
+
+
+class AudiencePreviewSerializer(serializers.Serializer):
+    counties = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+    geofence = serializers.JSONField(required=False, default=dict, validators=[validate_geofence])
+
+
+class DeliveryReceiptSerializer(serializers.Serializer):
+    """Push receipt reported by the mobile app"""
+    status = serializers.ChoiceField(choices=['delivered', 'read'])
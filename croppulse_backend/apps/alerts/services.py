@@ -1,11 +1,22 @@
 """
 Business logic services for Alerts app
 """
-from django.db.models import Q
-from typing import List
-from .models import Alert, AlertLog
-from apps.users.models import User
-from apps.users.services import UserService
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Q, F, Count, Exists, OuterRef
+from django.utils import timezone
+from typing import Dict, List, Optional
+from .models import Alert, AlertAcknowledgment, AlertLog
+from apps.users.models import User, OutboundSMS
+from apps.users.services import (
+    UserService, SMSOutboxService, FarmLocationIndex, AudienceSegmentService
+)
+from core.utils import chunk_list
+from services.notifications import notification_service
+from services.message_catalog import message_catalog
 from services.weather_api import weather_api
 import logging
 
@@ -15,6 +26,50 @@ logger = logging.getLogger(__name__)
 class AlertService:
     """Service class for alert-related operations"""
     
+    @staticmethod
+    def handle_alert_created(payload: dict):
+        """Outbox handler: fan out a newly created alert"""
+        alert = Alert.objects.filter(id=payload['alert_id']).first()
+        if alert is None:
+            logger.warning(f'Alert {payload["alert_id"]} no longer exists; skipping send')
+            return
+        AlertService.send_alert(alert)
+    
+    @staticmethod
+    def resolve_audience(counties: List[str], geofence: Optional[Dict] = None):
+        """
+        Users an alert targets: farms inside the geofence if one is set,
+        otherwise everyone in the affected counties
+        
+        Returns:
+            list: Active recipient users
+        """
+        if geofence:
+            user_ids = FarmLocationIndex.get().within_geofence(geofence)
+            return AudienceSegmentService.load_users(user_ids, is_active=True)
+        
+        return AudienceSegmentService.load_users(AudienceSegmentService.resolve(counties=counties), is_active=True)
+    
+    @staticmethod
+    def preview_audience(counties: List[str], geofence: Optional[Dict] = None) -> Dict:
+        """
+        Count an alert's recipients without sending anything
+        
+        Returns:
+            dict: Recipient count, targeting mode and resolution time
+        """
+        started = time.perf_counter()
+        if geofence:
+            count = len(FarmLocationIndex.get().within_geofence(geofence))
+        else:
+            count = len(AudienceSegmentService.resolve(counties=counties))
+        
+        return {
+            'count': count,
+            'targeting': 'geofence' if geofence else 'counties',
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+        }
+    
     @staticmethod
     def send_alert(alert: Alert) -> int:
         """
@@ -26,18 +81,18 @@ class AlertService:
         Returns:
             int: Number of users notified
         """
-        # Get users in affected counties
-        users = User.objects.filter(
-            county__in=alert.counties,
-            is_active=True
+        users = AlertService.resolve_audience(alert.counties, alert.geofence)
+        messages = message_catalog.render_all(
+            'alert', {user.language for user in users},
+            title=alert.title, message=alert.message
         )
         
         # Determine delivery methods based on severity
         send_sms = alert.severity in ['high', 'critical']
         
         # Send notifications
-        count = UserService.bulk_create_notifications(
-            users=list(users),
+        notifications = UserService.deliver_notifications(
+            users=users,
             notification_type='alert',
             title=alert.title,
             message=alert.message,
@@ -50,8 +105,18 @@ class AlertService:
                 'action_required': alert.action_required
             },
             send_push=True,
-            send_sms=send_sms
+            send_sms=send_sms,
+            # County topics would reach farms outside a geofence
+            push_topics=None if alert.geofence else [
+                notification_service.topic_name('county', county)
+                for county in alert.counties
+            ],
+            related_object_type='alert',
+            related_object_id=alert.id,
+            messages=messages
         )
+        count = len(notifications)
+        AlertService.log_deliveries(alert, notifications)
         
         # Update recipients count
         alert.recipients_count = count
@@ -60,6 +125,197 @@ class AlertService:
         logger.info(f'Sent alert "{alert.title}" to {count} users')
         return count
     
+    @staticmethod
+    def log_deliveries(alert: Alert, notifications: List) -> int:
+        """
+        Record one AlertLog row per recipient and channel. Every recipient
+        gets a push row (unsuccessful if nothing was pushed) so the log is
+        a complete recipient list for acknowledgment tracking.
+        
+        Returns:
+            int: Number of log rows written
+        """
+        logs = []
+        for notification in notifications:
+            pushed = notification.sent_via_push or notification.digest_pending
+            if notification.digest_pending:
+                push_status = 'queued'
+            else:
+                push_status = 'sent' if pushed else 'failed'
+            logs.append(AlertLog(
+                alert=alert,
+                user_id=notification.user_id,
+                delivery_method='push',
+                was_successful=pushed,
+                error_message='' if pushed else 'No push delivery',
+                delivery_status=push_status,
+            ))
+            if getattr(notification, 'sms_queued', False):
+                # Queued in the SMS outbox; Twilio status callbacks move it on
+                logs.append(AlertLog(
+                    alert=alert,
+                    user_id=notification.user_id,
+                    delivery_method='sms',
+                    delivery_status='queued',
+                ))
+        
+        AlertLog.objects.bulk_create(logs, batch_size=1000)
+        return len(logs)
+    
+    @staticmethod
+    def acknowledge(alert: Alert, user, notes: str = '') -> bool:
+        """
+        Record a user's acknowledgment. The alert's counter is not touched
+        here; the increment is buffered in the cache and flushed in batches
+        so concurrent acks don't contend on the alert row.
+        
+        Returns:
+            bool: True if this is a new acknowledgment
+        """
+        try:
+            with transaction.atomic():
+                AlertAcknowledgment.objects.create(alert=alert, user=user, notes=notes)
+        except IntegrityError:
+            return False
+        
+        key = AlertService._ack_delta_key(alert.id)
+        cache.add(key, 0, settings.ALERT_ACK_BUFFER_TIMEOUT)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, settings.ALERT_ACK_BUFFER_TIMEOUT)
+        # Keep the buffer alive as long as acks keep coming, however long the alert runs
+        cache.touch(key, settings.ALERT_ACK_BUFFER_TIMEOUT)
+        return True
+    
+    @staticmethod
+    def _ack_delta_key(alert_id: int) -> str:
+        return f'alerts:ack_delta:{alert_id}'
+    
+    @staticmethod
+    def flush_acknowledgment_counts() -> int:
+        """
+        Apply buffered acknowledgment increments with one F() update per
+        distinct delta. Each delta is claimed by decrementing it before the
+        update, so acks arriving mid-flush are kept for the next run and a
+        failure part-way through never applies a delta twice.
+        
+        Returns:
+            int: Acknowledgments applied
+        """
+        since = timezone.now() - timedelta(seconds=settings.ALERT_ACK_BUFFER_TIMEOUT)
+        alert_ids = Alert.objects.filter(end_time__gte=since).values_list('id', flat=True)
+        keys = {AlertService._ack_delta_key(alert_id): alert_id for alert_id in alert_ids}
+        
+        by_delta = {}
+        for key, delta in cache.get_many(list(keys)).items():
+            if delta <= 0:
+                continue
+            try:
+                cache.decr(key, delta)
+            except ValueError:
+                # Expired since the read; nothing left to claim
+                continue
+            by_delta.setdefault(delta, []).append(keys[key])
+        
+        applied = 0
+        for delta, ids in by_delta.items():
+            Alert.objects.filter(id__in=ids).update(
+                acknowledgment_count=F('acknowledgment_count') + delta
+            )
+            applied += delta * len(ids)
+        
+        if applied:
+            logger.info(f'Flushed {applied} alert acknowledgments')
+        return applied
+    
+    @staticmethod
+    def escalate_unacknowledged() -> Dict:
+        """
+        Queue SMS reminders for recipients of require_acknowledgment alerts
+        who haven't acknowledged by the deadline. Recipients come from
+        AlertLog anti-joined against AlertAcknowledgment. Each alert is
+        claimed by setting escalated_at in the same transaction as its
+        reminders, so overlapping runs never queue them twice.
+        
+        Returns:
+            dict: Alerts escalated and reminders queued
+        """
+        now = timezone.now()
+        deadline = now - timedelta(minutes=settings.ALERT_ACK_DEADLINE_MINUTES)
+        alerts = Alert.objects.filter(
+            require_acknowledgment=True,
+            status='active',
+            escalated_at__isnull=True,
+            created_at__lte=deadline,
+            end_time__gte=now
+        )
+        
+        stats = {'alerts': 0, 'reminders': 0}
+        for alert in alerts:
+            with transaction.atomic():
+                # Claim the alert first so overlapping runs don't both send reminders
+                claimed = Alert.objects.filter(id=alert.id, escalated_at__isnull=True).update(escalated_at=now)
+                if not claimed:
+                    continue
+                
+                recipients = (
+                    User.objects
+                    .filter(is_active=True, receive_sms_notifications=True)
+                    .filter(Exists(AlertLog.objects.filter(alert=alert, user=OuterRef('pk'))))
+                    .filter(~Exists(AlertAcknowledgment.objects.filter(alert=alert, user=OuterRef('pk'))))
+                    .only('id', 'phone_number', 'language')
+                )
+                reminders = message_catalog.render_all(
+                    'alert_reminder', [code for code, _ in User.LANGUAGE_CHOICES], title=alert.title
+                )
+                
+                batch = []
+                for user in recipients.iterator(chunk_size=1000):
+                    reminder = reminders.get(user.language, reminders['en'])
+                    batch.append(OutboundSMS(
+                        user=user,
+                        phone_number=str(user.phone_number),
+                        message=reminder.sms,
+                        segments=reminder.sms_segments,
+                        priority=OutboundSMS.PRIORITY_ALERT,
+                        related_object_type='alert_reminder',
+                        related_object_id=alert.id,
+                    ))
+                    if len(batch) >= 1000:
+                        stats['reminders'] += SMSOutboxService.enqueue_bulk(batch)
+                        batch = []
+                stats['reminders'] += SMSOutboxService.enqueue_bulk(batch)
+            stats['alerts'] += 1
+        
+        logger.info(f'Escalated {stats["alerts"]} alerts with {stats["reminders"]} SMS reminders')
+        return stats
+    
+    @staticmethod
+    def delivery_rates(alert_ids: List[int]) -> Dict[int, Dict]:
+        """
+        Roll up delivery outcomes per alert and channel
+        
+        Returns:
+            dict: alert_id -> channel -> counts per status and delivery_rate
+        """
+        rates = {}
+        rows = (
+            AlertLog.objects.filter(alert_id__in=alert_ids)
+            .values('alert_id', 'delivery_method', 'delivery_status')
+            .annotate(count=Count('id'))
+        )
+        for row in rows:
+            channel = rates.setdefault(row['alert_id'], {}).setdefault(row['delivery_method'], {'total': 0})
+            channel[row['delivery_status']] = row['count']
+            channel['total'] += row['count']
+        
+        for channels in rates.values():
+            for channel in channels.values():
+                delivered = channel.get('delivered', 0) + channel.get('read', 0)
+                channel['delivery_rate'] = round(delivered / channel['total'], 4)
+        return rates
+    
     @staticmethod
     def check_weather_alerts():
         """
@@ -132,3 +388,189 @@ class AlertService:
             'by_type': list(by_type),
             'by_severity': list(by_severity),
         }
+
+
+class DeliveryStatusService:
+    """
+    Provider delivery callbacks (Twilio SMS status, app push receipts).
+    
+    Webhooks only append the event to a cache buffer: each event takes the
+    next number from an atomic sequence and is stored under its own key.
+    A periodic flush reads the buffer in order and applies it to AlertLog
+    with bulk_update, so a burst of callbacks costs cache writes rather
+    than one row update per request. Applying an event only ever moves a
+    log forward in STATUS_RANK, so re-applying a batch is harmless.
+    """
+    
+    SEQUENCE_KEY = 'delivery_status:seq'
+    CURSOR_KEY = 'delivery_status:cursor'
+    STALLED_KEY = 'delivery_status:stalled'
+    
+    # Twilio statuses folded onto AlertLog.DELIVERY_STATUSES
+    TWILIO_STATUSES = {
+        'accepted': 'queued',
+        'scheduled': 'queued',
+        'queued': 'queued',
+        'sending': 'queued',
+        'sent': 'sent',
+        'delivered': 'delivered',
+        'read': 'read',
+        'undelivered': 'undelivered',
+        'failed': 'failed',
+        'canceled': 'failed',
+    }
+    
+    STATUS_RANK = {
+        'queued': 0,
+        'sent': 1,
+        'delivered': 2,
+        'undelivered': 2,
+        'failed': 2,
+        'read': 3,
+    }
+    
+    @staticmethod
+    def _event_key(seq: int) -> str:
+        return f'delivery_status:event:{seq}'
+    
+    @staticmethod
+    def record(event: Dict) -> int:
+        """
+        Append a callback to the buffer
+        
+        Args:
+            event: {'channel': 'sms', 'sid', 'status', 'error'} or
+                   {'channel': 'push', 'alert_id', 'user_id', 'status'}
+        
+        Returns:
+            int: Sequence number of the event
+        """
+        cache.add(DeliveryStatusService.SEQUENCE_KEY, 0, None)
+        seq = cache.incr(DeliveryStatusService.SEQUENCE_KEY)
+        event['at'] = timezone.now().isoformat()
+        cache.set(DeliveryStatusService._event_key(seq), event, settings.DELIVERY_STATUS_BUFFER_TIMEOUT)
+        return seq
+    
+    @staticmethod
+    def record_twilio(params) -> int:
+        """Buffer a Twilio message status callback"""
+        status = DeliveryStatusService.TWILIO_STATUSES.get(params.get('MessageStatus', ''))
+        if not params.get('MessageSid') or not status:
+            return 0
+        
+        error_code = params.get('ErrorCode', '')
+        return DeliveryStatusService.record({
+            'channel': 'sms',
+            'sid': params['MessageSid'],
+            'status': status,
+            'error': f'Twilio error {error_code}' if error_code else '',
+        })
+    
+    @staticmethod
+    def flush() -> Dict:
+        """
+        Apply buffered callbacks in sequence order. The cursor stops at
+        the first missing event, since a webhook may have taken a number
+        without having stored its event yet; an event still missing on the
+        next flush is treated as lost and skipped.
+        
+        Returns:
+            dict: Events read and AlertLog rows updated
+        """
+        stats = {'events': 0, 'updated': 0}
+        head = cache.get(DeliveryStatusService.SEQUENCE_KEY, 0)
+        cursor = cache.get(DeliveryStatusService.CURSOR_KEY, 0)
+        if cursor > head:
+            cursor = 0  # Sequence was reset (e.g. cache flushed)
+        
+        while cursor < head:
+            seqs = range(cursor + 1, min(head, cursor + settings.DELIVERY_STATUS_FLUSH_BATCH) + 1)
+            keys = [DeliveryStatusService._event_key(seq) for seq in seqs]
+            found = cache.get_many(keys)
+            
+            events, last, stalled = [], cursor, False
+            for seq, key in zip(seqs, keys):
+                if key in found:
+                    events.append(found[key])
+                elif cache.get(DeliveryStatusService.STALLED_KEY) != seq:
+                    cache.set(DeliveryStatusService.STALLED_KEY, seq, settings.DELIVERY_STATUS_BUFFER_TIMEOUT)
+                    stalled = True
+                    break
+                last = seq
+            
+            stats['events'] += len(events)
+            stats['updated'] += DeliveryStatusService.apply(events)
+            cache.delete_many(keys[:last - cursor])
+            cache.set(DeliveryStatusService.CURSOR_KEY, last, None)
+            cursor = last
+            if stalled:
+                break
+        
+        if stats['events']:
+            logger.info(f'Applied {stats["events"]} delivery callbacks to {stats["updated"]} alert logs')
+        return stats
+    
+    @staticmethod
+    def apply(events: List[Dict]) -> int:
+        """
+        Write the latest status per alert log in one bulk_update
+        
+        Returns:
+            int: AlertLog rows updated
+        """
+        rank = DeliveryStatusService.STATUS_RANK
+        
+        # Latest (highest ranked) event per SMS sid
+        by_sid = {}
+        for event in events:
+            if event['channel'] == 'sms':
+                current = by_sid.get(event['sid'])
+                if current is None or rank[event['status']] >= rank[current['status']]:
+                    by_sid[event['sid']] = event
+        
+        # (alert_id, user_id, method) -> event
+        targets = {}
+        for sid, user_id, alert_id in OutboundSMS.objects.filter(
+            provider_sid__in=list(by_sid), related_object_type='alert'
+        ).values_list('provider_sid', 'user_id', 'related_object_id'):
+            targets[(alert_id, user_id, 'sms')] = by_sid[sid]
+        
+        for event in events:
+            if event['channel'] == 'push':
+                key = (event['alert_id'], event['user_id'], 'push')
+                current = targets.get(key)
+                if current is None or rank[event['status']] >= rank[current['status']]:
+                    targets[key] = event
+        
+        if not targets:
+            return 0
+        
+        now = timezone.now()
+        logs = []
+        # Match exact (alert, user, method) tuples, not the cross product of the three
+        for chunk in chunk_list(list(targets), 500):
+            match = Q()
+            for alert_id, user_id, method in chunk:
+                match |= Q(alert_id=alert_id, user_id=user_id, delivery_method=method)
+            logs.extend(
+                AlertLog.objects.filter(match)
+                .only('id', 'alert_id', 'user_id', 'delivery_method', 'delivery_status')
+            )
+        
+        changed = []
+        for log in logs:
+            event = targets.get((log.alert_id, log.user_id, log.delivery_method))
+            if event is None or rank[event['status']] < rank[log.delivery_status]:
+                continue
+            log.delivery_status = event['status']
+            log.was_successful = event['status'] not in ('undelivered', 'failed')
+            log.error_message = event.get('error', '')
+            log.status_updated_at = now
+            changed.append(log)
+        
+        AlertLog.objects.bulk_update(
+            changed,
+            ['delivery_status', 'was_successful', 'error_message', 'status_updated_at'],
+            batch_size=1000
+        )
+        return len(changed)
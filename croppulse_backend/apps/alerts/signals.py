@@ -0,0 +1,30 @@
+"""
+Signals for Alerts app
+"""
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import Alert
+
+
+@receiver(pre_save, sender=Alert)
+def capture_alert_counties(sender, instance, **kwargs):
+    """Remember the counties an alert covered before this save"""
+    instance._previous_counties = []
+    update_fields = kwargs.get('update_fields')
+    if not instance.pk or (update_fields is not None and 'counties' not in update_fields):
+        return
+
+    instance._previous_counties = (
+        Alert.objects.filter(pk=instance.pk).values_list('counties', flat=True).first() or []
+    )
+
+
+@receiver(post_save, sender=Alert)
+@receiver(post_delete, sender=Alert)
+def invalidate_dashboard_alerts(sender, instance, **kwargs):
+    """Drop the active-alert count of every county the alert covers or covered"""
+    from apps.users.services import DashboardFragmentService
+
+    counties = set(instance.counties or []) | set(getattr(instance, '_previous_counties', []))
+    transaction.on_commit(lambda: DashboardFragmentService.invalidate('alerts', counties))
@@ -2,7 +2,7 @@
 Celery tasks for Alerts app
 """
 from celery import shared_task
-from .services import AlertService
+from .services import AlertService, DeliveryStatusService
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,3 +18,28 @@ def check_weather_alerts():
     except Exception as e:
         logger.error(f'Error checking weather alerts: {str(e)}')
         return 0
+
+
+@shared_task
+def flush_acknowledgment_counts():
+    """Apply buffered alert acknowledgment counts"""
+    return AlertService.flush_acknowledgment_counts()
+
+
+@shared_task
+def flush_delivery_statuses():
+    """Apply buffered delivery status callbacks to alert logs"""
+    return DeliveryStatusService.flush()
+
+
+@shared_task
+def escalate_unacknowledged_alerts():
+    """Send SMS reminders for alerts not acknowledged by the deadline"""
+    return AlertService.escalate_unacknowledged()
+
+
+@shared_task
+def evaluate_weather_rules():
+    """Create alerts and advisories from the threshold rules"""
+    from .rules import WeatherRuleEngine
+    return WeatherRuleEngine.run()
@@ -33,3 +33,277 @@ class AlertTests(TestCase):
         self.assertEqual(alert.alert_type, 'weather')
         self.assertEqual(alert.severity, 'high')
         self.assertEqual(alert.status, 'active')
+    
+    def test_alert_fan_out_goes_through_outbox_once(self):
+        from django.db import transaction
+        from apps.users.models import Notification, OutboxEvent
+        from apps.users.services import OutboxService
+        
+        User.objects.create_user(
+            phone_number='+254712345679',
+            password='testpass123',
+            full_name='Nairobi Farmer',
+            role='farmer',
+            county='Nairobi'
+        )
+        with transaction.atomic():
+            alert = Alert.objects.create(
+                alert_type='weather',
+                severity='high',
+                title='Heavy Rain Warning',
+                message='Expect heavy rainfall in the next 24 hours',
+                counties=['Nairobi'],
+                start_time=timezone.now(),
+                end_time=timezone.now() + timedelta(days=1),
+                status='active',
+                created_by=self.user
+            )
+            event = OutboxService.publish('alerts.alert_created', {'alert_id': alert.id})
+        
+        self.assertFalse(Notification.objects.exists())
+        
+        # Celery runs eagerly in tests, so relaying also processes the batch
+        self.assertEqual(OutboxService.relay(), 1)
+        event.refresh_from_db()
+        self.assertEqual(event.status, 'done')
+        self.assertEqual(Notification.objects.filter(user__county='Nairobi').count(), 1)
+        
+        # A redelivered task does not send again
+        self.assertEqual(OutboxService.process([event.id])['skipped'], 1)
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertEqual(OutboxEvent.objects.filter(status='pending').count(), 0)
+    
+    def test_outbox_handler_rolls_back_when_its_lease_is_lost(self):
+        import uuid
+        from django.conf import settings
+        from apps.users.models import Notification, OutboxEvent
+        from apps.users.services import OutboxService
+        from .services import AlertService
+        
+        User.objects.create_user(
+            phone_number='+254712345679',
+            password='testpass123',
+            full_name='Nairobi Farmer',
+            role='farmer',
+            county='Nairobi'
+        )
+        alert = Alert.objects.create(
+            alert_type='weather',
+            severity='high',
+            title='Heavy Rain Warning',
+            message='Expect heavy rainfall in the next 24 hours',
+            counties=['Nairobi'],
+            start_time=timezone.now(),
+            end_time=timezone.now() + timedelta(days=1),
+            status='active',
+            created_by=self.user
+        )
+        event = OutboxService.publish('alerts.alert_created', {'alert_id': alert.id})
+        
+        # Another worker re-claims the event while the handler is running
+        original = AlertService.handle_alert_created
+        def overtaken(payload):
+            original(payload)
+            OutboxEvent.objects.filter(id=event.id).update(lease_token=uuid.uuid4())
+        AlertService.handle_alert_created = staticmethod(overtaken)
+        self.addCleanup(setattr, AlertService, 'handle_alert_created', staticmethod(original))
+        
+        OutboxService.relay()
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), ('processing', 1))
+        self.assertFalse(Notification.objects.exists())
+        
+        # Once the lease runs out with no attempts left, the event is parked
+        OutboxEvent.objects.filter(id=event.id).update(
+            available_at=timezone.now(), attempts=settings.OUTBOX_MAX_ATTEMPTS
+        )
+        self.assertEqual(OutboxService.relay(), 0)
+        event.refresh_from_db()
+        self.assertEqual(event.status, 'failed')
+    
+    def test_buffered_acknowledgments_and_escalation(self):
+        from unittest.mock import patch
+        from django.core.cache import cache
+        from apps.users.models import OutboundSMS
+        from .models import AlertLog
+        from .services import AlertService
+        cache.clear()
+        
+        farmers = [
+            User.objects.create_user(
+                phone_number=f'+25471000000{i}',
+                password='testpass123',
+                full_name=f'Farmer {i}',
+                role='farmer',
+                county='Nairobi'
+            )
+            for i in range(3)
+        ]
+        alert = Alert.objects.create(
+            alert_type='flood',
+            severity='critical',
+            title='Flood Warning',
+            message='Move to higher ground',
+            counties=['Nairobi'],
+            start_time=timezone.now(),
+            end_time=timezone.now() + timedelta(days=1),
+            require_acknowledgment=True,
+            created_by=self.user
+        )
+        AlertLog.objects.bulk_create([
+            AlertLog(alert=alert, user=farmer, delivery_method='push') for farmer in farmers
+        ])
+        
+        self.assertTrue(AlertService.acknowledge(alert, farmers[0]))
+        self.assertFalse(AlertService.acknowledge(alert, farmers[0]))
+        self.assertTrue(AlertService.acknowledge(alert, farmers[1]))
+        
+        self.assertEqual(AlertService.flush_acknowledgment_counts(), 2)
+        self.assertEqual(AlertService.flush_acknowledgment_counts(), 0)
+        # A buffer that expires between the read and the claim is skipped
+        with patch.object(cache, 'get_many', return_value={AlertService._ack_delta_key(alert.id): 5}):
+            cache.delete(AlertService._ack_delta_key(alert.id))
+            self.assertEqual(AlertService.flush_acknowledgment_counts(), 0)
+        alert.refresh_from_db()
+        self.assertEqual(alert.acknowledgment_count, 2)
+        
+        Alert.objects.filter(id=alert.id).update(created_at=timezone.now() - timedelta(hours=3))
+        stats = AlertService.escalate_unacknowledged()
+        
+        self.assertEqual(stats, {'alerts': 1, 'reminders': 1})
+        self.assertEqual(
+            list(OutboundSMS.objects.values_list('phone_number', flat=True)),
+            [str(farmers[2].phone_number)]
+        )
+        # Each alert is escalated once
+        self.assertEqual(AlertService.escalate_unacknowledged()['alerts'], 0)
+    
+    def test_geofenced_audience_uses_farm_coordinates(self):
+        from django.core.cache import cache
+        from apps.users.models import FarmerProfile
+        from .services import AlertService
+        cache.clear()
+        
+        # Two farms near Nakuru town, one ~30 km away
+        for i, (lat, lon) in enumerate([(-0.303, 36.080), (-0.310, 36.090), (-0.050, 36.300)]):
+            farmer = User.objects.create_user(
+                phone_number=f'+25472000000{i}',
+                password='testpass123',
+                full_name=f'Nakuru Farmer {i}',
+                role='farmer',
+                county='Nakuru'
+            )
+            FarmerProfile.objects.filter(user=farmer).update(latitude=lat, longitude=lon)
+        
+        circle = {'type': 'circle', 'center': [-0.303, 36.080], 'radius_km': 5}
+        square = {'type': 'polygon', 'coordinates': [[-0.4, 36.0], [-0.4, 36.2], [-0.2, 36.2], [-0.2, 36.0]]}
+        
+        self.assertEqual(AlertService.preview_audience([], circle)['count'], 2)
+        self.assertEqual(AlertService.preview_audience([], square)['count'], 2)
+        self.assertEqual(AlertService.preview_audience(['Nakuru'])['count'], 3)
+        self.assertEqual(
+            {user.full_name for user in AlertService.resolve_audience([], circle)},
+            {'Nakuru Farmer 0', 'Nakuru Farmer 1'}
+        )
+    
+    def test_weather_rules_create_alerts_once(self):
+        from apps.users.models import OutboxEvent
+        from apps.weather.models import WeatherForecast, WeatherAdvisory
+        from .rules import WeatherRuleEngine
+        
+        today = timezone.localdate()
+        forecasts = []
+        for day in range(4):
+            # Kisumu: 60 mm on day 1 and 3 rainy days; Nakuru: hot for 3 days
+            forecasts.append(WeatherForecast(
+                latitude=-0.1, longitude=34.75, county='Kisumu',
+                forecast_date=today + timedelta(days=day),
+                temp_min=18, temp_max=29, humidity=80, wind_speed=3,
+                rainfall=60 if day == 1 else 10, pop=90 if day < 3 else 20,
+                condition='Rain', description='rain'
+            ))
+            forecasts.append(WeatherForecast(
+                latitude=-0.3, longitude=36.08, county='Nakuru',
+                forecast_date=today + timedelta(days=day),
+                temp_min=20, temp_max=37 if day < 3 else 30, humidity=30, wind_speed=3,
+                rainfall=0, pop=5, condition='Clear', description='clear sky'
+            ))
+        WeatherForecast.objects.bulk_create(forecasts)
+        
+        stats = WeatherRuleEngine.run()
+        
+        self.assertEqual((stats['alerts_created'], stats['advisories_created']), (2, 1))
+        self.assertEqual(Alert.objects.get(title='Heavy rainfall expected').counties, ['Kisumu'])
+        self.assertEqual(Alert.objects.get(title='Heat wave expected').counties, ['Nakuru'])
+        self.assertEqual(WeatherAdvisory.objects.get().counties, ['Kisumu'])
+        self.assertEqual(OutboxEvent.objects.count(), 3)
+        
+        # Counties already alerted are not alerted again
+        stats = WeatherRuleEngine.run()
+        self.assertEqual((stats['alerts_created'], stats['advisories_created']), (0, 0))
+    
+    def test_delivery_callbacks_are_buffered_and_applied_in_bulk(self):
+        from django.core.cache import cache
+        from django.test import override_settings
+        from rest_framework.test import APIClient
+        from twilio.request_validator import RequestValidator
+        from apps.users.models import OutboundSMS
+        from .models import AlertLog
+        from .services import AlertService, DeliveryStatusService
+        
+        cache.clear()
+        alert = Alert.objects.create(
+            alert_type='weather',
+            severity='high',
+            title='Heavy Rain Warning',
+            message='Expect heavy rainfall in the next 24 hours',
+            counties=['Nairobi'],
+            start_time=timezone.now(),
+            end_time=timezone.now() + timedelta(days=1),
+            created_by=self.user
+        )
+        AlertLog.objects.create(alert=alert, user=self.user, delivery_method='sms', delivery_status='queued')
+        AlertLog.objects.create(alert=alert, user=self.user, delivery_method='push')
+        OutboundSMS.objects.create(
+            user=self.user, phone_number='+254712345678', message='Alert', status='sent',
+            provider_sid='SM123', related_object_type='alert', related_object_id=alert.id
+        )
+        
+        url = 'https://api.croppulse.test/api/v1/alerts/webhooks/twilio/status/'
+        params = {'MessageSid': 'SM123', 'MessageStatus': 'delivered'}
+        with override_settings(TWILIO_AUTH_TOKEN='secret', TWILIO_STATUS_CALLBACK_URL=url):
+            signature = RequestValidator('secret').compute_signature(url, params)
+            response = self.client.post('/api/v1/alerts/webhooks/twilio/status/', params, HTTP_X_TWILIO_SIGNATURE=signature)
+            self.assertEqual(response.status_code, 204)
+            
+            forged = self.client.post('/api/v1/alerts/webhooks/twilio/status/', params, HTTP_X_TWILIO_SIGNATURE='bad')
+            self.assertEqual(forged.status_code, 403)
+        
+        # A late 'sent' callback must not roll the log back
+        DeliveryStatusService.record_twilio({'MessageSid': 'SM123', 'MessageStatus': 'sent'})
+        client = APIClient()
+        client.force_authenticate(self.user)
+        receipt = f'/api/v1/alerts/alerts/{alert.id}/delivery_receipt/'
+        self.assertEqual(client.post(receipt, {'status': 'read'}).status_code, 202)
+        self.assertEqual(AlertLog.objects.filter(delivery_status='sent').count(), 1)
+        
+        # Only alerts that were pushed to the caller take receipts
+        other = Alert.objects.create(
+            alert_type='weather', severity='low', title='Dry spell', message='Dry spell',
+            counties=['Nairobi'], start_time=timezone.now(), end_time=timezone.now() + timedelta(days=1),
+            created_by=self.user
+        )
+        AlertLog.objects.create(alert=other, user=self.user, delivery_method='sms', delivery_status='queued')
+        self.assertEqual(client.post(f'/api/v1/alerts/alerts/{other.id}/delivery_receipt/', {'status': 'read'}).status_code, 404)
+        self.assertEqual(client.post('/api/v1/alerts/alerts/abc/delivery_receipt/', {'status': 'read'}).status_code, 404)
+        
+        self.assertEqual(DeliveryStatusService.flush(), {'events': 3, 'updated': 2})
+        self.assertEqual(DeliveryStatusService.flush(), {'events': 0, 'updated': 0})
+        
+        statuses = dict(AlertLog.objects.filter(alert=alert).values_list('delivery_method', 'delivery_status'))
+        self.assertEqual(statuses, {'sms': 'delivered', 'push': 'read'})
+        self.assertEqual(AlertLog.objects.get(alert=other).delivery_status, 'queued')
+        
+        rates = AlertService.delivery_rates([alert.id])[alert.id]
+        self.assertEqual(rates['sms']['delivery_rate'], 1.0)
+        self.assertEqual(rates['push']['read'], 1)
@@ -3,11 +3,12 @@ URL patterns for Alerts app
 """
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import AlertViewSet
+from .views import AlertViewSet, twilio_status_callback
 
 router = DefaultRouter()
 router.register(r'alerts', AlertViewSet, basename='alert')
 
 urlpatterns = [
+    path('webhooks/twilio/status/', twilio_status_callback, name='twilio-status-callback'),
     path('', include(router.urls)),
 ]
@@ -2,13 +2,20 @@
 Views for Alerts app
 """
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from django.conf import settings
 from django.utils import timezone
-from .models import Alert, AlertAcknowledgment
-from .serializers import AlertSerializer, AlertAcknowledgmentSerializer
-from .services import AlertService
+from django.db import transaction
+from twilio.request_validator import RequestValidator
+from .models import Alert, AlertLog
+from .serializers import (
+    AlertSerializer, AlertAcknowledgmentSerializer, AudiencePreviewSerializer,
+    DeliveryReceiptSerializer
+)
+from .services import AlertService, DeliveryStatusService
+from apps.users.services import OutboxService
 from core.permissions import IsHQAnalyst
 from core.pagination import StandardResultsSetPagination
 
@@ -38,9 +45,10 @@ class AlertViewSet(viewsets.ModelViewSet):
         return queryset
     
     def perform_create(self, serializer):
-        alert = serializer.save(created_by=self.request.user)
-        # Send alert to users
-        AlertService.send_alert(alert)
+        with transaction.atomic():
+            alert = serializer.save(created_by=self.request.user)
+            # Send alert to users once the alert is committed
+            OutboxService.publish('alerts.alert_created', {'alert_id': alert.id})
     
     @action(detail=False, methods=['get'])
     def active(self, request):
@@ -65,22 +73,49 @@ class AlertViewSet(viewsets.ModelViewSet):
         alert = self.get_object()
         notes = request.data.get('notes', '')
         
-        acknowledgment, created = AlertAcknowledgment.objects.get_or_create(
-            alert=alert,
-            user=request.user,
-            defaults={'notes': notes}
-        )
-        
-        if created:
-            # Update acknowledgment count
-            alert.acknowledgment_count += 1
-            alert.save(update_fields=['acknowledgment_count'])
+        created = AlertService.acknowledge(alert, request.user, notes)
         
         return Response({
             'message': 'Alert acknowledged',
             'already_acknowledged': not created
         })
     
+    @action(detail=True, methods=['post'])
+    def delivery_receipt(self, request, pk=None):
+        """
+        Report that the alert's push reached (or was opened on) this
+        device. FCM has no server-side delivery callback, so the app
+        reports receipts itself; they are buffered like Twilio callbacks.
+        """
+        alert = self.get_object()
+        if not AlertLog.objects.filter(alert=alert, user=request.user, delivery_method='push').exists():
+            return Response(
+                {'error': 'This alert was not pushed to you'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        serializer = DeliveryReceiptSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        DeliveryStatusService.record({
+            'channel': 'push',
+            'alert_id': alert.id,
+            'user_id': request.user.id,
+            'status': serializer.validated_data['status'],
+        })
+        return Response(status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsHQAnalyst])
+    def preview_audience(self, request):
+        """Count the recipients a draft alert would reach"""
+        serializer = AudiencePreviewSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        return Response(AlertService.preview_audience(
+            serializer.validated_data['counties'],
+            serializer.validated_data['geofence']
+        ))
+    
     @action(detail=True, methods=['post'], permission_classes=[IsHQAnalyst])
     def cancel(self, request, pk=None):
         """Cancel an alert"""
@@ -89,3 +124,23 @@ class AlertViewSet(viewsets.ModelViewSet):
         alert.save(update_fields=['status'])
         
         return Response({'message': 'Alert cancelled'})
+
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def twilio_status_callback(request):
+    """
+    Twilio message status webhook. The signature is checked against the
+    configured callback URL, then the event is buffered for the batched
+    AlertLog update; nothing is written to the database here.
+    """
+    validator = RequestValidator(settings.TWILIO_AUTH_TOKEN)
+    url = settings.TWILIO_STATUS_CALLBACK_URL or request.build_absolute_uri()
+    signature = request.headers.get('X-Twilio-Signature', '')
+    
+    if not settings.TWILIO_AUTH_TOKEN or not validator.validate(url, request.POST, signature):
+        return Response({'error': 'Invalid signature'}, status=status.HTTP_403_FORBIDDEN)
+    
+    DeliveryStatusService.record_twilio(request.POST)
+    return Response(status=status.HTTP_204_NO_CONTENT)
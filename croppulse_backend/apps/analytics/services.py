@@ -208,6 +208,38 @@ class AnalyticsService:
             'county': county
         }
     
+    @staticmethod
+    def get_alert_delivery_statistics(county: str = None, days: int = 30) -> Dict:
+        """
+        Get per-alert delivery rates from provider callbacks
+        
+        Args:
+            county: Optional county filter
+            days: Number of days to analyze
+            
+        Returns:
+            dict: Delivery rates per alert and channel
+        """
+        from apps.alerts.services import AlertService
+        
+        start_date = timezone.now() - timedelta(days=days)
+        
+        query = Q(created_at__gte=start_date)
+        if county:
+            query &= Q(counties__contains=[county])
+        
+        alerts = list(Alert.objects.filter(query).values('id', 'title', 'severity', 'created_at'))
+        rates = AlertService.delivery_rates([alert['id'] for alert in alerts])
+        
+        for alert in alerts:
+            alert['delivery'] = rates.get(alert['id'], {})
+        
+        return {
+            'period_days': days,
+            'alerts': alerts,
+            'county': county
+        }
+    
     @staticmethod
     def get_community_statistics(days: int = 30) -> Dict:
         """
@@ -236,6 +268,21 @@ class AnalyticsService:
             'active_users': active_users,
         }
     
+    @staticmethod
+    def get_sms_statistics(minutes: int = 15) -> Dict:
+        """
+        Get SMS outbox throughput statistics
+        
+        Args:
+            minutes: Number of most recent minutes to report
+            
+        Returns:
+            dict: SMS throughput and queue depth
+        """
+        from apps.users.services import SMSOutboxService
+        
+        return SMSOutboxService.get_metrics(minutes)
+    
     @staticmethod
     def get_comprehensive_dashboard(county: str = None, days: int = 30) -> Dict:
         """
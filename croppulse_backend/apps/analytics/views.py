@@ -62,9 +62,24 @@ class AnalyticsViewSet(viewsets.GenericViewSet):
         data = AnalyticsService.get_alert_statistics(county, days)
         return Response(data)
     
+    @action(detail=False, methods=['get'])
+    def alert_delivery(self, request):
+        """Get per-alert delivery rates"""
+        county = request.query_params.get('county')
+        days = int(request.query_params.get('days', 30))
+        data = AnalyticsService.get_alert_delivery_statistics(county, days)
+        return Response(data)
+    
     @action(detail=False, methods=['get'])
     def community(self, request):
         """Get community statistics"""
         days = int(request.query_params.get('days', 30))
         data = AnalyticsService.get_community_statistics(days)
         return Response(data)
+    
+    @action(detail=False, methods=['get'])
+    def sms(self, request):
+        """Get SMS delivery throughput"""
+        minutes = int(request.query_params.get('minutes', 15))
+        data = AnalyticsService.get_sms_statistics(minutes)
+        return Response(data)
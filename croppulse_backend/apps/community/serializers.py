@@ -2,6 +2,7 @@
 Serializers for Community app
 """
 from rest_framework import serializers
+from core.fields import ImageVariantsField
 from .models import (
     ForumCategory, ForumPost, ForumReply,
     DirectMessage, KnowledgeArticle, Like
@@ -36,12 +37,13 @@ class ForumPostSerializer(serializers.ModelSerializer):
     author_name = serializers.CharField(source='author.full_name', read_only=True)
     category_name = serializers.CharField(source='category.name', read_only=True)
     replies = ForumReplySerializer(many=True, read_only=True)
+    image_urls = ImageVariantsField(source='image')
     
     class Meta:
         model = ForumPost
         fields = [
             'id', 'category', 'category_name', 'author', 'author_name',
-            'title', 'content', 'image', 'tags', 'views_count',
+            'title', 'content', 'image', 'image_urls', 'tags', 'views_count',
             'likes_count', 'replies_count', 'is_pinned', 'is_locked',
             'is_approved', 'replies', 'created_at', 'updated_at'
         ]
@@ -67,12 +69,13 @@ class DirectMessageSerializer(serializers.ModelSerializer):
 
 class KnowledgeArticleSerializer(serializers.ModelSerializer):
     author_name = serializers.CharField(source='author.full_name', read_only=True)
+    featured_image_urls = ImageVariantsField(source='featured_image')
     
     class Meta:
         model = KnowledgeArticle
         fields = [
             'id', 'category', 'author', 'author_name', 'title', 'summary',
-            'content', 'featured_image', 'tags', 'views_count', 'likes_count',
+            'content', 'featured_image', 'featured_image_urls', 'tags', 'views_count', 'likes_count',
             'is_published', 'published_at', 'created_at', 'updated_at'
         ]
         read_only_fields = [
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ObservationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.observations'
+    
+    def ready(self):
+        import apps.observations.signals  # noqa
@@ -1,20 +1,103 @@
 """
 Serializers for Observations app
 """
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
+from core.fields import ImageVariantsField
+from apps.users.models import UploadSession
 from .models import FarmObservation, CropReport, PestDiseaseReport
+from .services import OfflineSyncService
 
 
-class FarmObservationSerializer(serializers.ModelSerializer):
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'kind', 'filename', 'content_type', 'direct', 'length', 'offset',
+            'status', 'checksum', 'error', 'created_at', 'expires_at'
+        ]
+        read_only_fields = fields
+
+
+class UploadIntentSerializer(serializers.Serializer):
+    kind = serializers.ChoiceField(choices=UploadSession.KIND_CHOICES)
+    filename = serializers.CharField(max_length=255)
+    content_type = serializers.CharField(max_length=100, required=False, default='')
+    length = serializers.IntegerField(min_value=1)
+    checksum = serializers.CharField(max_length=64, required=False, default='', help_text='SHA-256 hex digest')
+
+
+class UploadReferenceMixin:
+    """
+    Lets a serializer take media by completed upload session ID (see
+    UploadSessionViewSet) instead of a multipart file.
+    
+    upload_fields maps each <field>_upload input to the model file field it
+    fills and the kind of upload it accepts.
+    """
+    
+    upload_fields = {}
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        for name in self.upload_fields:
+            fields[name] = serializers.UUIDField(write_only=True, required=False)
+        return fields
+    
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        self._uploads = []
+        for name, (field, kind) in self.upload_fields.items():
+            upload_id = attrs.pop(name, None)
+            if upload_id is None:
+                continue
+            session = UploadSession.objects.filter(
+                id=upload_id, user=self.context['request'].user, kind=kind, status='complete'
+            ).first()
+            if session is None:
+                raise serializers.ValidationError({name: f'No completed {kind} upload with this ID'})
+            attrs[field] = session.file_path
+            self._uploads.append(session.id)
+        return attrs
+    
+    def _attach_uploads(self):
+        attached = UploadSession.objects.filter(id__in=self._uploads, status='complete').update(status='attached')
+        if attached != len(self._uploads):
+            raise serializers.ValidationError('An upload was already attached to another record')
+    
+    def create(self, validated_data):
+        with transaction.atomic():
+            self._attach_uploads()
+            return super().create(validated_data)
+    
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            self._attach_uploads()
+            return super().update(instance, validated_data)
+
+
+class FarmObservationSerializer(UploadReferenceMixin, serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.full_name', read_only=True)
     verified_by_name = serializers.CharField(source='verified_by.full_name', read_only=True)
+    image1_urls = ImageVariantsField(source='image1')
+    image2_urls = ImageVariantsField(source='image2')
+    image3_urls = ImageVariantsField(source='image3')
+    
+    upload_fields = {
+        'image1_upload': ('image1', 'image'),
+        'image2_upload': ('image2', 'image'),
+        'image3_upload': ('image3', 'image'),
+        'audio_note_upload': ('audio_note', 'audio'),
+    }
     
     class Meta:
         model = FarmObservation
         fields = [
             'id', 'user', 'user_name', 'observation_type', 'title', 'description',
             'latitude', 'longitude', 'county', 'location_description',
-            'image1', 'image2', 'image3', 'audio_note', 'temperature', 'rainfall',
+            'image1', 'image2', 'image3', 'image1_urls', 'image2_urls', 'image3_urls',
+            'audio_note', 'temperature', 'rainfall',
             'status', 'verified_by', 'verified_by_name', 'verified_at',
             'verification_notes', 'quality_score', 'is_public', 'views_count',
             'created_at', 'updated_at'
@@ -24,28 +107,51 @@ class FarmObservationSerializer(serializers.ModelSerializer):
 
 class CropReportSerializer(serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.full_name', read_only=True)
+    crop_image_urls = ImageVariantsField(source='crop_image')
     
     class Meta:
         model = CropReport
         fields = [
             'id', 'user', 'user_name', 'crop_type', 'variety', 'area_planted',
             'planting_date', 'current_stage', 'health_status', 'notes',
-            'challenges', 'crop_image', 'expected_harvest_date', 'expected_yield',
+            'challenges', 'crop_image', 'crop_image_urls', 'expected_harvest_date', 'expected_yield',
             'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'user', 'created_at', 'updated_at']
 
 
-class PestDiseaseReportSerializer(serializers.ModelSerializer):
+class PestDiseaseReportSerializer(UploadReferenceMixin, serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.full_name', read_only=True)
+    image1_urls = ImageVariantsField(source='image1')
+    image2_urls = ImageVariantsField(source='image2')
+    
+    upload_fields = {
+        'image1_upload': ('image1', 'image'),
+        'image2_upload': ('image2', 'image'),
+    }
     
     class Meta:
         model = PestDiseaseReport
         fields = [
             'id', 'user', 'user_name', 'name', 'pest_or_disease', 'affected_crop',
             'severity', 'symptoms', 'affected_area', 'latitude', 'longitude',
-            'county', 'image1', 'image2', 'control_measures_taken',
+            'county', 'image1', 'image2', 'image1_urls', 'image2_urls', 'control_measures_taken',
             'requires_assistance', 'is_resolved', 'resolved_at',
             'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'user', 'resolved_at', 'created_at', 'updated_at']
+
+
+class SyncItemSerializer(serializers.Serializer):
+    idempotency_key = serializers.CharField(max_length=64)
+    type = serializers.ChoiceField(choices=list(OfflineSyncService.RECORD_TYPES))
+    data = serializers.DictField()
+
+
+class SyncBatchSerializer(serializers.Serializer):
+    items = serializers.ListField(child=SyncItemSerializer(), allow_empty=False)
+    
+    def validate_items(self, items):
+        if len(items) > settings.SYNC_MAX_BATCH_ITEMS:
+            raise serializers.ValidationError(f'A batch can hold at most {settings.SYNC_MAX_BATCH_ITEMS} items')
+        return items
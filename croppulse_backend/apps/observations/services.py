@@ -1,11 +1,28 @@
 """
 Business logic services for Observations app
 """
+import hashlib
+import tempfile
+from datetime import date, datetime, time, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
 from django.db.models import Q, Count
-from typing import Dict, List
+from django.utils import timezone
+from django.utils.text import slugify
+from typing import Dict, List, Optional, Tuple
 from .models import FarmObservation, CropReport, PestDiseaseReport
-from apps.users.models import User
-from apps.users.services import UserService
+from apps.users.models import User, UploadSession, SyncReceipt
+from apps.users.services import UserService, AudienceSegmentService, OutboxService
+from services.message_catalog import message_catalog
+from core.utils import get_upload_path
+from services.storage import storage_service
+from services.images import IMAGE_FIELDS, ImageDerivativeService
+from core.validators import validate_image_file, validate_audio_file
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,6 +31,15 @@ logger = logging.getLogger(__name__)
 class ObservationService:
     """Service class for observation-related operations"""
     
+    @staticmethod
+    def handle_pest_report_created(payload: dict):
+        """Outbox handler: notify officers about a severe pest/disease report"""
+        report = PestDiseaseReport.objects.filter(id=payload['report_id']).first()
+        if report is None:
+            logger.warning(f'Pest/disease report {payload["report_id"]} no longer exists')
+            return
+        ObservationService.notify_pest_disease_alert(report)
+    
     @staticmethod
     def calculate_quality_score(observation: FarmObservation) -> int:
         """
@@ -62,24 +88,26 @@ class ObservationService:
             report: PestDiseaseReport instance
         """
         # Get field officers and HQ analysts in the area
-        users = User.objects.filter(
-            Q(role='field_officer') | Q(role='hq_analyst'),
-            county=report.county,
-            is_active=True
+        user_ids = AudienceSegmentService.resolve(
+            counties=[report.county],
+            roles=['field_officer', 'hq_analyst']
         )
-        
-        title = f'Pest/Disease Alert: {report.name}'
-        message = (
-            f'{report.pest_or_disease.capitalize()} outbreak reported on {report.affected_crop}. '
-            f'Severity: {report.severity}. Location: {report.county}. '
-            f'Affected area: {report.affected_area}ha.'
+        users = AudienceSegmentService.load_users(user_ids, is_active=True)
+        messages = message_catalog.render_all(
+            'pest_disease_alert', {user.language for user in users},
+            name=report.name,
+            kind=report.pest_or_disease.capitalize(),
+            crop=report.affected_crop,
+            severity=report.severity,
+            county=report.county,
+            area=report.affected_area
         )
         
         UserService.bulk_create_notifications(
-            users=list(users),
+            users=users,
             notification_type='alert',
-            title=title,
-            message=message,
+            title=messages['en'].title,
+            message=messages['en'].message,
             priority='high',
             data={
                 'report_id': report.id,
@@ -87,10 +115,11 @@ class ObservationService:
                 'severity': report.severity
             },
             send_push=True,
-            send_sms=report.severity == 'severe'
+            send_sms=report.severity == 'severe',
+            messages=messages
         )
         
-        logger.info(f'Sent pest/disease alert notifications to {users.count()} users')
+        logger.info(f'Sent pest/disease alert notifications to {len(users)} users')
     
     @staticmethod
     def get_observation_statistics(county: str = None) -> Dict:
@@ -147,3 +176,711 @@ class ObservationService:
         )
         
         return list(hotspots)
+
+
+class ObservationCounterService:
+    """
+    Observation counts per status and county, and per creation day (all
+    counties and per county), kept in the cache for the field officer
+    dashboard. Signals adjust the counters already cached when an
+    observation is created, changes status or county, or is deleted; a
+    missing counter is seeded from the DB on read and every counter is
+    reconciled nightly.
+    """
+    
+    STATUSES = [status for status, _ in FarmObservation.STATUS_CHOICES]
+    COUNTIES_KEY = 'observations:counties'
+    
+    @staticmethod
+    def _status_key(status: str, county: str) -> str:
+        return f'observations:status:{status}:{slugify(county)}'
+    
+    @staticmethod
+    def _created_key(day: date, county: Optional[str] = None) -> str:
+        key = f'observations:created:{day.isoformat()}'
+        return f'{key}:{slugify(county)}' if county is not None else key
+    
+    @staticmethod
+    def _day_range(day: date) -> Tuple[datetime, datetime]:
+        """Start and end of a local day; a range the created_at index can serve"""
+        start = timezone.make_aware(datetime.combine(day, time.min))
+        return start, start + timedelta(days=1)
+    
+    @staticmethod
+    def state(observation: FarmObservation) -> Tuple[str, str, date]:
+        """What an observation contributes to the counters"""
+        return observation.status, observation.county, timezone.localdate(observation.created_at)
+    
+    @staticmethod
+    def status_count(status: str, counties: List[str]) -> int:
+        """
+        Observations in a status across counties. Missing counters are
+        seeded from one query grouped by county and folded onto the same
+        slugified keys the signals adjust, so 'Trans Nzoia' and
+        'trans-nzoia' rows land on one counter.
+        """
+        keys = {ObservationCounterService._status_key(status, county) for county in counties}
+        cached = cache.get_many(list(keys))
+        
+        missing = keys - set(cached)
+        if missing:
+            seeded = dict.fromkeys(missing, 0)
+            for county, count in (
+                FarmObservation.objects
+                .filter(status=status)
+                .values('county')
+                .annotate(count=Count('id'))
+                .values_list('county', 'count')
+            ):
+                key = ObservationCounterService._status_key(status, county)
+                if key in seeded:
+                    seeded[key] += count
+            for key, count in seeded.items():
+                cache.add(key, count, settings.OBSERVATION_COUNTER_TIMEOUT)
+            cached.update(seeded)
+        
+        return sum(max(count, 0) for count in cached.values())
+    
+    @staticmethod
+    def created_on(day: date, county: Optional[str] = None) -> int:
+        """Observations created on a local day, in one county or all of them"""
+        key = ObservationCounterService._created_key(day, county)
+        count = cache.get(key)
+        if count is None:
+            start, end = ObservationCounterService._day_range(day)
+            queryset = FarmObservation.objects.filter(created_at__gte=start, created_at__lt=end)
+            if county is None:
+                count = queryset.count()
+            else:
+                # Fold counties the way the keys do
+                count = sum(
+                    rows for name, rows in queryset.values('county').annotate(rows=Count('id')).values_list('county', 'rows')
+                    if slugify(name) == slugify(county)
+                )
+            cache.add(key, count, settings.OBSERVATION_COUNTER_TIMEOUT)
+        return max(count, 0)
+    
+    @staticmethod
+    def apply_change(before: Optional[Tuple], after: Optional[Tuple]):
+        """
+        Move an observation's contribution from one state to another.
+        Only counters already in the cache are adjusted; missing ones are
+        seeded from the DB on their next read.
+        
+        Args:
+            before: state() before the write, or None for a new observation
+            after: state() after the write, or None for a deleted one
+        """
+        ObservationCounterService.apply_changes([(before, after)])
+    
+    @staticmethod
+    def apply_changes(changes: List[Tuple[Optional[Tuple], Optional[Tuple]]]):
+        """
+        apply_change for many observations at once, with one cache read
+        and one increment per counter touched
+        
+        Args:
+            changes: (before, after) state pairs, as for apply_change
+        """
+        deltas = {}
+        for before, after in changes:
+            for state, delta in ((before, -1), (after, 1)):
+                if state is None:
+                    continue
+                status, county, day = state
+                for key in (
+                    ObservationCounterService._status_key(status, county),
+                    ObservationCounterService._created_key(day),
+                    ObservationCounterService._created_key(day, county),
+                ):
+                    deltas[key] = deltas.get(key, 0) + delta
+        
+        for key in cache.get_many([key for key, delta in deltas.items() if delta]):
+            try:
+                cache.incr(key, deltas[key])
+            except ValueError:
+                pass  # Expired between get_many and incr
+    
+    @staticmethod
+    def reconcile(days: int = 2) -> int:
+        """
+        Overwrite the status counters of every county, and the creation
+        counters of the last `days` days, with fresh counts from the DB.
+        Counties seen by the previous run that no longer have any
+        observations are written as zero.
+        
+        Returns:
+            int: Number of counters written
+        """
+        rows = list(
+            FarmObservation.objects
+            .values('status', 'county')
+            .annotate(count=Count('id'))
+            .values_list('status', 'county', 'count')
+        )
+        current = {county for _, county, _ in rows}
+        counties = current | set(cache.get(ObservationCounterService.COUNTIES_KEY, []))
+        
+        counters = {}
+        for county in counties:
+            for status in ObservationCounterService.STATUSES:
+                counters[ObservationCounterService._status_key(status, county)] = 0
+        for status, county, count in rows:
+            counters[ObservationCounterService._status_key(status, county)] += count
+        
+        today = timezone.localdate()
+        for offset in range(days):
+            day = today - timedelta(days=offset)
+            start, end = ObservationCounterService._day_range(day)
+            counters[ObservationCounterService._created_key(day)] = 0
+            for county in counties:
+                counters[ObservationCounterService._created_key(day, county)] = 0
+            for county, count in (
+                FarmObservation.objects
+                .filter(created_at__gte=start, created_at__lt=end)
+                .values('county')
+                .annotate(count=Count('id'))
+                .values_list('county', 'count')
+            ):
+                counters[ObservationCounterService._created_key(day)] += count
+                counters[ObservationCounterService._created_key(day, county)] += count
+        
+        cache.set_many(counters, settings.OBSERVATION_COUNTER_TIMEOUT)
+        cache.set(ObservationCounterService.COUNTIES_KEY, sorted(current), None)
+        logger.info(f'Reconciled {len(counters)} observation counters')
+        return len(counters)
+
+
+class UploadOffsetMismatch(ValueError):
+    """A chunk was sent for an offset other than the one the upload is at"""
+    
+    def __init__(self, expected: int):
+        super().__init__(f'Upload is at offset {expected}')
+        self.expected = expected
+
+
+class UploadGone(ValueError):
+    """The upload expired or no longer accepts chunks"""
+
+
+class UploadSessionService:
+    """
+    Resumable and direct-to-S3 uploads for observation media
+
+    Each chunk is saved to storage as its own object under the session's
+    staging prefix, so any web worker can take the next chunk and nothing
+    is held in memory between requests. When the last byte arrives the
+    session is handed to a Celery task that streams the chunks into the
+    final file, validating as it goes.
+    
+    Direct uploads skip the app servers on the way in: the client POSTs
+    the file to a presigned S3 form for a private quarantine key, with the
+    Content-Type pinned by the server from the file's extension, then
+    finalizes. A task verifies the object and writes the bytes it verified
+    to the final key under the usual upload prefix, which the form cannot
+    reach, so nothing uploaded after verification is ever served.
+    """
+    
+    MAX_LENGTH = {
+        'image': 10 * 1024 * 1024,
+        'audio': 5 * 1024 * 1024,
+    }
+    
+    FOLDERS = {
+        'image': 'observations',
+        'audio': 'audio_observations',
+    }
+    
+    # Content-Type a direct upload must declare, by kind and extension
+    CONTENT_TYPES = {
+        'image': {'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'},
+        'audio': {'mp3': 'audio/mpeg', 'wav': 'audio/wav', 'ogg': 'audio/ogg', 'm4a': 'audio/mp4'},
+    }
+    
+    @staticmethod
+    def _staging_dir(session: UploadSession) -> str:
+        return f'uploads/staging/{session.id}'
+    
+    @staticmethod
+    def _quarantine_path(session: UploadSession) -> str:
+        return f'uploads/quarantine/{session.id}'
+    
+    @staticmethod
+    def _chunk_path(session: UploadSession, offset: int) -> str:
+        # Zero padded so listing order is offset order
+        return f'{UploadSessionService._staging_dir(session)}/{offset:012d}'
+    
+    @staticmethod
+    def create(user: User, kind: str, filename: str, length: int, content_type: str = '') -> UploadSession:
+        """
+        Open an upload session
+        
+        Args:
+            user: Uploader
+            kind: 'image' or 'audio'
+            filename: Original file name
+            length: Total size in bytes
+            content_type: MIME type reported by the client
+            
+        Returns:
+            UploadSession
+        
+        Raises:
+            ValueError: Unknown kind or file too large
+        """
+        if kind not in UploadSessionService.MAX_LENGTH:
+            raise ValueError(f'Unknown upload kind: {kind}')
+        if not 0 < length <= UploadSessionService.MAX_LENGTH[kind]:
+            raise ValueError(
+                f'{kind.title()} uploads must be between 1 byte and '
+                f'{UploadSessionService.MAX_LENGTH[kind] // (1024 * 1024)}MB'
+            )
+        
+        return UploadSession.objects.create(
+            user=user,
+            kind=kind,
+            filename=filename[:255] or kind,
+            content_type=content_type[:100],
+            length=length,
+            expires_at=timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL_SECONDS),
+        )
+    
+    @staticmethod
+    def append(session_id, user: User, offset: int, data: bytes) -> UploadSession:
+        """
+        Stage one chunk. Chunks must arrive in order: a client that lost
+        its connection asks for the current offset and resumes from there.
+        
+        Raises:
+            UploadSession.DoesNotExist: Not this user's upload
+            UploadOffsetMismatch: offset is not the session's current offset
+            UploadGone: Session expired, failed or already complete
+            ValueError: Chunk runs past the declared length
+        """
+        with transaction.atomic():
+            # The row lock serialises retries of the same chunk
+            session = UploadSession.objects.select_for_update().get(id=session_id, user=user)
+            if session.status != 'uploading' or session.expires_at <= timezone.now():
+                raise UploadGone(f'Upload is {session.get_status_display().lower()}')
+            if session.direct:
+                raise UploadGone('Direct uploads are sent to object storage, not in chunks')
+            if offset != session.offset:
+                raise UploadOffsetMismatch(session.offset)
+            if offset + len(data) > session.length:
+                raise ValueError('Chunk runs past the declared upload length')
+            if not data:
+                return session
+            
+            path = UploadSessionService._chunk_path(session, offset)
+            if default_storage.exists(path):
+                # Left over from an attempt whose offset update never committed
+                default_storage.delete(path)
+            default_storage.save(path, ContentFile(data))
+            
+            session.offset = offset + len(data)
+            update_fields = ['offset', 'updated_at']
+            if session.offset == session.length:
+                session.status = 'assembling'
+                update_fields.append('status')
+                
+                from .tasks import assemble_upload
+                transaction.on_commit(lambda: assemble_upload.delay(str(session.id)))
+            session.save(update_fields=update_fields)
+        
+        return session
+    
+    @staticmethod
+    def _chunks(session: UploadSession) -> List[str]:
+        _, files = default_storage.listdir(UploadSessionService._staging_dir(session))
+        return [f'{UploadSessionService._staging_dir(session)}/{name}' for name in sorted(files)]
+    
+    @staticmethod
+    def _discard_chunks(session: UploadSession):
+        try:
+            for path in UploadSessionService._chunks(session):
+                default_storage.delete(path)
+        except FileNotFoundError:
+            pass
+    
+    @staticmethod
+    def _spool(session: UploadSession, paths: List[str], out) -> str:
+        """
+        Stream stored objects, in order, into out while hashing them
+
+        Returns:
+            str: SHA-256 hex digest of everything read
+        
+        Raises:
+            ValueError: Gaps between chunks or the wrong total size
+        """
+        digest = hashlib.sha256()
+        received = 0
+        for path in paths:
+            if not session.direct and not path.endswith(f'{received:012d}'):
+                raise ValueError(f'Missing chunk at offset {received}')
+            with default_storage.open(path, 'rb') as source:
+                for block in source.chunks():
+                    digest.update(block)
+                    out.write(block)
+                    received += len(block)
+        if received != session.length:
+            raise ValueError(f'Received {received} of {session.length} bytes')
+        
+        out.seek(0)
+        return digest.hexdigest()
+    
+    @staticmethod
+    def _validate(session: UploadSession, file):
+        """Run the image or audio validator; raises ValidationError"""
+        upload = File(file, name=session.filename)
+        if session.kind == 'image':
+            validate_image_file(upload)
+        else:
+            validate_audio_file(upload)
+        file.seek(0)
+    
+    @staticmethod
+    def _fail(session: UploadSession, error: Exception) -> UploadSession:
+        message = '; '.join(error.messages) if isinstance(error, ValidationError) else str(error)
+        session.status = 'failed'
+        session.error = message
+        session.save(update_fields=['status', 'error', 'updated_at'])
+        logger.warning(f'Upload {session.id} failed: {message}')
+        return session
+    
+    @staticmethod
+    def assemble(session_id) -> UploadSession:
+        """
+        Stream the staged chunks into the final file, hashing and checking
+        sizes on the way, then validate it as an image or audio file
+        
+        Returns:
+            UploadSession: complete, or failed with the reason in error
+        """
+        session = UploadSession.objects.get(id=session_id)
+        if session.status != 'assembling':
+            return session
+        
+        try:
+            with tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE) as assembled:
+                checksum = UploadSessionService._spool(session, UploadSessionService._chunks(session), assembled)
+                UploadSessionService._validate(session, assembled)
+                
+                path = get_upload_path(None, session.filename, UploadSessionService.FOLDERS[session.kind])
+                session.file_path = default_storage.save(path, File(assembled, name=session.filename))
+        except (ValueError, ValidationError, OSError) as e:
+            UploadSessionService._discard_chunks(session)
+            return UploadSessionService._fail(session, e)
+        
+        session.checksum = checksum
+        session.status = 'complete'
+        session.save(update_fields=['file_path', 'checksum', 'status', 'updated_at'])
+        UploadSessionService._discard_chunks(session)
+        logger.info(f'Assembled upload {session.id} ({session.length} bytes) into {session.file_path}')
+        return session
+    
+    @staticmethod
+    def create_direct(
+        user: User,
+        kind: str,
+        filename: str,
+        length: int,
+        content_type: str = '',
+        checksum: str = ''
+    ) -> tuple:
+        """
+        Open a session for an upload that goes straight to S3
+        
+        Args:
+            content_type: Ignored; the type is derived from the filename
+            checksum: SHA-256 hex digest the client will upload, checked on finalize
+        
+        Returns:
+            tuple: (UploadSession, presigned POST dict)
+        
+        Raises:
+            ValueError: Bad kind, size, extension or checksum, or storage is not S3
+        """
+        if checksum and (len(checksum) != 64 or set(checksum.lower()) - set('0123456789abcdef')):
+            raise ValueError('checksum must be a SHA-256 hex digest')
+        if not storage_service.use_s3:
+            raise ValueError('Direct uploads need S3 storage; use the resumable upload endpoint')
+        
+        extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+        pinned_type = UploadSessionService.CONTENT_TYPES.get(kind, {}).get(extension)
+        if kind in UploadSessionService.CONTENT_TYPES and pinned_type is None:
+            allowed = ', '.join(UploadSessionService.CONTENT_TYPES[kind])
+            raise ValueError(f'{kind.title()} uploads must be one of: {allowed}')
+        
+        with transaction.atomic():
+            session = UploadSessionService.create(user, kind, filename, length, content_type=pinned_type)
+            session.direct = True
+            session.checksum = checksum.lower()
+            session.file_path = get_upload_path(None, session.filename, UploadSessionService.FOLDERS[kind])
+            session.save(update_fields=['direct', 'checksum', 'file_path', 'updated_at'])
+            
+            presigned = storage_service.generate_presigned_post(
+                UploadSessionService._quarantine_path(session), length,
+                content_type=pinned_type,
+                expiration=settings.UPLOAD_PRESIGNED_EXPIRY_SECONDS,
+                acl='private'
+            )
+            if presigned is None:
+                raise ValueError('Could not sign the upload; try the resumable upload endpoint')
+        
+        return session, presigned
+    
+    @staticmethod
+    def finalize(session_id, user: User) -> UploadSession:
+        """
+        Mark a direct upload as sent and queue its verification
+        
+        Raises:
+            UploadSession.DoesNotExist: Not this user's direct upload
+            UploadGone: Expired or already finalized
+        """
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(id=session_id, user=user, direct=True)
+            if session.status != 'uploading' or session.expires_at <= timezone.now():
+                raise UploadGone(f'Upload is {session.get_status_display().lower()}')
+            
+            session.status = 'verifying'
+            session.save(update_fields=['status', 'updated_at'])
+            
+            from .tasks import verify_upload
+            transaction.on_commit(lambda: verify_upload.delay(str(session.id)))
+        
+        return session
+    
+    @staticmethod
+    def verify(session_id) -> UploadSession:
+        """
+        Check a directly uploaded object before anything may reference it:
+        exact size, the declared SHA-256 if there was one, then the image or
+        audio validator (magic bytes and decoding). The bytes that passed
+        are written to the final key from the local copy, never re-read
+        from the quarantine key, and the quarantined object is deleted
+        either way.
+        
+        Returns:
+            UploadSession: complete, or failed with the reason in error
+        """
+        session = UploadSession.objects.get(id=session_id)
+        if session.status != 'verifying':
+            return session
+        
+        quarantine = UploadSessionService._quarantine_path(session)
+        try:
+            size = storage_service.get_file_size(quarantine)
+            if size is None:
+                raise ValueError('Nothing was uploaded')
+            if size != session.length:
+                raise ValueError(f'Uploaded {size} bytes, expected {session.length}')
+            
+            with tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE) as uploaded:
+                checksum = UploadSessionService._spool(session, [quarantine], uploaded)
+                if session.checksum and checksum != session.checksum:
+                    raise ValueError('SHA-256 of the uploaded object does not match')
+                UploadSessionService._validate(session, uploaded)
+                session.file_path = default_storage.save(session.file_path, File(uploaded))
+        except (ValueError, ValidationError, OSError) as e:
+            return UploadSessionService._fail(session, e)
+        finally:
+            storage_service.delete_file(quarantine)
+        
+        session.checksum = checksum
+        session.status = 'complete'
+        session.save(update_fields=['checksum', 'file_path', 'status', 'updated_at'])
+        logger.info(f'Verified direct upload {session.id} at {session.file_path}')
+        return session
+    
+    @staticmethod
+    def cleanup_expired() -> int:
+        """
+        Delete sessions past their expiry. Files of sessions never attached
+        to an observation go with them, as do any staged chunks.
+        
+        Returns:
+            int: Sessions deleted
+        """
+        count = 0
+        for session in UploadSession.objects.filter(expires_at__lte=timezone.now()).iterator():
+            if session.status != 'attached':
+                UploadSessionService._discard_chunks(session)
+                if session.file_path:
+                    default_storage.delete(session.file_path)
+                if session.direct:
+                    default_storage.delete(UploadSessionService._quarantine_path(session))
+            session.delete()
+            count += 1
+        
+        logger.info(f'Removed {count} expired upload sessions')
+        return count
+
+
+class OfflineSyncService:
+    """
+    Batch submission of records collected offline
+
+    Every item carries an idempotency key generated on the device. Keys
+    already stored in SyncReceipt are answered with the record they
+    created, so retrying a batch after a dropped response is safe. The
+    rest are validated with the same serializers as the single-record
+    endpoints and inserted with one bulk_create per record type, together
+    with their receipts, in a single transaction. Counter updates and
+    image resizing are queued once for the batch.
+    """
+    
+    RECORD_TYPES = {
+        'farm_observation': (FarmObservation, 'FarmObservationSerializer'),
+        'crop_report': (CropReport, 'CropReportSerializer'),
+        'pest_disease_report': (PestDiseaseReport, 'PestDiseaseReportSerializer'),
+    }
+    
+    @staticmethod
+    def sync(user: User, items: List[Dict], request=None) -> List[Dict]:
+        """
+        Create the records of a sync batch
+        
+        Args:
+            user: Owner of every record
+            items: [{'idempotency_key': str, 'type': key of RECORD_TYPES, 'data': dict}]
+            request: Passed to the serializers as context
+            
+        Returns:
+            list: One result per item, in order, with status 'created',
+                  'duplicate' (key seen before), 'invalid' (with errors) or
+                  'conflict' (lost a race with another request; safe to resend)
+        """
+        try:
+            results = OfflineSyncService._sync(user, items, request)
+        except IntegrityError:
+            # A concurrent retry of the same batch stored some keys (or took an
+            # upload) first; this pass answers those items from their receipts
+            try:
+                results = OfflineSyncService._sync(user, items, request)
+            except IntegrityError:
+                results = OfflineSyncService._sync_each(user, items, request)
+        
+        # Repeats of a key within the batch share the first item's result
+        first = {}
+        for index, item in enumerate(items):
+            key = item['idempotency_key']
+            if key in first:
+                results[index] = dict(results[first[key]])
+                if results[index]['status'] == 'created':
+                    results[index]['status'] = 'duplicate'
+            else:
+                first[key] = index
+            results[index] = {**results[index], 'index': index, 'idempotency_key': key}
+        
+        created = sum(result['status'] == 'created' for result in results)
+        logger.info(f'Synced {created} of {len(items)} offline records for user {user.id}')
+        return results
+    
+    @staticmethod
+    def _sync_each(user: User, items: List[Dict], request) -> List[Optional[Dict]]:
+        """
+        Sync items one at a time, so a race that keeps repeating only
+        fails the items it involves
+        """
+        results, seen = [None] * len(items), set()
+        for index, item in enumerate(items):
+            if item['idempotency_key'] in seen:
+                continue
+            seen.add(item['idempotency_key'])
+            
+            try:
+                results[index] = OfflineSyncService._sync(user, [item], request)[0]
+            except IntegrityError as e:
+                logger.warning(f'Offline sync item {item["idempotency_key"]} conflicted: {str(e)}')
+                results[index] = {
+                    'type': item['type'], 'status': 'conflict',
+                    'errors': {'non_field_errors': ['Another request changed this record; send it again']},
+                }
+        return results
+    
+    @staticmethod
+    def _sync(user: User, items: List[Dict], request) -> List[Optional[Dict]]:
+        from . import serializers
+        
+        results = [None] * len(items)
+        keys = {item['idempotency_key'] for item in items}
+        receipts = {
+            receipt.idempotency_key: receipt
+            for receipt in SyncReceipt.objects.filter(user=user, idempotency_key__in=keys)
+        }
+        
+        pending = {record_type: [] for record_type in OfflineSyncService.RECORD_TYPES}
+        uploads, seen = {}, set()
+        for index, item in enumerate(items):
+            key = item['idempotency_key']
+            if key in seen:
+                continue
+            seen.add(key)
+            
+            receipt = receipts.get(key)
+            if receipt is not None:
+                results[index] = {'type': receipt.record_type, 'status': 'duplicate', 'id': receipt.record_id}
+                continue
+            
+            model, serializer_name = OfflineSyncService.RECORD_TYPES[item['type']]
+            serializer = getattr(serializers, serializer_name)(data=item['data'], context={'request': request})
+            if not serializer.is_valid():
+                results[index] = {'type': item['type'], 'status': 'invalid', 'errors': serializer.errors}
+                continue
+            
+            item_uploads = getattr(serializer, '_uploads', [])
+            if set(item_uploads) & set(uploads):
+                results[index] = {
+                    'type': item['type'], 'status': 'invalid',
+                    'errors': {'non_field_errors': ['An upload is used by another item in this batch']},
+                }
+                continue
+            uploads.update(dict.fromkeys(item_uploads, index))
+            pending[item['type']].append((index, model(user=user, **serializer.validated_data)))
+        
+        if not any(pending.values()):
+            return results
+        
+        with transaction.atomic():
+            if uploads:
+                attached = UploadSession.objects.filter(
+                    id__in=list(uploads), status='complete'
+                ).update(status='attached')
+                if attached != len(uploads):
+                    raise IntegrityError('An upload was attached by another request')
+            
+            # bulk_create sends no signals, so the counter and image work
+            # the post_save receivers do is done here once for the batch
+            new_receipts, severe_reports, counter_changes, images = [], [], [], []
+            for record_type, entries in pending.items():
+                if not entries:
+                    continue
+                model = OfflineSyncService.RECORD_TYPES[record_type][0]
+                records = model.objects.bulk_create([record for _, record in entries])
+                fields = IMAGE_FIELDS.get(model._meta.label, [])
+                
+                for (index, _), record in zip(entries, records):
+                    results[index] = {'type': record_type, 'status': 'created', 'id': record.id}
+                    new_receipts.append(SyncReceipt(
+                        user=user,
+                        idempotency_key=items[index]['idempotency_key'],
+                        record_type=record_type,
+                        record_id=record.id,
+                    ))
+                    if model is FarmObservation:
+                        counter_changes.append((None, ObservationCounterService.state(record)))
+                    images.extend(getattr(record, field).name for field in fields if getattr(record, field))
+                    
+                    if model is PestDiseaseReport and (record.severity in ['high', 'severe'] or record.requires_assistance):
+                        severe_reports.append({'report_id': record.id})
+            
+            SyncReceipt.objects.bulk_create(new_receipts)
+            OutboxService.publish_many('observations.pest_report_created', severe_reports)
+            
+            if counter_changes:
+                transaction.on_commit(lambda: ObservationCounterService.apply_changes(counter_changes))
+            ImageDerivativeService.queue(images)
+        
+        return results
@@ -0,0 +1,47 @@
+"""
+Signals for Observations app
+"""
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import FarmObservation
+
+
+@receiver(pre_save, sender=FarmObservation)
+def capture_observation_state(sender, instance, **kwargs):
+    """Remember the observation's counted state before this save"""
+    from .services import ObservationCounterService
+
+    instance._previous_state = None
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not {'status', 'county'} & set(update_fields):
+        instance._previous_state = False  # Nothing counted changes
+        return
+
+    if instance.pk:
+        previous = FarmObservation.objects.filter(pk=instance.pk).only('status', 'county', 'created_at').first()
+        if previous:
+            instance._previous_state = ObservationCounterService.state(previous)
+
+
+@receiver(post_save, sender=FarmObservation)
+def update_observation_counters(sender, instance, **kwargs):
+    """Adjust the cached counters once the save commits"""
+    from .services import ObservationCounterService
+
+    before = getattr(instance, '_previous_state', None)
+    if before is False:
+        return
+
+    after = ObservationCounterService.state(instance)
+    if before != after:
+        transaction.on_commit(lambda: ObservationCounterService.apply_change(before, after))
+
+
+@receiver(post_delete, sender=FarmObservation)
+def remove_observation_from_counters(sender, instance, **kwargs):
+    """A deleted observation no longer counts"""
+    from .services import ObservationCounterService
+
+    before = ObservationCounterService.state(instance)
+    transaction.on_commit(lambda: ObservationCounterService.apply_change(before, None))
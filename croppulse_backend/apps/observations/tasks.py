@@ -0,0 +1,29 @@
+"""
+Celery tasks for Observations app
+"""
+from celery import shared_task
+from .services import ObservationCounterService, UploadSessionService
+
+
+@shared_task
+def reconcile_observation_counters():
+    """Correct drift in the cached field officer dashboard counters"""
+    return ObservationCounterService.reconcile(days=2)
+
+
+@shared_task
+def assemble_upload(session_id):
+    """Join and validate the chunks of a finished resumable upload"""
+    return UploadSessionService.assemble(session_id).status
+
+
+@shared_task
+def cleanup_upload_sessions():
+    """Drop expired upload sessions and their staged chunks"""
+    return UploadSessionService.cleanup_expired()
+
+
+@shared_task
+def verify_upload(session_id):
+    """Check a finalized direct-to-S3 upload before it can be attached"""
+    return UploadSessionService.verify(session_id).status
@@ -3,7 +3,7 @@ Tests for Observations app
 """
 from django.test import TestCase
 from django.utils import timezone
-from apps.users.models import User
+from apps.users.models import User, UploadSession
 from .models import FarmObservation, CropReport, PestDiseaseReport
 
 
@@ -30,3 +30,363 @@ class FarmObservationTests(TestCase):
         
         self.assertEqual(observation.status, 'pending')
         self.assertEqual(observation.observation_type, 'weather')
+
+
+class ObservationCounterTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.farmer = User.objects.create_user(
+            phone_number='+254712345679',
+            password='testpass123',
+            full_name='Counter Farmer',
+            role='farmer'
+        )
+        self.officer = User.objects.create_user(
+            phone_number='+254712345680',
+            password='testpass123',
+            full_name='Counter Officer',
+            role='field_officer',
+            county='Nakuru'
+        )
+    
+    def tearDown(self):
+        from django.core.cache import cache
+        cache.clear()
+    
+    def observe(self, county):
+        with self.captureOnCommitCallbacks(execute=True):
+            return FarmObservation.objects.create(
+                user=self.farmer,
+                observation_type='crop_health',
+                title='Leaf spots',
+                description='Spots on maize leaves',
+                latitude=-0.3,
+                longitude=36.07,
+                county=county
+            )
+    
+    def test_dashboard_reads_counters_maintained_on_write(self):
+        from apps.users.services import UserService
+        from .services import ObservationCounterService
+        
+        self.observe('Nakuru')
+        self.observe('Kisumu')
+        # Seeds the counters from the DB
+        data = UserService.get_field_officer_dashboard_data(self.officer)
+        self.assertEqual(data['pending_verifications'], 1)
+        self.assertEqual(data['observations_today'], 2)
+        
+        observation = self.observe('Nakuru')
+        removed = self.observe('Nakuru')
+        with self.captureOnCommitCallbacks(execute=True):
+            removed.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            observation.status = 'verified'
+            observation.save()
+        
+        with self.assertNumQueries(0):
+            self.assertEqual(ObservationCounterService.status_count('pending', ['Nakuru']), 1)
+            self.assertEqual(ObservationCounterService.created_on(timezone.localdate()), 3)
+        
+        # Drift is corrected by the nightly reconcile
+        FarmObservation.objects.filter(pk=observation.pk).update(status='pending')
+        ObservationCounterService.reconcile()
+        self.assertEqual(ObservationCounterService.status_count('pending', ['Nakuru']), 2)
+        self.assertEqual(ObservationCounterService.status_count('verified', ['Nakuru']), 0)
+    
+    def test_counters_fold_county_spelling_and_zero_emptied_counties(self):
+        from .services import ObservationCounterService
+        
+        self.observe('Trans Nzoia')
+        self.observe('trans-nzoia')
+        self.assertEqual(ObservationCounterService.status_count('pending', ['Trans Nzoia']), 2)
+        self.assertEqual(ObservationCounterService.created_on(timezone.localdate(), 'TRANS NZOIA'), 2)
+        
+        ObservationCounterService.reconcile()
+        # Deleted without their commit hooks running, so only reconcile can notice
+        FarmObservation.objects.all().delete()
+        ObservationCounterService.reconcile()
+        
+        self.assertEqual(ObservationCounterService.status_count('pending', ['Trans Nzoia']), 0)
+        self.assertEqual(ObservationCounterService.created_on(timezone.localdate(), 'Trans Nzoia'), 0)
+
+
+class ResumableUploadTests(TestCase):
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        from rest_framework.test import APIClient
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media.name, UPLOAD_CHUNK_MAX_SIZE=4096)
+        self.settings_override.enable()
+        self.farmer = User.objects.create_user(
+            phone_number='+254712345681',
+            password='testpass123',
+            full_name='Upload Farmer',
+            role='farmer'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.farmer)
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+    
+    def image_bytes(self):
+        import io
+        import os
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.frombytes('RGB', (64, 64), os.urandom(64 * 64 * 3)).save(buffer, 'PNG')
+        return buffer.getvalue()
+    
+    def patch(self, session_id, offset, chunk):
+        return self.client.generic(
+            'PATCH', f'/api/v1/observations/uploads/{session_id}/', chunk,
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+        )
+    
+    def test_resumed_upload_is_assembled_and_attached_once(self):
+        import base64
+        from django.core.files.storage import default_storage
+        
+        content = self.image_bytes()
+        response = self.client.post(
+            '/api/v1/observations/uploads/',
+            HTTP_UPLOAD_LENGTH=str(len(content)),
+            HTTP_UPLOAD_METADATA=f'filename {base64.b64encode(b"leaf.png").decode()},filetype {base64.b64encode(b"image/png").decode()}',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['Tus-Resumable'], '1.0.0')
+        session_id = response.data['id']
+        
+        self.assertEqual(self.patch(session_id, 0, content[:4096]).status_code, 204)
+        # A retried chunk whose response was lost is refused with the offset to resume from
+        retry = self.patch(session_id, 0, content[:4096])
+        self.assertEqual(retry.status_code, 409)
+        self.assertEqual(retry['Upload-Offset'], '4096')
+        self.assertEqual(self.client.head(f'/api/v1/observations/uploads/{session_id}/')['Upload-Offset'], '4096')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            for offset in range(4096, len(content), 4096):
+                self.assertEqual(self.patch(session_id, offset, content[offset:offset + 4096]).status_code, 204)
+        
+        session = self.client.get(f'/api/v1/observations/uploads/{session_id}/').data
+        self.assertEqual(session['status'], 'complete')
+        
+        observation = {
+            'observation_type': 'crop_health',
+            'title': 'Leaf spots',
+            'description': 'Spots on maize leaves',
+            'latitude': '-0.300000',
+            'longitude': '36.070000',
+            'county': 'Nakuru',
+            'image1_upload': session_id,
+        }
+        response = self.client.post('/api/v1/observations/farm-observations/', observation, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        saved = FarmObservation.objects.get(id=response.data['id'])
+        with default_storage.open(saved.image1.name, 'rb') as handle:
+            self.assertEqual(handle.read(), content)
+        
+        response = self.client.post('/api/v1/observations/farm-observations/', observation, format='json')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_invalid_file_fails_assembly(self):
+        from .services import UploadSessionService
+        
+        session = UploadSessionService.create(self.farmer, 'image', 'leaf.png', 10)
+        with self.captureOnCommitCallbacks(execute=True):
+            UploadSessionService.append(session.id, self.farmer, 0, b'not an img')
+        
+        session.refresh_from_db()
+        self.assertEqual(session.status, 'failed')
+        self.assertIn('Invalid image file', session.error)
+
+
+class DirectUploadTests(TestCase):
+    """Direct-to-S3 uploads, signed for a local S3 stand-in"""
+    
+    def setUp(self):
+        import tempfile
+        import boto3
+        from unittest.mock import patch
+        from django.test import override_settings
+        from rest_framework.test import APIClient
+        from services.storage import storage_service
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings_override.enable()
+        
+        client = boto3.client(
+            's3', endpoint_url='http://localhost:9000', region_name='us-east-1',
+            aws_access_key_id='minio', aws_secret_access_key='minio-secret'
+        )
+        self.patches = [
+            patch.object(storage_service, 'use_s3', True),
+            patch.object(storage_service, 's3_client', client, create=True),
+            patch.object(storage_service, 'bucket_name', 'croppulse-test', create=True),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+        
+        self.farmer = User.objects.create_user(
+            phone_number='+254712345682',
+            password='testpass123',
+            full_name='Direct Farmer',
+            role='farmer'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.farmer)
+        self.content = ResumableUploadTests.image_bytes(self)
+    
+    def tearDown(self):
+        for patcher in self.patches:
+            patcher.stop()
+        self.settings_override.disable()
+        self.media.cleanup()
+    
+    def intent(self, checksum):
+        return self.client.post('/api/v1/observations/uploads/intent/', {
+            'kind': 'image',
+            'filename': 'leaf.png',
+            'content_type': 'image/png',
+            'length': len(self.content),
+            'checksum': checksum,
+        }, format='json')
+    
+    def test_presigned_upload_is_verified_on_finalize(self):
+        import hashlib
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        
+        response = self.intent(hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(response.status_code, 201, response.data)
+        key = response.data['fields']['key']
+        self.assertTrue(key.startswith('uploads/quarantine/'))
+        self.assertEqual(response.data['fields']['acl'], 'private')
+        self.assertEqual(response.data['fields']['Content-Type'], 'image/png')
+        self.assertEqual(response.data['url'], 'http://localhost:9000/croppulse-test')
+        
+        # What the client's POST to the bucket leaves behind
+        default_storage.save(key, ContentFile(self.content))
+        upload_url = f'/api/v1/observations/uploads/{response.data["upload"]["id"]}/'
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'{upload_url}finalize/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'verifying')
+        self.assertEqual(self.client.get(upload_url).data['status'], 'complete')
+        
+        # Only the verified copy is left, at the final key
+        session = UploadSession.objects.get(id=response.data['id'])
+        self.assertFalse(default_storage.exists(key))
+        self.assertTrue(session.file_path.startswith('observations/'))
+        with default_storage.open(session.file_path) as stored:
+            self.assertEqual(stored.read(), self.content)
+    
+    def test_intent_rejects_unlisted_extensions(self):
+        response = self.client.post('/api/v1/observations/uploads/intent/', {
+            'kind': 'image',
+            'filename': 'leaf.html',
+            'content_type': 'image/png',
+            'length': len(self.content),
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_tampered_object_is_rejected_and_deleted(self):
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        
+        response = self.intent('0' * 64)
+        key = response.data['fields']['key']
+        default_storage.save(key, ContentFile(self.content))
+        upload_url = f'/api/v1/observations/uploads/{response.data["upload"]["id"]}/'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'{upload_url}finalize/')
+        
+        response = self.client.get(upload_url)
+        self.assertEqual(response.data['status'], 'failed')
+        self.assertIn('SHA-256', response.data['error'])
+        self.assertFalse(default_storage.exists(key))
+
+
+class OfflineSyncTests(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.farmer = User.objects.create_user(
+            phone_number='+254712345683',
+            password='testpass123',
+            full_name='Offline Farmer',
+            role='farmer'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.farmer)
+    
+    def batch(self):
+        location = {'latitude': '-0.300000', 'longitude': '36.070000', 'county': 'Nakuru'}
+        observation = {
+            'observation_type': 'crop_health', 'title': 'Leaf spots',
+            'description': 'Spots on maize leaves', **location,
+        }
+        pest = {
+            'name': 'Fall armyworm', 'pest_or_disease': 'pest', 'affected_crop': 'maize',
+            'severity': 'severe', 'symptoms': 'Ragged leaves', 'affected_area': '0.50', **location,
+        }
+        return {'items': [
+            {'idempotency_key': 'obs-1', 'type': 'farm_observation', 'data': observation},
+            {'idempotency_key': 'obs-2', 'type': 'farm_observation', 'data': {**observation, 'title': 'Wilting'}},
+            {'idempotency_key': 'pest-1', 'type': 'pest_disease_report', 'data': pest},
+            {'idempotency_key': 'crop-1', 'type': 'crop_report', 'data': {'crop_type': 'maize'}},
+            {'idempotency_key': 'obs-1', 'type': 'farm_observation', 'data': observation},
+        ]}
+    
+    def test_batch_is_created_once_with_per_item_results(self):
+        from apps.users.models import OutboxEvent
+        
+        response = self.client.post('/api/v1/observations/sync/', self.batch(), format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['created', 'created', 'created', 'invalid', 'duplicate']
+        )
+        self.assertIn('area_planted', response.data['results'][3]['errors'])
+        self.assertEqual(response.data['results'][4]['id'], response.data['results'][0]['id'])
+        self.assertEqual(FarmObservation.objects.filter(user=self.farmer).count(), 2)
+        self.assertEqual(OutboxEvent.objects.filter(event_type='observations.pest_report_created').count(), 1)
+        
+        # The device never saw the response and sends the batch again
+        with self.assertNumQueries(1):
+            retry = self.client.post('/api/v1/observations/sync/', self.batch(), format='json')
+        self.assertEqual(retry.data['created'], 0)
+        self.assertEqual(retry.data['duplicate'], 4)
+        self.assertEqual(
+            [result.get('id') for result in retry.data['results']],
+            [result.get('id') for result in response.data['results']]
+        )
+        self.assertEqual(FarmObservation.objects.filter(user=self.farmer).count(), 2)
+        self.assertEqual(PestDiseaseReport.objects.filter(user=self.farmer).count(), 1)
+    
+    def test_batch_counts_observations_once_committed(self):
+        from django.core.cache import cache
+        from .services import ObservationCounterService
+        cache.clear()
+        self.assertEqual(ObservationCounterService.status_count('pending', ['Nakuru']), 0)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/v1/observations/sync/', self.batch(), format='json')
+        self.assertEqual(ObservationCounterService.status_count('pending', ['Nakuru']), 2)
+    
+    def test_repeated_conflicts_are_reported_per_item(self):
+        from unittest.mock import patch
+        from django.db import IntegrityError
+        from .services import OfflineSyncService
+        
+        def racing(user, items, request):
+            raise IntegrityError('duplicate key value violates unique constraint')
+        
+        with patch.object(OfflineSyncService, '_sync', staticmethod(racing)):
+            response = self.client.post('/api/v1/observations/sync/', self.batch(), format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['conflict'], 5)
+        self.assertEqual(response.data['results'][4]['status'], 'conflict')
@@ -3,12 +3,17 @@ URL patterns for Observations app
 """
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import FarmObservationViewSet, CropReportViewSet, PestDiseaseReportViewSet
+from .views import (
+    FarmObservationViewSet, CropReportViewSet, PestDiseaseReportViewSet, UploadSessionViewSet,
+    OfflineSyncViewSet
+)
 
 router = DefaultRouter()
 router.register(r'farm-observations', FarmObservationViewSet, basename='farm-observation')
 router.register(r'crop-reports', CropReportViewSet, basename='crop-report')
 router.register(r'pest-disease-reports', PestDiseaseReportViewSet, basename='pest-disease-report')
+router.register(r'uploads', UploadSessionViewSet, basename='upload')
+router.register(r'sync', OfflineSyncViewSet, basename='sync')
 
 urlpatterns = [
     path('', include(router.urls)),
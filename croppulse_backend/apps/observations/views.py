@@ -1,14 +1,27 @@
 """
 Views for Observations app
 """
-from rest_framework import viewsets, status
+import base64
+import binascii
+from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import action
+from rest_framework.parsers import BaseParser, JSONParser
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
 from django.utils import timezone
+from django.utils.http import http_date
+from django.db import transaction
 from .models import FarmObservation, CropReport, PestDiseaseReport
-from .serializers import FarmObservationSerializer, CropReportSerializer, PestDiseaseReportSerializer
-from .services import ObservationService
+from .serializers import (
+    FarmObservationSerializer, CropReportSerializer, PestDiseaseReportSerializer,
+    UploadSessionSerializer, UploadIntentSerializer, SyncBatchSerializer
+)
+from .services import (
+    ObservationService, UploadSessionService, UploadOffsetMismatch, UploadGone, OfflineSyncService
+)
+from apps.users.models import User, UploadSession
+from apps.users.services import OutboxService, OfficerAssignmentService
 from core.permissions import CanVerifyObservations
 from core.pagination import StandardResultsSetPagination
 
@@ -51,6 +64,18 @@ class FarmObservationViewSet(viewsets.ModelViewSet):
         
         return Response({'message': 'Observation verified successfully'})
     
+    @action(detail=False, methods=['get'], permission_classes=[CanVerifyObservations])
+    def verification_queue(self, request):
+        """Pending observations to verify; field officers see their assigned farmers' only"""
+        queryset = FarmObservation.objects.filter(status='pending').select_related('user')
+        if request.user.is_field_officer:
+            farmers = OfficerAssignmentService.scope_farmers(request.user, User.objects.all())
+            queryset = queryset.filter(user__in=farmers.values('id'))
+        
+        page = self.paginate_queryset(queryset.order_by('created_at'))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+    
     @action(detail=True, methods=['post'], permission_classes=[CanVerifyObservations])
     def reject(self, request, pk=None):
         """Reject an observation"""
@@ -109,11 +134,12 @@ class PestDiseaseReportViewSet(viewsets.ModelViewSet):
         return PestDiseaseReport.objects.none()
     
     def perform_create(self, serializer):
-        report = serializer.save(user=self.request.user)
-        
-        # Notify if severe
-        if report.severity in ['high', 'severe'] or report.requires_assistance:
-            ObservationService.notify_pest_disease_alert(report)
+        with transaction.atomic():
+            report = serializer.save(user=self.request.user)
+            
+            # Notify if severe, once the report is committed
+            if report.severity in ['high', 'severe'] or report.requires_assistance:
+                OutboxService.publish('observations.pest_report_created', {'report_id': report.id})
     
     @action(detail=True, methods=['post'])
     def mark_resolved(self, request, pk=None):
@@ -131,3 +157,174 @@ class PestDiseaseReportViewSet(viewsets.ModelViewSet):
         report.save()
         
         return Response({'message': 'Report marked as resolved'})
+
+
+class OfflineSyncViewSet(viewsets.ViewSet):
+    """
+    Submit observations, crop reports and pest/disease reports collected
+    offline in one request. Each item has a client-generated idempotency
+    key; resending a batch never creates a record twice.
+    """
+    
+    permission_classes = [IsAuthenticated]
+    
+    def create(self, request):
+        serializer = SyncBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        results = OfflineSyncService.sync(request.user, serializer.validated_data['items'], request=request)
+        return Response({
+            'created': sum(result['status'] == 'created' for result in results),
+            'duplicate': sum(result['status'] == 'duplicate' for result in results),
+            'invalid': sum(result['status'] == 'invalid' for result in results),
+            'conflict': sum(result['status'] == 'conflict' for result in results),
+            'results': results,
+        })
+
+
+TUS_VERSION = '1.0.0'
+
+
+class OffsetOctetStreamParser(BaseParser):
+    """Raw chunk bodies of tus PATCH requests, read up to one byte past the chunk limit"""
+    
+    media_type = 'application/offset+octet-stream'
+    
+    def parse(self, stream, media_type=None, parser_context=None):
+        return stream.read(settings.UPLOAD_CHUNK_MAX_SIZE + 1) if stream else b''
+
+
+class UploadSessionViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Resumable media uploads (tus 1.0 core protocol with the creation and
+    expiration extensions)
+    
+    POST   uploads/        Upload-Length, Upload-Metadata (filename, filetype, kind)
+    HEAD   uploads/{id}/   Upload-Offset the client should resume from
+    PATCH  uploads/{id}/   Upload-Offset + application/offset+octet-stream chunk
+    GET    uploads/{id}/   Session status; 'complete' once assembled
+    
+    With S3 storage, clients can instead upload straight to the bucket:
+    
+    POST   uploads/intent/          Presigned POST form for the file
+    POST   uploads/{id}/finalize/   After the S3 upload; verified in the background
+    
+    Completed uploads are attached to observations through their
+    <field>_upload IDs.
+    """
+    
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+    parser_classes = [OffsetOctetStreamParser]
+    
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        response['Tus-Resumable'] = TUS_VERSION
+        if request.method == 'OPTIONS':
+            response['Tus-Version'] = TUS_VERSION
+            response['Tus-Extension'] = 'creation,expiration'
+            response['Tus-Max-Size'] = max(UploadSessionService.MAX_LENGTH.values())
+        return response
+    
+    @staticmethod
+    def _metadata(header: str) -> dict:
+        """Decode an Upload-Metadata header: comma separated 'key base64value' pairs"""
+        metadata = {}
+        for pair in filter(None, (item.strip() for item in header.split(','))):
+            key, _, value = pair.partition(' ')
+            try:
+                metadata[key] = base64.b64decode(value).decode() if value else ''
+            except (binascii.Error, UnicodeDecodeError):
+                raise ValueError(f'Upload-Metadata value for {key} is not valid base64')
+        return metadata
+    
+    @staticmethod
+    def _progress_headers(response, session):
+        response['Upload-Offset'] = session.offset
+        response['Upload-Length'] = session.length
+        response['Upload-Expires'] = http_date(session.expires_at.timestamp())
+        response['Cache-Control'] = 'no-store'
+        return response
+    
+    def create(self, request, *args, **kwargs):
+        try:
+            length = int(request.headers.get('Upload-Length', ''))
+            metadata = self._metadata(request.headers.get('Upload-Metadata', ''))
+            filetype = metadata.get('filetype', '')
+            kind = metadata.get('kind') or filetype.split('/')[0]
+            session = UploadSessionService.create(
+                request.user, kind, metadata.get('filename', ''), length, content_type=filetype
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        response = Response(self.get_serializer(session).data, status=status.HTTP_201_CREATED)
+        response['Location'] = request.build_absolute_uri(f'{session.id}/')
+        return self._progress_headers(response, session)
+    
+    def retrieve(self, request, *args, **kwargs):
+        session = self.get_object()
+        return self._progress_headers(Response(self.get_serializer(session).data), session)
+    
+    def partial_update(self, request, *args, **kwargs):
+        if request.content_type != OffsetOctetStreamParser.media_type:
+            return Response(
+                {'error': f'Chunks must be sent as {OffsetOctetStreamParser.media_type}'},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+        
+        data = request.data if isinstance(request.data, bytes) else b''
+        if len(data) > settings.UPLOAD_CHUNK_MAX_SIZE:
+            return Response(
+                {'error': f'Chunks cannot exceed {settings.UPLOAD_CHUNK_MAX_SIZE} bytes'},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            session = UploadSessionService.append(kwargs['pk'], request.user, offset, data)
+        except UploadSession.DoesNotExist:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        except UploadOffsetMismatch as e:
+            response = Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+            response['Upload-Offset'] = e.expected
+            return response
+        except UploadGone as e:
+            return Response({'error': str(e)}, status=status.HTTP_410_GONE)
+        except ValueError as e:
+            return Response({'error': str(e) or 'Upload-Offset header is required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return self._progress_headers(Response(status=status.HTTP_204_NO_CONTENT), session)
+    
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser])
+    def intent(self, request):
+        """Presigned S3 POST for a direct upload"""
+        serializer = UploadIntentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        try:
+            session, presigned = UploadSessionService.create_direct(request.user, **serializer.validated_data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'upload': self.get_serializer(session).data,
+            'url': presigned['url'],
+            'fields': presigned['fields'],
+            'finalize_url': request.build_absolute_uri(f'../{session.id}/finalize/'),
+        }, status=status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['post'], parser_classes=[JSONParser])
+    def finalize(self, request, pk=None):
+        """Verify a direct upload; poll the session until it is complete or failed"""
+        try:
+            session = UploadSessionService.finalize(pk, request.user)
+        except UploadSession.DoesNotExist:
+            return Response({'error': 'Direct upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        except UploadGone as e:
+            return Response({'error': str(e)}, status=status.HTTP_410_GONE)
+        
+        return Response(self.get_serializer(session).data, status=status.HTTP_202_ACCEPTED)
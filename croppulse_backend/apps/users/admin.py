@@ -3,7 +3,7 @@ Admin configuration for Users app
 """
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, FarmerProfile, FieldOfficerProfile, Notification
+from .models import User, FarmerProfile, FieldOfficerProfile, Notification, OutboundSMS, OutboxEvent, UploadSession, SyncReceipt
 
 
 @admin.register(User)
@@ -20,7 +20,7 @@ class UserAdmin(BaseUserAdmin):
         ('Personal Info', {'fields': ('full_name', 'email', 'profile_picture')}),
         ('Role & Location', {'fields': ('role', 'county', 'subcounty', 'ward', 'village')}),
         ('Verification', {'fields': ('is_verified', 'verification_code', 'verification_code_created_at')}),
-        ('Preferences', {'fields': ('language', 'receive_sms_notifications', 'receive_push_notifications', 'fcm_token')}),
+        ('Preferences', {'fields': ('language', 'receive_sms_notifications', 'receive_push_notifications', 'fcm_token', 'fcm_topics')}),
         ('Permissions', {'fields': ('is_active', 'is_staff', 'is_superuser', 'groups', 'user_permissions')}),
         ('Important dates', {'fields': ('last_login', 'created_at', 'updated_at')}),
     )
@@ -80,7 +80,7 @@ class NotificationAdmin(admin.ModelAdmin):
     """Admin for Notifications"""
     
     list_display = ['title', 'user', 'type', 'priority', 'is_read', 'sent_via_push', 'sent_via_sms', 'created_at']
-    list_filter = ['type', 'priority', 'is_read', 'sent_via_push', 'sent_via_sms', 'created_at']
+    list_filter = ['type', 'priority', 'is_read', 'sent_via_push', 'sent_via_sms', 'digest_pending', 'created_at']
     search_fields = ['title', 'message', 'user__full_name', 'user__phone_number']
     raw_id_fields = ['user']
     date_hierarchy = 'created_at'
@@ -90,8 +90,56 @@ class NotificationAdmin(admin.ModelAdmin):
         ('Notification', {'fields': ('type', 'priority', 'title', 'message', 'data')}),
         ('Status', {'fields': ('is_read', 'read_at')}),
         ('Related Object', {'fields': ('related_object_type', 'related_object_id')}),
-        ('Delivery', {'fields': ('sent_via_push', 'sent_via_sms')}),
+        ('Delivery', {'fields': ('sent_via_push', 'sent_via_sms', 'digest_pending', 'digest_sms')}),
         ('Timestamp', {'fields': ('created_at',)}),
     )
     
     readonly_fields = ['created_at', 'read_at']
+
+
+@admin.register(OutboundSMS)
+class OutboundSMSAdmin(admin.ModelAdmin):
+    """Admin for the SMS outbox"""
+    
+    list_display = ['phone_number', 'priority', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at']
+    list_filter = ['status', 'priority', 'created_at']
+    search_fields = ['phone_number', 'provider_sid', 'message']
+    raw_id_fields = ['user']
+    date_hierarchy = 'created_at'
+    
+    readonly_fields = ['created_at', 'sent_at', 'provider_sid']
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    """Admin for the transactional outbox"""
+    
+    list_display = ['event_type', 'status', 'attempts', 'available_at', 'processed_at', 'created_at']
+    list_filter = ['status', 'event_type', 'created_at']
+    date_hierarchy = 'created_at'
+    
+    readonly_fields = ['created_at', 'processed_at', 'last_error']
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    """Admin for resumable media uploads"""
+    
+    list_display = ['filename', 'user', 'kind', 'status', 'offset', 'length', 'expires_at', 'created_at']
+    list_filter = ['status', 'kind', 'created_at']
+    search_fields = ['filename', 'user__phone_number']
+    raw_id_fields = ['user']
+    date_hierarchy = 'created_at'
+    
+    readonly_fields = ['created_at', 'updated_at', 'checksum', 'error']
+
+
+@admin.register(SyncReceipt)
+class SyncReceiptAdmin(admin.ModelAdmin):
+    """Admin for offline sync idempotency receipts"""
+    
+    list_display = ['idempotency_key', 'user', 'record_type', 'record_id', 'created_at']
+    list_filter = ['record_type', 'created_at']
+    search_fields = ['idempotency_key', 'user__phone_number']
+    raw_id_fields = ['user']
+    date_hierarchy = 'created_at'
@@ -0,0 +1,303 @@
+"""
+Bulk farmer enrolment from CSV or XLSX
+
+Phone numbers for the whole file are normalised and validated in one
+vectorised pass, deduplicated within the file and against existing users
+with a single query, then users and farmer profiles are bulk created in
+batches. bulk_create sends no post_save signals, so the work those
+signals do for single registrations (profile creation, audience segment
+updates) is done here once per batch. Welcome SMS are queued through the
+outbox in the same transaction as the users they greet.
+"""
+import csv
+import io
+import time
+from typing import Dict, List
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from core.utils import chunk_list
+from core.validators import KENYA_COUNTIES
+from services.message_catalog import message_catalog
+from .models import User, FarmerProfile, OutboundSMS
+from .services import SMSOutboxService, AudienceSegmentService
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Accepted header spellings for each column
+COLUMN_ALIASES = {
+    'phone_number': ['phone_number', 'phone', 'mobile', 'phone_no'],
+    'full_name': ['full_name', 'name', 'farmer_name'],
+    'county': ['county'],
+    'language': ['language'],
+    'subcounty': ['subcounty', 'sub_county'],
+    'ward': ['ward'],
+    'village': ['village'],
+    'primary_crop': ['primary_crop', 'crop'],
+    'farm_size': ['farm_size', 'acreage', 'hectares'],
+}
+
+PHONE_SEPARATORS = [' ', '-', '.', '(', ')', '+', '\t']
+COUNTY_LOOKUP = {county.lower(): county for county in KENYA_COUNTIES}
+LANGUAGES = {code for code, _ in User.LANGUAGE_CHOICES}
+MAX_REPORTED_ERRORS = 100
+
+
+def normalize_phones(values: List) -> tuple:
+    """
+    Normalise Kenyan mobile numbers to +254XXXXXXXXX, all at once
+
+    Accepts 07XX/01XX, 254XX and bare 9-digit numbers with any spacing or
+    punctuation.
+
+    Returns:
+        tuple: (array of normalised numbers, boolean array of valid ones)
+    """
+    digits = np.array([str(value or '') for value in values], dtype=str)
+    for separator in PHONE_SEPARATORS:
+        digits = np.strings.replace(digits, separator, '')
+
+    lengths = np.strings.str_len(digits)
+    national = np.strings.slice(digits, -9, None)
+    prefixed = (
+        ((lengths == 12) & np.strings.startswith(digits, '254'))
+        | ((lengths == 10) & np.strings.startswith(digits, '0'))
+        | (lengths == 9)
+    )
+    mobile = np.strings.startswith(national, '7') | np.strings.startswith(national, '1')
+
+    valid = np.strings.isdigit(digits) & prefixed & mobile
+    return np.strings.add('+254', national), valid
+
+
+def _header(value) -> str:
+    return str(value or '').strip().lower().replace(' ', '_').replace('-', '_')
+
+
+def _cell(value) -> str:
+    # Spreadsheets store phone numbers and sizes as floats
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return '' if value is None else str(value).strip()
+
+
+def read_rows(file, filename: str) -> List[Dict]:
+    """
+    Rows of an uploaded CSV or XLSX file, keyed by canonical column name
+
+    Raises:
+        ValueError: Unsupported file type or missing required columns
+    """
+    extension = filename.rsplit('.', 1)[-1].lower()
+    if extension == 'csv':
+        content = file.read()
+        if isinstance(content, bytes):
+            content = content.decode('utf-8-sig')
+        records = csv.reader(io.StringIO(content))
+    elif extension == 'xlsx':
+        try:
+            import openpyxl
+        except ImportError:
+            raise ValueError('XLSX import needs openpyxl installed; upload a CSV instead')
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        records = workbook.active.iter_rows(values_only=True)
+    else:
+        raise ValueError(f'Unsupported file type: .{extension} (use .csv or .xlsx)')
+
+    headers = [_header(value) for value in next(records, [])]
+    columns = {}
+    for column, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in headers:
+                columns[column] = headers.index(alias)
+                break
+
+    missing = [column for column in ('phone_number', 'full_name', 'county') if column not in columns]
+    if missing:
+        raise ValueError(f'Missing required columns: {", ".join(missing)}')
+
+    rows = []
+    for record in records:
+        record = list(record)
+        if not any(_cell(value) for value in record):
+            continue
+        rows.append({
+            column: _cell(record[index]) if index < len(record) else ''
+            for column, index in columns.items()
+        })
+    return rows
+
+
+class FarmerImportService:
+    """Enrols farmers in bulk from parsed import rows"""
+
+    @staticmethod
+    def run(rows: List[Dict], send_welcome_sms: bool = True, batch_size: int = None) -> Dict:
+        """
+        Validate, deduplicate and create farmers
+
+        Args:
+            rows: Output of read_rows()
+            send_welcome_sms: Queue a welcome SMS for each new farmer
+            batch_size: Users created per transaction
+
+        Returns:
+            dict: Counts, per-row errors (row numbers match the file,
+                  header is row 1) and throughput
+        """
+        started = time.perf_counter()
+        batch_size = batch_size or settings.FARMER_IMPORT_BATCH_SIZE
+
+        phones, valid_phones = normalize_phones([row['phone_number'] for row in rows])
+        errors = {}
+        for index, row in enumerate(rows):
+            if not valid_phones[index]:
+                errors[index] = 'Invalid Kenyan mobile number'
+            elif not row['full_name']:
+                errors[index] = 'Full name is required'
+            elif row['county'].lower() not in COUNTY_LOOKUP:
+                errors[index] = 'Unknown county'
+
+        candidates = np.array([index for index in range(len(rows)) if index not in errors], dtype=np.int64)
+        _, first = np.unique(phones[candidates], return_index=True)
+        for index in np.setdiff1d(candidates, candidates[first]):
+            errors[int(index)] = 'Duplicate phone number in file'
+        candidates = np.sort(candidates[first])
+
+        existing = FarmerImportService._existing(phones[candidates].tolist())
+        for index in candidates:
+            if phones[index] in existing:
+                errors[int(index)] = 'Phone number already registered'
+
+        created = queued = 0
+        segments = set()
+        for batch in chunk_list([int(index) for index in candidates if index not in errors], batch_size):
+            try:
+                result = FarmerImportService._create_batch(rows, phones, batch, send_welcome_sms)
+            except IntegrityError:
+                # Someone registered one of these numbers since the check
+                registered = FarmerImportService._existing([phones[index] for index in batch])
+                for index in batch:
+                    if phones[index] in registered:
+                        errors[index] = 'Phone number already registered'
+                batch = [index for index in batch if index not in errors]
+                try:
+                    result = FarmerImportService._create_batch(rows, phones, batch, send_welcome_sms)
+                except IntegrityError:
+                    # Still failing: find the offending rows one at a time
+                    result = FarmerImportService._create_each(rows, phones, batch, send_welcome_sms, errors)
+
+            created += result['created']
+            queued += result['queued']
+            segments |= result['segments']
+
+        # bulk_create skipped the signals that keep cached segments current
+        AudienceSegmentService.invalidate(segments)
+
+        elapsed = time.perf_counter() - started
+        report = {
+            'rows': len(rows),
+            'created': created,
+            'skipped': len(errors),
+            'welcome_sms_queued': queued,
+            'errors': [
+                {'row': index + 2, 'phone_number': rows[index]['phone_number'], 'error': error}
+                for index, error in sorted(errors.items())[:MAX_REPORTED_ERRORS]
+            ],
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(len(rows) / elapsed, 1) if elapsed else None,
+        }
+        logger.info(
+            f'Imported {created} of {len(rows)} farmers in {report["seconds"]}s '
+            f'({report["rows_per_second"]} rows/s)'
+        )
+        return report
+
+    @staticmethod
+    def _create_each(
+        rows: List[Dict], phones: np.ndarray, batch: List[int], send_welcome_sms: bool, errors: Dict
+    ) -> Dict:
+        """Create a batch row by row, recording the rows that fail in `errors`"""
+        total = {'created': 0, 'queued': 0, 'segments': set()}
+        for index in batch:
+            try:
+                result = FarmerImportService._create_batch(rows, phones, [index], send_welcome_sms)
+            except IntegrityError as e:
+                registered = FarmerImportService._existing([phones[index]])
+                errors[index] = 'Phone number already registered' if registered else f'Could not create farmer: {e}'
+                continue
+            total['created'] += result['created']
+            total['queued'] += result['queued']
+            total['segments'] |= result['segments']
+        return total
+
+    @staticmethod
+    def _existing(phones: List[str]) -> set:
+        """Numbers in the list that already belong to a user"""
+        return {
+            str(phone) for phone in
+            User.objects.filter(phone_number__in=phones).values_list('phone_number', flat=True)
+        }
+
+    @staticmethod
+    def _create_batch(rows: List[Dict], phones: np.ndarray, batch: List[int], send_welcome_sms: bool) -> Dict:
+        """Users, profiles and welcome SMS for one batch, in one transaction"""
+        if not batch:
+            return {'created': 0, 'queued': 0, 'segments': set()}
+
+        # Unusable password: imported farmers log in with an SMS code
+        password = make_password(None)
+        users, profiles, messages, segments = [], [], [], set()
+
+        for index in batch:
+            row = rows[index]
+            language = row.get('language', '').lower()
+            users.append(User(
+                phone_number=str(phones[index]),
+                full_name=row['full_name'],
+                county=COUNTY_LOOKUP[row['county'].lower()],
+                subcounty=row.get('subcounty', ''),
+                ward=row.get('ward', ''),
+                village=row.get('village', ''),
+                language=language if language in LANGUAGES else 'en',
+                role='farmer',
+                password=password,
+            ))
+
+        with transaction.atomic():
+            users = User.objects.bulk_create(users)
+
+            for index, user in zip(batch, users):
+                row = rows[index]
+                try:
+                    farm_size = float(row.get('farm_size') or 0)
+                except ValueError:
+                    farm_size = 0
+                profile = FarmerProfile(
+                    user=user,
+                    farm_size=farm_size,
+                    primary_crop=row.get('primary_crop', '').lower() or FarmerProfile.DEFAULT_PRIMARY_CROP,
+                    farming_type='subsistence',
+                )
+                profiles.append(profile)
+                segments |= AudienceSegmentService.segments_for('farmer', user.county, True, profile.primary_crop)
+
+                if send_welcome_sms:
+                    rendered = message_catalog.render(
+                        'welcome', user.language, name=user.full_name, county=user.county
+                    )
+                    messages.append(OutboundSMS(
+                        user=user,
+                        phone_number=str(user.phone_number),
+                        message=rendered.sms,
+                        segments=rendered.sms_segments,
+                        priority=OutboundSMS.PRIORITY_BULK,
+                    ))
+
+            FarmerProfile.objects.bulk_create(profiles)
+            queued = SMSOutboxService.enqueue_bulk(messages)
+
+        return {'created': len(users), 'queued': queued, 'segments': segments}
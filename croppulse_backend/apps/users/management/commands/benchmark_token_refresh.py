@@ -0,0 +1,76 @@
+"""
+Benchmark token refresh with the database blacklist against the cache blacklist
+
+"db" is simplejwt's stock refresh (user lookup by ID) plus the
+token_blacklist lookup it makes on every refresh, run with plain SQL when
+those tables exist. "cache" is VersionedTokenRefreshSerializer, which
+checks TokenBlacklist and resolves the user through AuthUserCache.
+
+Usage:
+python manage.py benchmark_token_refresh --phone +254712345678
+python manage.py benchmark_token_refresh --phone +254712345678 --iterations 1000
+"""
+import time
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from apps.users.models import User
+from core.authentication import VersionedRefreshToken, VersionedTokenRefreshSerializer
+from .migrate_token_blacklist import OUTSTANDING_TABLE, BLACKLISTED_TABLE
+
+
+class Command(BaseCommand):
+    help = 'Compare refresh latency and queries for the database and cache token blacklists'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--phone', required=True, help='Phone number of the user to refresh as')
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(phone_number=options['phone'])
+        except User.DoesNotExist:
+            raise CommandError(f'User not found: {options["phone"]}')
+
+        has_tables = {OUTSTANDING_TABLE, BLACKLISTED_TABLE} <= set(connection.introspection.table_names())
+        if not has_tables:
+            self.stdout.write(self.style.WARNING(
+                'token_blacklist tables not found; "db" times the user lookup only'
+            ))
+
+        def db_refresh(token):
+            serializer = TokenRefreshSerializer(data={'refresh': token})
+            serializer.is_valid(raise_exception=True)
+            if has_tables:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'SELECT 1 FROM {BLACKLISTED_TABLE} b JOIN {OUTSTANDING_TABLE} o '
+                        f'ON o.id = b.token_id WHERE o.jti = %s LIMIT 1',
+                        [VersionedRefreshToken(token, verify=False)['jti']]
+                    )
+                    cursor.fetchone()
+
+        def cache_refresh(token):
+            serializer = VersionedTokenRefreshSerializer(data={'refresh': token})
+            serializer.is_valid(raise_exception=True)
+
+        self.stdout.write(f'{"Backend":<8} {"Mean ms":>8} {"p95 ms":>8} {"Queries":>8}')
+        for name, refresh in (('db', db_refresh), ('cache', cache_refresh)):
+            # One untimed refresh warms the caches
+            refresh(str(VersionedRefreshToken.for_user(user)))
+            tokens = [str(VersionedRefreshToken.for_user(user)) for _ in range(options['iterations'])]
+
+            timings = []
+            with CaptureQueriesContext(connection) as queries:
+                for token in tokens:
+                    started = time.perf_counter()
+                    refresh(token)
+                    timings.append((time.perf_counter() - started) * 1000)
+
+            timings = np.array(timings)
+            self.stdout.write(
+                f'{name:<8} {timings.mean():>8.3f} {np.percentile(timings, 95):>8.3f} '
+                f'{len(queries) / len(tokens):>8.1f}'
+            )
@@ -0,0 +1,65 @@
+"""
+Backfill resized copies of existing uploaded images
+
+Usage:
+python manage.py generate_image_derivatives
+python manage.py generate_image_derivatives --queue
+python manage.py generate_image_derivatives --model observations.FarmObservation --force
+"""
+import time
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from services.images import IMAGE_FIELDS, ImageDerivativeService
+from apps.users.tasks import generate_image_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnails for uploaded images that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', help=f'Limit to a model (one of {", ".join(IMAGE_FIELDS)})')
+        parser.add_argument('--queue', action='store_true', help='Queue Celery tasks instead of resizing here')
+        parser.add_argument('--force', action='store_true', help='Regenerate images that already have derivatives')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        labels = options['model'] or list(IMAGE_FIELDS)
+        unknown = set(labels) - set(IMAGE_FIELDS)
+        if unknown:
+            raise CommandError(f'No image fields registered for: {", ".join(sorted(unknown))}')
+
+        started = time.perf_counter()
+        done = failed = 0
+        for label in labels:
+            before = done
+            model = apps.get_model(label)
+            fields = IMAGE_FIELDS[label]
+            has_image = Q()
+            for field in fields:
+                has_image |= ~Q(**{field: ''}) & Q(**{f'{field}__isnull': False})
+
+            rows = model.objects.filter(has_image).order_by('pk').values_list(*fields)
+            for offset in range(0, rows.count(), options['batch_size']):
+                names = [name for row in rows[offset:offset + options['batch_size']] for name in row if name]
+                if not options['force']:
+                    names = ImageDerivativeService.pending(names)
+
+                for name in names:
+                    if options['queue']:
+                        generate_image_derivatives.delay(name)
+                        done += 1
+                        continue
+                    try:
+                        ImageDerivativeService.generate(name)
+                        done += 1
+                    except Exception as e:
+                        failed += 1
+                        self.stdout.write(self.style.WARNING(f'{name}: {e}'))
+
+            self.stdout.write(f'{label}: {done - before}')
+
+        verb = 'queued' if options['queue'] else 'generated'
+        self.stdout.write(self.style.SUCCESS(
+            f'{done} images {verb}, {failed} failed in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,39 @@
+"""
+Enrol farmers in bulk from a CSV or XLSX file
+
+Usage:
+python manage.py import_farmers farmers.csv
+python manage.py import_farmers cooperative.xlsx --no-sms --batch-size 2000
+"""
+from django.core.management.base import BaseCommand, CommandError
+from apps.users.bulk_import import FarmerImportService, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Create farmers and their profiles from a CSV/XLSX file and queue welcome SMS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX with phone_number, full_name and county columns')
+        parser.add_argument('--no-sms', action='store_true', help='Do not queue welcome SMS')
+        parser.add_argument('--batch-size', type=int, help='Users created per transaction')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as file:
+                rows = read_rows(file, options['path'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        report = FarmerImportService.run(
+            rows,
+            send_welcome_sms=not options['no_sms'],
+            batch_size=options['batch_size']
+        )
+
+        for error in report['errors']:
+            self.stdout.write(self.style.WARNING(f'Row {error["row"]} ({error["phone_number"]}): {error["error"]}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'{report["created"]} of {report["rows"]} farmers created, {report["skipped"]} skipped, '
+            f'{report["welcome_sms_queued"]} welcome SMS queued in {report["seconds"]}s '
+            f'({report["rows_per_second"]} rows/s)'
+        ))
@@ -0,0 +1,52 @@
+"""
+Measure per-endpoint query counts with a cold and a warm auth cache
+
+Usage:
+python manage.py measure_query_counts --phone +254712345678
+python manage.py measure_query_counts --phone +254712345678 --path /api/v1/alerts/alerts/active/
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from apps.users.models import User
+from core.authentication import VersionedRefreshToken, AuthUserCache
+
+
+DEFAULT_PATHS = [
+    '/api/v1/users/users/me/',
+    '/api/v1/users/dashboard/onboarding_status/',
+    '/api/v1/users/dashboard/farmer/',
+    '/api/v1/users/notifications/unread_count/',
+    '/api/v1/alerts/alerts/active/',
+]
+
+
+class Command(BaseCommand):
+    help = 'Report DB queries per GET endpoint, with and without the cached authenticated user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--phone', required=True, help='Phone number of the user to request as')
+        parser.add_argument('--path', action='append', help='Endpoint to measure (repeatable)')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(phone_number=options['phone'])
+        except User.DoesNotExist:
+            raise CommandError(f'User not found: {options["phone"]}')
+
+        token = VersionedRefreshToken.for_user(user).access_token
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        self.stdout.write(f'{"Endpoint":<50} {"Status":>6} {"Cold":>6} {"Warm":>6} {"Saved":>6}')
+        for path in options['path'] or DEFAULT_PATHS:
+            AuthUserCache.invalidate(user.id)
+            with CaptureQueriesContext(connection) as cold:
+                response = client.get(path)
+            with CaptureQueriesContext(connection) as warm:
+                client.get(path)
+
+            self.stdout.write(
+                f'{path:<50} {response.status_code:>6} {len(cold):>6} {len(warm):>6} '
+                f'{len(cold) - len(warm):>6}'
+            )
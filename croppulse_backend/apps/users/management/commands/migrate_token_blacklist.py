@@ -0,0 +1,104 @@
+"""
+Move simplejwt's database token blacklist into the cache blacklist
+
+Unexpired blacklisted JTIs are copied to TokenBlacklist (with a TTL of
+their remaining lifetime); then the blacklisted rows and every expired
+outstanding row are deleted, one batch at a time. The token_blacklist app
+no longer needs to be installed, so its tables are read with plain SQL.
+
+Usage:
+python manage.py migrate_token_blacklist
+python manage.py migrate_token_blacklist --batch-size 5000 --dry-run
+"""
+from datetime import timezone as dt_timezone
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from core.authentication import TokenBlacklist
+
+
+OUTSTANDING_TABLE = 'token_blacklist_outstandingtoken'
+BLACKLISTED_TABLE = 'token_blacklist_blacklistedtoken'
+
+
+class Command(BaseCommand):
+    help = 'Copy blacklisted JWTs from the token_blacklist tables to the cache and prune the tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Count rows without moving or deleting')
+
+    def handle(self, *args, **options):
+        tables = set(connection.introspection.table_names())
+        if not {OUTSTANDING_TABLE, BLACKLISTED_TABLE} <= tables:
+            self.stdout.write('No token_blacklist tables found, nothing to migrate')
+            return
+
+        batch_size = options['batch_size']
+        now = timezone.now()
+        moved = expired = batches = 0
+        last_id = 0
+
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT b.id, o.jti, o.expires_at FROM {BLACKLISTED_TABLE} b '
+                    f'JOIN {OUTSTANDING_TABLE} o ON o.id = b.token_id '
+                    f'WHERE b.id > %s ORDER BY b.id LIMIT %s',
+                    [last_id, batch_size]
+                )
+                rows = cursor.fetchall()
+            if not rows:
+                break
+
+            last_id = rows[-1][0]
+            batches += 1
+            live = []
+            for _, jti, expires_at in rows:
+                # SQLite hands back naive UTC datetimes
+                if timezone.is_naive(expires_at):
+                    expires_at = timezone.make_aware(expires_at, dt_timezone.utc)
+                if expires_at > now:
+                    live.append((jti, expires_at.timestamp()))
+            expired += len(rows) - len(live)
+            if options['dry_run']:
+                moved += len(live)
+                continue
+
+            # Cache first: a crash between the two steps leaves rows to retry,
+            # never a revoked token that is usable again
+            moved += TokenBlacklist.add_many(live)
+            ids = [row[0] for row in rows]
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {BLACKLISTED_TABLE} WHERE id IN ({", ".join(["%s"] * len(ids))})',
+                    ids
+                )
+
+        pruned = 0 if options['dry_run'] else self.prune_outstanding(now, batch_size)
+
+        prefix = '[dry run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}{moved} blacklisted tokens moved to the cache, {expired} already expired '
+            f'({batches} batches); {pruned} expired outstanding tokens pruned'
+        ))
+
+    def prune_outstanding(self, now, batch_size) -> int:
+        """Delete expired outstanding tokens that nothing references any more"""
+        pruned = 0
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT id FROM {OUTSTANDING_TABLE} o WHERE o.expires_at <= %s '
+                    f'AND NOT EXISTS (SELECT 1 FROM {BLACKLISTED_TABLE} b WHERE b.token_id = o.id) '
+                    f'LIMIT %s',
+                    [now, batch_size]
+                )
+                ids = [row[0] for row in cursor.fetchall()]
+                if not ids:
+                    return pruned
+                cursor.execute(
+                    f'DELETE FROM {OUTSTANDING_TABLE} WHERE id IN ({", ".join(["%s"] * len(ids))})',
+                    ids
+                )
+                pruned += len(ids)
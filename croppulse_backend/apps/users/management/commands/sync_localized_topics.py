@@ -0,0 +1,62 @@
+"""
+Move devices of non-English users from plain topics to their language's
+variant (e.g. county-nairobi to county-nairobi-sw)
+
+Devices subscribed before topics were localised still sit on the plain
+topic, so they get the English copy of every topic push and miss their
+own language's. Only users with recorded subscriptions are touched.
+
+Usage:
+python manage.py sync_localized_topics
+python manage.py sync_localized_topics --queue
+python manage.py sync_localized_topics --dry-run
+"""
+from django.core.management.base import BaseCommand
+from apps.users.models import User
+from apps.users.services import UserService
+from apps.users.tasks import sync_push_topics
+
+
+class Command(BaseCommand):
+    help = 'Re-sync FCM topic subscriptions for non-English users still on plain topics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='store_true', help='Queue Celery tasks instead of syncing here')
+        parser.add_argument('--dry-run', action='store_true', help='Count users without changing subscriptions')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        users = (
+            User.objects
+            .exclude(language='en')
+            .exclude(fcm_token='')
+            .exclude(fcm_topics=[])
+            .select_related('farmer_profile')
+            .order_by('pk')
+        )
+
+        synced = changed = 0
+        last_id = 0
+        while True:
+            batch = list(users.filter(pk__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1].pk
+
+            for user in batch:
+                synced += 1
+                if options['dry_run']:
+                    continue
+                if options['queue']:
+                    sync_push_topics.delay(user.id)
+                    continue
+                result = UserService.sync_push_topics(user)
+                if result['subscribed'] or result['unsubscribed']:
+                    changed += 1
+
+        if options['dry_run']:
+            self.stdout.write(f'{synced} users would be re-synced')
+        elif options['queue']:
+            self.stdout.write(self.style.SUCCESS(f'{synced} users queued'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{synced} users checked, {changed} moved to localised topics'))
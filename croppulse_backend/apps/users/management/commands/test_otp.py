@@ -8,10 +8,8 @@ touch apps/users/management/__init__.py
 touch apps/users/management/commands/__init__.py
 """
 from django.core.management.base import BaseCommand
-from django.utils import timezone
 from apps.users.models import User, FarmerProfile
-from apps.users.services import UserService
-from core.utils import generate_verification_code
+from apps.users.services import UserService, OTPService
 import json
 
 
@@ -66,9 +64,6 @@ class Command(BaseCommand):
             # Delete existing if present
             User.objects.filter(phone_number=phone).delete()
             
-            # Generate OTP
-            otp = generate_verification_code()
-            
             # Create user
             user = User.objects.create(
                 phone_number=phone,
@@ -76,27 +71,23 @@ class Command(BaseCommand):
                 county='Nairobi',
                 language='en',
                 role='farmer',
-                is_active=False,
-                verification_code=otp,
-                verification_code_created_at=timezone.now()
+                is_active=False
             )
             
             # Create farmer profile
-            FarmerProfile.objects.create(
+            FarmerProfile.objects.get_or_create(
                 user=user,
-                farm_size=0,
-                primary_crop='maize'
+                defaults={'farm_size': 0, 'primary_crop': FarmerProfile.DEFAULT_PRIMARY_CROP}
             )
             
             self.stdout.write(self.style.SUCCESS(f'✅ Test farmer created'))
             self.stdout.write(self.style.SUCCESS(f'Phone: {phone}'))
-            self.stdout.write(self.style.SUCCESS(f'OTP: {otp}'))
-            self.stdout.write(self.style.SUCCESS(f'Created at: {user.verification_code_created_at}'))
             
-            # Test sending SMS
-            self.stdout.write(self.style.WARNING('\n📤 Testing SMS send...'))
+            # Test queueing the OTP SMS
+            self.stdout.write(self.style.WARNING('\n📤 Testing OTP send...'))
             success = UserService.send_login_otp(user)
-            self.stdout.write(self.style.SUCCESS(f'SMS send result: {success}'))
+            self.stdout.write(self.style.SUCCESS(f'OTP queued: {success}'))
+            self.stdout.write(self.style.SUCCESS(f'OTP: {(OTPService.peek(user) or {}).get("code")}'))
             
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'❌ Error: {str(e)}'))
@@ -106,16 +97,12 @@ class Command(BaseCommand):
         try:
             user = User.objects.get(phone_number=phone, role='farmer')
             
-            # Generate new OTP
-            user.verification_code = generate_verification_code()
-            user.verification_code_created_at = timezone.now()
-            user.save()
-            
-            self.stdout.write(self.style.SUCCESS(f'✅ Generated new OTP: {user.verification_code}'))
+            result = OTPService.issue(user, 'login_otp')
+            if not result['sent']:
+                self.stdout.write(self.style.WARNING(f'⏳ Resend cooldown, retry in {result["retry_after"]}s'))
+                return
             
-            # Send SMS
-            success = UserService.send_login_otp(user)
-            self.stdout.write(self.style.SUCCESS(f'📤 SMS send result: {success}'))
+            self.stdout.write(self.style.SUCCESS(f'📤 OTP queued: {OTPService.peek(user)["code"]}'))
             
         except User.DoesNotExist:
             self.stdout.write(self.style.ERROR(f'❌ Farmer not found: {phone}'))
@@ -125,32 +112,20 @@ class Command(BaseCommand):
         try:
             user = User.objects.get(phone_number=phone, role='farmer')
             
-            self.stdout.write(f'Stored OTP: {user.verification_code}')
+            self.stdout.write(f'Stored OTP: {OTPService.peek(user)}')
             self.stdout.write(f'Provided OTP: {otp}')
-            self.stdout.write(f'Match: {user.verification_code == otp}')
             
-            if user.verification_code != otp:
-                self.stdout.write(self.style.ERROR('❌ OTP does not match'))
+            result = OTPService.verify(user, otp)
+            if result != 'valid':
+                self.stdout.write(self.style.ERROR(f'❌ OTP {result}'))
                 return
             
-            # Check expiration
-            if user.verification_code_created_at:
-                elapsed = timezone.now() - user.verification_code_created_at
-                seconds = elapsed.total_seconds()
-                self.stdout.write(f'OTP age: {seconds} seconds')
-                
-                if seconds > 600:
-                    self.stdout.write(self.style.ERROR('❌ OTP expired (>10 minutes)'))
-                    return
-            
             self.stdout.write(self.style.SUCCESS('✅ OTP is valid!'))
             
             # Activate user
             user.is_active = True
             user.is_verified = True
-            user.verification_code = None
-            user.verification_code_created_at = None
-            user.save()
+            user.save(update_fields=['is_active', 'is_verified'])
             
             self.stdout.write(self.style.SUCCESS('✅ User activated and verified'))
             
@@ -169,12 +144,7 @@ class Command(BaseCommand):
             self.stdout.write(f'Role: {user.role}')
             self.stdout.write(f'Active: {user.is_active}')
             self.stdout.write(f'Verified: {user.is_verified}')
-            self.stdout.write(f'OTP: {user.verification_code or "None"}')
-            self.stdout.write(f'OTP Created: {user.verification_code_created_at or "None"}')
-            
-            if user.verification_code_created_at:
-                elapsed = timezone.now() - user.verification_code_created_at
-                self.stdout.write(f'OTP Age: {elapsed.total_seconds()} seconds')
+            self.stdout.write(f'OTP: {OTPService.peek(user) or "None"}')
             
             # Check farmer profile
             try:
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 01:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_sms_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='fcm_topics',
+            field=models.JSONField(blank=True, default=list, help_text='FCM topics the token is subscribed to'),
+        ),
+    ]
@@ -0,0 +1,87 @@
+"""
+Convert the notifications table into a table range-partitioned by month
+on created_at (Postgres only; other databases keep a plain table and
+rely on batched cleanup).
+
+Postgres requires the partition key in the primary key, so the table's
+PK becomes (id, created_at). Django still treats id as the primary key;
+ids stay unique because they come from a single identity sequence.
+"""
+from django.db import migrations
+from django.utils import timezone
+
+from core.utils import add_months, month_start
+
+TABLE = 'notifications'
+MONTHS_AHEAD = 3
+
+
+def partition_notifications(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [TABLE]
+        )
+        if cursor.fetchone():
+            return
+
+        # Capture secondary indexes and foreign keys so they can be rebuilt
+        # under the same names on the partitioned table
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT LIKE '%%pkey'",
+            [TABLE]
+        )
+        index_defs = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [TABLE]
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f'SELECT MIN(created_at) FROM {TABLE}')
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute(
+            f'CREATE TABLE {TABLE}_partitioned '
+            f'(LIKE {TABLE} INCLUDING DEFAULTS INCLUDING IDENTITY) '
+            f'PARTITION BY RANGE (created_at)'
+        )
+        cursor.execute(f'ALTER TABLE {TABLE}_partitioned ADD PRIMARY KEY (id, created_at)')
+        cursor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE}_partitioned DEFAULT')
+
+        this_month = month_start(timezone.now().date())
+        month = month_start(oldest.date()) if oldest else this_month
+        while month <= add_months(this_month, MONTHS_AHEAD):
+            next_month = add_months(month, 1)
+            cursor.execute(
+                f'CREATE TABLE {TABLE}_p{month:%Y%m} PARTITION OF {TABLE}_partitioned '
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')"
+            )
+            month = next_month
+
+        cursor.execute(f'INSERT INTO {TABLE}_partitioned SELECT * FROM {TABLE}')
+        cursor.execute(f'DROP TABLE {TABLE}')
+        cursor.execute(f'ALTER TABLE {TABLE}_partitioned RENAME TO {TABLE}')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE(MAX(id), 0) + 1, false) "
+            f'FROM {TABLE}'
+        )
+
+        for index_def in index_defs:
+            cursor.execute(index_def)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_notification_inbox_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_notifications, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 01:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0008_event_outbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['county', 'role', 'is_active'], name='users_county_aa4292_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 01:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_user_segment_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundsms',
+            name='segments',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
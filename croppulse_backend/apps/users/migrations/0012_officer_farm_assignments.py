@@ -0,0 +1,41 @@
+# Generated by Django 5.2.9 on 2026-10-19 01:51
+
+import core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_user_token_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fieldofficerprofile',
+            name='base_latitude',
+            field=models.DecimalField(blank=True, decimal_places=6, help_text='Centre of the coverage area', max_digits=9, null=True, validators=[core.validators.validate_latitude]),
+        ),
+        migrations.AddField(
+            model_name='fieldofficerprofile',
+            name='base_longitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True, validators=[core.validators.validate_longitude]),
+        ),
+        migrations.CreateModel(
+            name='OfficerFarmAssignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('assigned_at', models.DateTimeField(auto_now_add=True)),
+                ('farmer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='officer_assignments', to=settings.AUTH_USER_MODEL)),
+                ('officer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='farm_assignments', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'officer farm assignment',
+                'verbose_name_plural': 'officer farm assignments',
+                'db_table': 'officer_farm_assignments',
+                'constraints': [models.UniqueConstraint(fields=('officer', 'farmer'), name='unique_officer_farm_assignment')],
+            },
+        ),
+    ]
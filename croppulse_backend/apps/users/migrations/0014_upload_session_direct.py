@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-19 01:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='direct',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='status',
+            field=models.CharField(choices=[('uploading', 'Uploading'), ('assembling', 'Assembling'), ('verifying', 'Verifying'), ('complete', 'Complete'), ('attached', 'Attached'), ('failed', 'Failed')], default='uploading', max_length=20),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.9 on 2026-10-19 02:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0014_upload_session_direct'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncReceipt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=64)),
+                ('record_type', models.CharField(max_length=50)),
+                ('record_id', models.PositiveBigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_receipts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'sync receipt',
+                'verbose_name_plural': 'sync receipts',
+                'db_table': 'sync_receipts',
+                'constraints': [models.UniqueConstraint(fields=('user', 'idempotency_key'), name='unique_sync_idempotency_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 02:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0015_sync_receipts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='lease_token',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+    ]
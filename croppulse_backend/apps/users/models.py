@@ -1,8 +1,10 @@
 """
 User models for CropPulse Africa
 """
+import uuid
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from phonenumber_field.modelfields import PhoneNumberField
 from core.validators import validate_latitude, validate_longitude
@@ -80,6 +82,10 @@ class User(AbstractUser):
     
     # Verification
     is_verified = models.BooleanField(default=False)
+    # Bumped to revoke every JWT issued so far (see core.authentication)
+    token_version = models.PositiveIntegerField(default=0)
+    
+    # No longer written: live codes are held by OTPService in the cache
     verification_code = models.CharField(max_length=6, blank=True, null=True)
     verification_code_created_at = models.DateTimeField(blank=True, null=True)
     
@@ -90,6 +96,7 @@ class User(AbstractUser):
     
     # Device tokens for push notifications
     fcm_token = models.CharField(max_length=255, blank=True)
+    fcm_topics = models.JSONField(default=list, blank=True, help_text='FCM topics the token is subscribed to')
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -106,6 +113,9 @@ class User(AbstractUser):
         verbose_name = _('user')
         verbose_name_plural = _('users')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['county', 'role', 'is_active']),
+        ]
     
     def __str__(self):
         return f"{self.full_name} ({self.phone_number})"
@@ -126,6 +136,9 @@ class User(AbstractUser):
 class FarmerProfile(models.Model):
     """Extended profile for farmers"""
 
+    # Crop recorded until the farmer says otherwise, on every enrolment path
+    DEFAULT_PRIMARY_CROP = 'maize'
+
     # Named function for farmer uploads
     def farmer_upload_to(instance, filename):
         return get_upload_path(instance, filename, 'farmer_profiles')
@@ -208,6 +221,21 @@ class FieldOfficerProfile(models.Model):
     
     # Work area
     coverage_area_radius = models.IntegerField(default=50, help_text='Radius in kilometers')
+    base_latitude = models.DecimalField(
+        max_digits=9,
+        decimal_places=6,
+        validators=[validate_latitude],
+        blank=True,
+        null=True,
+        help_text='Centre of the coverage area'
+    )
+    base_longitude = models.DecimalField(
+        max_digits=9,
+        decimal_places=6,
+        validators=[validate_longitude],
+        blank=True,
+        null=True
+    )
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -257,6 +285,10 @@ class Notification(models.Model):
     sent_via_push = models.BooleanField(default=False)
     sent_via_sms = models.BooleanField(default=False)
     
+    # Delivery held back for the next per-user digest
+    digest_pending = models.BooleanField(default=False)
+    digest_sms = models.BooleanField(default=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -265,8 +297,17 @@ class Notification(models.Model):
         verbose_name_plural = _('notifications')
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['user', '-created_at']),
+            models.Index(
+                fields=['user', '-created_at', '-id'],
+                include=['is_read'],
+                name='notifications_user_inbox_idx',
+            ),
             models.Index(fields=['user', 'is_read']),
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(digest_pending=True),
+                name='notifications_digest_idx',
+            ),
         ]
     
     def __str__(self):
@@ -279,3 +320,205 @@ class Notification(models.Model):
             self.is_read = True
             self.read_at = timezone.now()
             self.save(update_fields=['is_read', 'read_at'])
+
+
+class OutboundSMS(models.Model):
+    """SMS outbox drained by the dedicated SMS Celery workers"""
+    
+    PRIORITY_OTP = 0
+    PRIORITY_ALERT = 1
+    PRIORITY_BULK = 2
+    
+    PRIORITY_CHOICES = [
+        (PRIORITY_OTP, 'OTP'),
+        (PRIORITY_ALERT, 'Alert'),
+        (PRIORITY_BULK, 'Bulk'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('dead', 'Dead Letter'),
+    ]
+    
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='outbound_sms'
+    )
+    phone_number = models.CharField(max_length=20)
+    message = models.TextField()
+    segments = models.PositiveSmallIntegerField(blank=True, null=True)  # Billed SMS parts
+    priority = models.PositiveSmallIntegerField(choices=PRIORITY_CHOICES, default=PRIORITY_BULK)
+    
+    # Delivery state
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    provider_sid = models.CharField(max_length=64, blank=True)
+    last_error = models.TextField(blank=True)
+    
+    # For linking to related objects
+    related_object_type = models.CharField(max_length=50, blank=True)
+    related_object_id = models.IntegerField(blank=True, null=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        db_table = 'sms_outbox'
+        verbose_name = _('outbound SMS')
+        verbose_name_plural = _('outbound SMS')
+        ordering = ['priority', 'created_at']
+        indexes = [
+            models.Index(fields=['status', 'priority', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"SMS to {self.phone_number} ({self.get_status_display()})"
+
+
+class OutboxEvent(models.Model):
+    """
+    Side effect recorded in the same transaction as the write that caused
+    it, relayed to Celery once committed
+    """
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('dispatched', 'Dispatched'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    # Set by the worker that claimed the event; only that worker may finish it
+    lease_token = models.UUIDField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        db_table = 'event_outbox'
+        verbose_name = _('outbox event')
+        verbose_name_plural = _('outbox events')
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type} #{self.id} ({self.get_status_display()})"
+
+
+class OfficerFarmAssignment(models.Model):
+    """
+    A farm inside a field officer's coverage radius. Maintained by
+    OfficerAssignmentService as farms and officers move.
+    """
+    
+    officer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='farm_assignments')
+    farmer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='officer_assignments')
+    assigned_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'officer_farm_assignments'
+        verbose_name = _('officer farm assignment')
+        verbose_name_plural = _('officer farm assignments')
+        constraints = [
+            models.UniqueConstraint(fields=['officer', 'farmer'], name='unique_officer_farm_assignment'),
+        ]
+    
+    def __str__(self):
+        return f"Officer {self.officer_id} -> farmer {self.farmer_id}"
+
+
+class UploadSession(models.Model):
+    """
+    A media upload, either resumable (tus-style) or direct to S3. Chunks of
+    a resumable upload are staged in storage as they arrive and assembled
+    by a task once the last byte is in; a direct upload is verified in
+    place once the client finalizes it. Observations then reference the
+    validated file by session ID.
+    """
+    
+    KIND_CHOICES = [
+        ('image', 'Image'),
+        ('audio', 'Audio'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('assembling', 'Assembling'),
+        ('verifying', 'Verifying'),
+        ('complete', 'Complete'),
+        ('attached', 'Attached'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    direct = models.BooleanField(default=False)  # Sent straight to S3 with a presigned POST, not in chunks
+    
+    # Byte counts; offset is the number of bytes received so far
+    length = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    file_path = models.CharField(max_length=255, blank=True)  # Assembled file, or the presigned key of a direct upload
+    checksum = models.CharField(max_length=64, blank=True)  # SHA-256 of the file (declared up front for direct uploads)
+    error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'upload_sessions'
+        verbose_name = _('upload session')
+        verbose_name_plural = _('upload sessions')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.length}, {self.get_status_display()})"
+
+
+class SyncReceipt(models.Model):
+    """
+    Record created from an offline sync batch, keyed by the idempotency
+    key the client generated for it, so a retried batch returns the
+    original records instead of creating them again
+    """
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sync_receipts')
+    idempotency_key = models.CharField(max_length=64)
+    record_type = models.CharField(max_length=50)
+    record_id = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'sync_receipts'
+        verbose_name = _('sync receipt')
+        verbose_name_plural = _('sync receipts')
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='unique_sync_idempotency_key'),
+        ]
+    
+    def __str__(self):
+        return f"{self.idempotency_key} -> {self.record_type} #{self.record_id}"
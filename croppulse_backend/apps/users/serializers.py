@@ -2,13 +2,20 @@
 Serializers for Users app
 """
 from rest_framework import serializers
+from core.fields import ImageVariantsField
 from django.contrib.auth import authenticate
-from django.utils import timezone
 from .models import User, FarmerProfile, FieldOfficerProfile, Notification
-from core.utils import generate_verification_code
+from .services import OTPService
 import secrets
 
 
+OTP_ERRORS = {
+    'invalid': 'Invalid OTP code',
+    'expired': 'OTP has expired. Please request a new code.',
+    'locked': 'Too many attempts. Please request a new code.',
+}
+
+
 class FarmerProfileSerializer(serializers.ModelSerializer):
     """Serializer for farmer profile"""
 
@@ -32,7 +39,7 @@ class FieldOfficerProfileSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'employee_id', 'assigned_counties', 'assigned_subcounties',
             'supervisor', 'supervisor_name', 'coverage_area_radius',
-            'created_at', 'updated_at'
+            'base_latitude', 'base_longitude', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
 
@@ -42,12 +49,13 @@ class UserSerializer(serializers.ModelSerializer):
 
     farmer_profile = FarmerProfileSerializer(read_only=True)
     field_officer_profile = FieldOfficerProfileSerializer(read_only=True)
+    profile_picture_urls = ImageVariantsField(source='profile_picture')
 
     class Meta:
         model = User
         fields = [
             'id', 'phone_number', 'email', 'full_name', 'role',
-            'profile_picture', 'county', 'subcounty', 'ward', 'village',
+            'profile_picture', 'profile_picture_urls', 'county', 'subcounty', 'ward', 'village',
             'is_verified', 'language', 'receive_sms_notifications',
             'receive_push_notifications', 'fcm_token', 'created_at', 'updated_at',
             'last_login', 'farmer_profile', 'field_officer_profile'
@@ -81,16 +89,11 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         password = validated_data.pop('password')
         user = User.objects.create_user(password=password, **validated_data)
 
-        # Generate verification code
-        user.verification_code = generate_verification_code()
-        user.verification_code_created_at = timezone.now()
-        user.save()
-
         # Create role-specific profile safely
         if user.role == 'farmer':
             FarmerProfile.objects.get_or_create(
                 user=user,
-                defaults={'farm_size': 0, 'primary_crop': 'maize'}
+                defaults={'farm_size': 0, 'primary_crop': FarmerProfile.DEFAULT_PRIMARY_CROP}
             )
         elif user.role == 'field_officer':
             FieldOfficerProfile.objects.get_or_create(
@@ -141,14 +144,9 @@ class VerifyPhoneSerializer(serializers.Serializer):
         if user.is_verified:
             raise serializers.ValidationError("Phone number already verified")
 
-        if user.verification_code != data['verification_code']:
-            raise serializers.ValidationError("Invalid verification code")
-
-        # Check if code is expired (10 minutes)
-        if user.verification_code_created_at:
-            time_diff = timezone.now() - user.verification_code_created_at
-            if time_diff.total_seconds() > 600:
-                raise serializers.ValidationError("Verification code has expired")
+        result = OTPService.verify(user, data['verification_code'])
+        if result != 'valid':
+            raise serializers.ValidationError(OTP_ERRORS[result])
 
         data['user'] = user
         return data
@@ -183,6 +181,14 @@ class UpdateProfileSerializer(serializers.ModelSerializer):
             'receive_push_notifications'
         ]
 
+    def update(self, instance, validated_data):
+        # instance is request.user, possibly the cached copy; a full save
+        # would write back whatever else has changed since it was cached
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data) + ['updated_at'])
+        return instance
+
 
 class ChangePasswordSerializer(serializers.Serializer):
     """Serializer for changing password"""
@@ -231,17 +237,12 @@ class FarmerSimpleRegistrationSerializer(serializers.Serializer):
             password=random_password
         )
 
-        # Generate verification code
-        user.verification_code = generate_verification_code()
-        user.verification_code_created_at = timezone.now()
-        user.save()
-
         # Safely create FarmerProfile with defaults to avoid validation errors
         FarmerProfile.objects.get_or_create(
             user=user,
             defaults={
                 'farm_size': 0,
-                'primary_crop': 'Unknown',
+                'primary_crop': FarmerProfile.DEFAULT_PRIMARY_CROP,
                 'years_of_experience': 0,
                 'farming_type': 'subsistence',
                 'secondary_crops': [],
@@ -297,7 +298,6 @@ class FarmerSMSLoginVerifySerializer(serializers.Serializer):
         logger.info("🔐 OTP VERIFICATION")
         logger.info("=" * 70)
         logger.info(f"Phone: {phone_number}")
-        logger.info(f"OTP: {otp_code}")
         
         # Find user
         try:
@@ -312,31 +312,11 @@ class FarmerSMSLoginVerifySerializer(serializers.Serializer):
             logger.error(f"❌ Wrong role: {user.role}")
             raise serializers.ValidationError("SMS login only for farmers")
 
-        # Log stored OTP
-        logger.info(f"Stored OTP: '{user.verification_code}'")
-        logger.info(f"Provided OTP: '{otp_code}'")
-        logger.info(f"Match: {user.verification_code == otp_code}")
-        
-        # Check OTP match
-        if not user.verification_code or user.verification_code != otp_code:
-            logger.error("❌ OTP mismatch")
-            raise serializers.ValidationError("Invalid OTP code")
-
-        # Check expiration
-        if user.verification_code_created_at:
-            from django.utils import timezone
-            elapsed = timezone.now() - user.verification_code_created_at
-            age = elapsed.total_seconds()
-            logger.info(f"OTP age: {age} seconds")
-            
-            if age > 600:
-                logger.error("❌ OTP expired")
-                raise serializers.ValidationError("OTP has expired")
-            
-            logger.info(f"✅ OTP valid ({600-age:.0f}s remaining)")
-        else:
-            logger.error("❌ No OTP timestamp")
-            raise serializers.ValidationError("Invalid OTP state")
+        # Check OTP (attempts, expiry and one-time use are tracked by OTPService)
+        result = OTPService.verify(user, otp_code)
+        if result != 'valid':
+            logger.error(f"❌ OTP {result}")
+            raise serializers.ValidationError(OTP_ERRORS[result])
 
         logger.info("✅ All checks passed")
         logger.info("=" * 70)
@@ -344,6 +324,17 @@ class FarmerSMSLoginVerifySerializer(serializers.Serializer):
         data['user'] = user
         return data
 
+class FarmerImportSerializer(serializers.Serializer):
+    """CSV or XLSX of farmers to enrol (see apps.users.bulk_import)"""
+    file = serializers.FileField()
+    send_welcome_sms = serializers.BooleanField(default=True)
+
+    def validate_file(self, value):
+        if not value.name.lower().endswith(('.csv', '.xlsx')):
+            raise serializers.ValidationError('Upload a .csv or .xlsx file')
+        return value
+
+
 class OnboardingStatusSerializer(serializers.Serializer):
     """Serializer for checking user onboarding status"""
     has_profile_picture = serializers.BooleanField()
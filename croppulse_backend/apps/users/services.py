@@ -1,13 +1,34 @@
 """
 Business logic services for Users app
 """
+import hashlib
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from django.utils.module_loading import import_string
+from django.utils.text import slugify
+from django.core.cache import cache
 from django.utils import timezone
-from django.db.models import Q
+from django.db import connection, transaction
+from django.db.models import F, Q, Count, Min
 from typing import List, Optional, Dict
-from .models import User, Notification
-from core.utils import generate_verification_code
+from .models import (
+    User, FarmerProfile, FieldOfficerProfile, Notification, OutboundSMS, OutboxEvent,
+    OfficerFarmAssignment
+)
+from core.utils import (
+    generate_verification_code, chunk_list, month_start, add_months, truncate_text
+)
+from core.authentication import AuthUserCache
+from core.spatial import GridIndex, haversine_km
 from services.sms import sms_service
 from services.notifications import notification_service
+from services.message_catalog import message_catalog, sms_segments, RenderedMessage
+import numpy as np
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,65 +40,371 @@ class UserService:
     @staticmethod
     def send_verification_code(user: User) -> bool:
         """
-        Generate and send verification code to user.
-        Reuses existing code if it is still valid (<10 mins).
+        Queue a phone verification code for the user.
+        Reuses the existing code if it is still valid.
+        
+        Returns:
+            bool: True if an SMS was queued (False during the resend cooldown)
         """
-        now = timezone.now()
-        code_expired = True
+        return OTPService.issue(user, 'verification_code')['sent']
 
-        if user.verification_code_created_at:
-            elapsed = now - user.verification_code_created_at
-            if elapsed.total_seconds() < 600:  # 10 minutes
-                code_expired = False
+    @staticmethod
+    def send_login_otp(user: User) -> bool:
+        """Queue an OTP for passwordless login"""
+        return OTPService.issue(user, 'login_otp')['sent']
 
-        if code_expired or not user.verification_code:
-            user.verification_code = generate_verification_code()
-            user.verification_code_created_at = now
-            user.save(update_fields=['verification_code', 'verification_code_created_at'])
+    @staticmethod
+    def create_notification(
+        user: User,
+        notification_type: str,
+        title: str,
+        message: str,
+        priority: str = 'medium',
+        data: Optional[Dict] = None,
+        send_push: bool = True,
+        send_sms: bool = False
+    ) -> Notification:
+        """
+        Create a notification for a single user and deliver it
+        
+        Returns:
+            Notification instance
+        """
+        return UserService.deliver_notifications(
+            [user], notification_type, title, message,
+            priority, data, send_push, send_sms
+        )[0]
 
-        # Send via SMS
-        success = sms_service.send_verification_code(
-            str(user.phone_number),
-            user.verification_code
+    @staticmethod
+    def bulk_create_notifications(
+        users: List[User],
+        notification_type: str,
+        title: str,
+        message: str,
+        priority: str = 'medium',
+        data: Optional[Dict] = None,
+        send_push: bool = True,
+        send_sms: bool = False,
+        push_topics: Optional[List[str]] = None,
+        messages: Optional[Dict[str, RenderedMessage]] = None
+    ) -> int:
+        """
+        Create notifications for many users and deliver them.
+        With push_topics, push goes out as one FCM topic send per topic and
+        only users whose token is not (yet) subscribed get a multicast.
+        Otherwise push goes out as chunked FCM multicasts. Tokens FCM
+        reports as dead are pruned from the users table.
+        
+        Returns:
+            int: Number of notifications created
+        """
+        notifications = UserService.deliver_notifications(
+            list(users), notification_type, title, message,
+            priority, data, send_push, send_sms, push_topics,
+            messages=messages
         )
 
-        logger.info(f'Verification code sent to {user.phone_number}: {success}')
-        return success
+        logger.info(f'Created {len(notifications)} "{notification_type}" notifications')
+        return len(notifications)
 
     @staticmethod
-    def send_login_otp(user: User) -> bool:
-        """Send OTP for passwordless login"""
-        from django.utils import timezone
-        from core.utils import generate_verification_code
-        from services.sms import sms_service
-        import logging
+    def deliver_notifications(
+        users: List[User],
+        notification_type: str,
+        title: str,
+        message: str,
+        priority: str = 'medium',
+        data: Optional[Dict] = None,
+        send_push: bool = True,
+        send_sms: bool = False,
+        push_topics: Optional[List[str]] = None,
+        related_object_type: str = '',
+        related_object_id: Optional[int] = None,
+        messages: Optional[Dict[str, RenderedMessage]] = None
+    ) -> List[Notification]:
+        """
+        Deliver a notification to users and write their inbox rows.
+        Low/medium priority delivery is deferred to the digest flush
+        when a coalescing window is configured.
         
-        logger = logging.getLogger(__name__)
+        Args:
+            title, message: Text for users without a rendered message
+            messages: Pre-rendered text per User.language, from
+                      message_catalog.render_all(); each language's
+                      recipients share one push and one SMS body
         
-        now = timezone.now()
-        code_expired = True
+        Returns:
+            list: Created Notification instances with their delivery flags
+        """
+        if not users:
+            return []
+
+        data = data or {}
+        failed_tokens = set()
+        topic_user_ids = set()
+
+        # (title, message, sms, sms segments) per language, worked out once
+        default = (title, message, message, sms_segments(message)[1])
+        content = {}
+        for language in {user.language for user in users}:
+            rendered = (messages or {}).get(language)
+            content[language] = default if rendered is None else (
+                rendered.title, rendered.message, rendered.sms, rendered.sms_segments
+            )
+
+        push_users = [
+            user for user in users
+            if send_push and user.receive_push_notifications and user.fcm_token
+        ]
+        sms_users = [
+            user for user in users
+            if send_sms and user.receive_sms_notifications
+        ]
+        push_user_ids = {user.id for user in push_users}
+        sms_user_ids = {user.id for user in sms_users}
+
+        push_by_language = {}
+        for user in push_users:
+            push_by_language.setdefault(user.language, []).append(user)
 
-        # Check if existing OTP is still valid
-        if user.verification_code_created_at:
-            elapsed = now - user.verification_code_created_at
-            if elapsed.total_seconds() < 600:  # 10 minutes
-                code_expired = False
-                logger.info(f"♻️ Reusing valid OTP for {user.phone_number}")
+        # Topic broadcasts go out straight away, digest or not: subscribers
+        # outside `users` have no inbox row for a digest to pick up later
+        if push_topics:
+            for language, language_users in push_by_language.items():
+                push_title, push_message = content[language][:2]
+                sent_topics = {
+                    localized for localized in (
+                        notification_service.localized_topic(topic, language) for topic in push_topics
+                    )
+                    if notification_service.send_topic_notification(localized, push_title, push_message, data)
+                }
+                topic_user_ids |= {
+                    user.id for user in language_users
+                    if sent_topics.intersection(user.fcm_topics or [])
+                }
 
-        # Generate new OTP if needed
-        if code_expired or not user.verification_code:
-            user.verification_code = generate_verification_code()
-            user.verification_code_created_at = now
-            user.save(update_fields=['verification_code', 'verification_code_created_at'])
-            logger.info(f"🆕 Generated new OTP for {user.phone_number}")
+        if DigestService.should_buffer(priority):
+            notifications = [
+                Notification(
+                    user=user,
+                    type=notification_type,
+                    priority=priority,
+                    title=content[user.language][0],
+                    message=content[user.language][1],
+                    data=data,
+                    related_object_type=related_object_type,
+                    related_object_id=related_object_id,
+                    sent_via_push=user.id in topic_user_ids,
+                    digest_pending=(
+                        (user.id in push_user_ids and user.id not in topic_user_ids) or
+                        user.id in sms_user_ids
+                    ),
+                    digest_sms=user.id in sms_user_ids,
+                )
+                for user in users
+            ]
+            notifications = Notification.objects.bulk_create(notifications, batch_size=1000)
+            UnreadCounterService.increment([user.id for user in users])
+            return notifications
+
+        multicast_by_content = {}
+        for language, language_users in push_by_language.items():
+            # Languages that fall back to the same text share a multicast
+            multicast_by_content.setdefault(tuple(content[language][:2]), []).extend(
+                user.fcm_token for user in language_users
+                if user.id not in topic_user_ids
+            )
 
-        # Send SMS
-        message = f'Your CropPulse Africa login code is: {user.verification_code}. Valid for 10 minutes.'
-        success = sms_service.send_sms(str(user.phone_number), message)
+        for (push_title, push_message), multicast_tokens in multicast_by_content.items():
+            if multicast_tokens:
+                result = notification_service.send_multicast_notification(
+                    multicast_tokens, push_title, push_message, data
+                )
+                failed_tokens |= set(result['failed_tokens'])
+                UserService.prune_fcm_tokens(result['invalid_tokens'])
+
+        if sms_users:
+            SMSOutboxService.enqueue_bulk([
+                OutboundSMS(
+                    user=user,
+                    phone_number=str(user.phone_number),
+                    message=content[user.language][2],
+                    segments=content[user.language][3],
+                    priority=OutboundSMS.PRIORITY_ALERT,
+                    related_object_type=related_object_type,
+                    related_object_id=related_object_id,
+                )
+                for user in sms_users
+            ])
+
+        notifications = []
+        for user in users:
+            sent_via_push = user.id in topic_user_ids or (
+                user.id in push_user_ids and user.fcm_token not in failed_tokens
+            )
 
-        logger.info(f"📤 OTP: {user.verification_code} - SMS sent: {success}")
+            notifications.append(Notification(
+                user=user,
+                type=notification_type,
+                priority=priority,
+                title=content[user.language][0],
+                message=content[user.language][1],
+                data=data,
+                related_object_type=related_object_type,
+                related_object_id=related_object_id,
+                sent_via_push=sent_via_push,
+            ))
+
+        notifications = Notification.objects.bulk_create(notifications, batch_size=1000)
+        # sent_via_sms is set by the SMS workers once the message is delivered
+        for notification in notifications:
+            notification.sms_queued = notification.user_id in sms_user_ids
+        UnreadCounterService.increment([user.id for user in users])
+        return notifications
+
+    @staticmethod
+    def cleanup_old_notifications(days: int = 30) -> Dict:
+        """
+        Reclaim read notifications older than `days`
+        
+        Returns:
+            dict: Rows reclaimed, partitions retired and time taken
+        """
+        return NotificationRetentionService.cleanup(days)
+
+    @staticmethod
+    def prune_fcm_tokens(tokens: List[str]) -> int:
+        """
+        Clear FCM tokens that FCM reported as unregistered/invalid
         
-        return success
+        Returns:
+            int: Number of users whose token was cleared
+        """
+        pruned = 0
+        for chunk in chunk_list(list(set(tokens)), 500):
+            user_ids = list(User.objects.filter(fcm_token__in=chunk).values_list('id', flat=True))
+            pruned += User.objects.filter(id__in=user_ids, fcm_token__in=chunk).update(fcm_token='', fcm_topics=[])
+            # Queryset updates skip the save signals that drop cached users
+            AuthUserCache.invalidate_many(user_ids)
+
+        if pruned:
+            logger.info(f'Pruned {pruned} dead FCM tokens')
+        return pruned
+
+    @staticmethod
+    def get_push_topics(user: User) -> List[str]:
+        """
+        FCM topics a user's device should be subscribed to,
+        derived from their county, subcounty and primary crop (in the
+        variant for their language)
+        """
+        if not (user.is_active and user.receive_push_notifications and user.fcm_token):
+            return []
+
+        topics = []
+        if user.county:
+            topics.append(notification_service.topic_name('county', user.county))
+            if user.subcounty:
+                topics.append(notification_service.topic_name('subcounty', user.county, user.subcounty))
+
+        if user.role == 'farmer' and hasattr(user, 'farmer_profile'):
+            crop = user.farmer_profile.primary_crop
+            if crop:
+                topics.append(notification_service.topic_name('crop', crop))
+
+        return [notification_service.localized_topic(topic, user.language) for topic in topics]
+
+    @staticmethod
+    def sync_push_topics(user: User, previous_token: str = '') -> Dict:
+        """
+        Bring the user's FCM topic subscriptions in line with their profile
+        
+        Args:
+            user: User instance
+            previous_token: Token the stored subscriptions belong to,
+                            if the device token just changed
+            
+        Returns:
+            dict: Topics subscribed and unsubscribed
+        """
+        desired = UserService.get_push_topics(user)
+        current = list(user.fcm_topics or [])
+
+        # Subscriptions belong to the old token; drop them all
+        if previous_token and previous_token != user.fcm_token:
+            for topic in current:
+                notification_service.unsubscribe_from_topic([previous_token], topic)
+            current = []
+
+        to_remove = [topic for topic in current if topic not in desired]
+        to_add = [topic for topic in desired if topic not in current]
+
+        if user.fcm_token:
+            for topic in to_remove:
+                notification_service.unsubscribe_from_topic([user.fcm_token], topic)
+
+        subscribed = [topic for topic in current if topic not in to_remove]
+        for topic in to_add:
+            result = notification_service.subscribe_to_topic([user.fcm_token], topic)
+            if result['success_count']:
+                subscribed.append(topic)
+
+        if subscribed != list(user.fcm_topics or []):
+            user.fcm_topics = subscribed
+            user.save(update_fields=['fcm_topics'])
+
+        return {'subscribed': to_add, 'unsubscribed': to_remove}
+
+    @staticmethod
+    def backfill_push_topics(batch_size: int = 1000) -> int:
+        """
+        Subscribe every token that has no recorded topics, grouping
+        tokens per topic so each FCM call covers up to 1000 devices
+        
+        Returns:
+            int: Number of users updated
+        """
+        users = (
+            User.objects
+            .filter(is_active=True, receive_push_notifications=True, fcm_topics=[])
+            .exclude(fcm_token='')
+            .select_related('farmer_profile')
+        )
+
+        updated = 0
+        batch = []
+        for user in users.iterator(chunk_size=batch_size):
+            batch.append(user)
+            if len(batch) >= batch_size:
+                updated += UserService._subscribe_topic_batch(batch)
+                batch = []
+        if batch:
+            updated += UserService._subscribe_topic_batch(batch)
+
+        logger.info(f'Backfilled push topics for {updated} users')
+        return updated
+
+    @staticmethod
+    def _subscribe_topic_batch(users: List[User]) -> int:
+        """Subscribe a batch of users to their topics, one FCM call per topic"""
+        tokens_by_topic = {}
+        for user in users:
+            user.fcm_topics = UserService.get_push_topics(user)
+            for topic in user.fcm_topics:
+                tokens_by_topic.setdefault(topic, []).append(user.fcm_token)
+
+        failed = set()
+        for topic, tokens in tokens_by_topic.items():
+            result = notification_service.subscribe_to_topic(tokens, topic)
+            if not result['success_count']:
+                failed.add(topic)
+
+        for user in users:
+            user.fcm_topics = [topic for topic in user.fcm_topics if topic not in failed]
+
+        User.objects.bulk_update(users, ['fcm_topics'])
+        AuthUserCache.invalidate_many([user.id for user in users])
+        return len(users)
 
     @staticmethod
     def get_onboarding_status(user: User) -> Dict:
@@ -128,11 +455,9 @@ class UserService:
     @staticmethod
     def get_farmer_dashboard_data(user: User) -> Dict:
         """
-        Get simplified dashboard data for farmers.
+        Get simplified dashboard data for farmers, assembled from cached
+        fragments (see DashboardFragmentService).
         """
-        from apps.alerts.models import Alert
-        from apps.weather.models import WeatherData
-
         data = {
             'user': {
                 'full_name': user.full_name,
@@ -155,41 +480,21 @@ class UserService:
             }
 
         if user.county:
-            now = timezone.now()
-            data['active_alerts'] = Alert.objects.filter(
-                status='active',
-                counties__contains=[user.county],
-                start_time__lte=now,
-                end_time__gte=now
-            ).count()
-
-            recent_weather = WeatherData.objects.filter(
-                county__iexact=user.county
-            ).order_by('-recorded_at').first()
-
-            if recent_weather:
-                data['recent_weather'] = {
-                    'temperature': float(recent_weather.temperature),
-                    'condition': recent_weather.condition,
-                    'rainfall': float(recent_weather.rainfall),
-                    'recorded_at': recent_weather.recorded_at.isoformat()
-                }
+            data['active_alerts'] = DashboardFragmentService.county_active_alerts(user.county)
+            data['recent_weather'] = DashboardFragmentService.county_weather(user.county)
 
-        data['unread_notifications'] = Notification.objects.filter(
-            user=user,
-            is_read=False
-        ).count()
+        data['unread_notifications'] = UnreadCounterService.get(user.id)
 
         return data
 
     @staticmethod
     def get_field_officer_dashboard_data(user: User) -> Dict:
         """
-        Get dashboard data for field officers.
+        Get dashboard data for field officers. Observation counts come
+        from cached counters (see ObservationCounterService).
         """
-        from apps.observations.models import FarmObservation
+        from apps.observations.services import ObservationCounterService
         from apps.alerts.models import Alert
-        from datetime import date
 
         data = {
             'user': {
@@ -209,10 +514,7 @@ class UserService:
 
         assigned_areas = data['user']['assigned_areas'] or [user.county]
 
-        data['pending_verifications'] = FarmObservation.objects.filter(
-            status='pending',
-            county__in=assigned_areas
-        ).count()
+        data['pending_verifications'] = ObservationCounterService.status_count('pending', assigned_areas)
 
         now = timezone.now()
         data['active_alerts'] = Alert.objects.filter(
@@ -221,8 +523,1473 @@ class UserService:
             end_time__gte=now
         ).count()
 
-        data['observations_today'] = FarmObservation.objects.filter(
-            created_at__date=date.today()
-        ).count()
+        data['observations_today'] = ObservationCounterService.created_on(timezone.localdate())
 
         return data
+
+
+class SMSOutboxService:
+    """
+    SMS outbox operations.
+    Messages are queued in the sms_outbox table and drained by dedicated
+    Celery workers: OTPs on the 'otp' queue, alerts and bulk on 'bulk'.
+    """
+
+    QUEUE_PRIORITIES = {
+        'otp': [OutboundSMS.PRIORITY_OTP],
+        'bulk': [OutboundSMS.PRIORITY_ALERT, OutboundSMS.PRIORITY_BULK],
+    }
+
+    CELERY_QUEUES = {
+        'otp': 'sms_otp',
+        'bulk': 'sms_bulk',
+    }
+
+    METRICS_TIMEOUT = 60 * 60 * 24
+
+    @staticmethod
+    def queue_for_priority(priority: int) -> str:
+        """Outbox queue that drains messages of the given priority"""
+        return 'otp' if priority == OutboundSMS.PRIORITY_OTP else 'bulk'
+
+    @staticmethod
+    def enqueue(
+        phone_number: str,
+        message: str,
+        priority: int = OutboundSMS.PRIORITY_BULK,
+        user: Optional[User] = None,
+        related_object_type: str = '',
+        related_object_id: Optional[int] = None
+    ) -> OutboundSMS:
+        """
+        Queue a single SMS for delivery by the SMS workers
+        
+        Returns:
+            OutboundSMS instance
+        """
+        sms = OutboundSMS.objects.create(
+            user=user,
+            phone_number=phone_number,
+            message=message,
+            segments=sms_segments(message)[1],
+            priority=priority,
+            related_object_type=related_object_type,
+            related_object_id=related_object_id,
+        )
+        SMSOutboxService.schedule_drain(SMSOutboxService.queue_for_priority(priority))
+        return sms
+
+    @staticmethod
+    def enqueue_bulk(messages: List[OutboundSMS]) -> int:
+        """
+        Queue many SMS in one insert
+        
+        Returns:
+            int: Number of messages queued
+        """
+        if not messages:
+            return 0
+
+        # Fan-outs share a few distinct bodies; measure each one once
+        measured = {}
+        for sms in messages:
+            if sms.segments is None:
+                if sms.message not in measured:
+                    measured[sms.message] = sms_segments(sms.message)[1]
+                sms.segments = measured[sms.message]
+
+        OutboundSMS.objects.bulk_create(messages, batch_size=1000)
+
+        for queue in {SMSOutboxService.queue_for_priority(m.priority) for m in messages}:
+            SMSOutboxService.schedule_drain(queue)
+
+        logger.info(f'Queued {len(messages)} SMS')
+        return len(messages)
+
+    @staticmethod
+    def schedule_drain(queue: str):
+        """Wake the SMS workers for a queue once the current transaction commits"""
+        from .tasks import drain_sms_outbox
+
+        transaction.on_commit(lambda: drain_sms_outbox.apply_async(
+            args=[queue],
+            queue=SMSOutboxService.CELERY_QUEUES[queue]
+        ))
+
+    @staticmethod
+    def drain(queue: str, batch_size: Optional[int] = None) -> Dict:
+        """
+        Claim a batch of due messages and send them with bounded concurrency.
+        Failed sends are retried with exponential backoff; messages that run
+        out of attempts (or fail permanently) go to the dead letter state.
+        
+        Args:
+            queue: 'otp' or 'bulk'
+            batch_size: Max messages to claim (defaults to SMS_BATCH_SIZE)
+            
+        Returns:
+            dict: claimed, sent, retried and dead counts plus elapsed seconds
+        """
+        batch_size = batch_size or settings.SMS_BATCH_SIZE
+        started = time.perf_counter()
+        now = timezone.now()
+
+        # Recover messages stuck in 'sending' by a worker that died mid-batch
+        OutboundSMS.objects.filter(
+            status='sending',
+            next_attempt_at__lte=now
+        ).update(status='queued')
+
+        with transaction.atomic():
+            ids = list(
+                OutboundSMS.objects
+                .select_for_update(skip_locked=True)
+                .filter(
+                    status='queued',
+                    priority__in=SMSOutboxService.QUEUE_PRIORITIES[queue],
+                    next_attempt_at__lte=now
+                )
+                .order_by('priority', 'next_attempt_at')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            OutboundSMS.objects.filter(id__in=ids).update(
+                status='sending',
+                next_attempt_at=now + timedelta(seconds=settings.SMS_SEND_LEASE_SECONDS)
+            )
+
+        stats = {'claimed': len(ids), 'sent': 0, 'retried': 0, 'dead': 0}
+        if not ids:
+            stats['elapsed'] = round(time.perf_counter() - started, 3)
+            return stats
+
+        messages = list(OutboundSMS.objects.filter(id__in=ids))
+
+        with ThreadPoolExecutor(max_workers=settings.SMS_MAX_CONCURRENCY) as executor:
+            results = list(executor.map(
+                lambda sms: sms_service.deliver(sms.phone_number, sms.message, sms.segments or 1),
+                messages
+            ))
+
+        now = timezone.now()
+        for sms, result in zip(messages, results):
+            sms.attempts += 1
+
+            if result['success']:
+                sms.status = 'sent'
+                sms.sent_at = now
+                sms.provider_sid = result['sid']
+                sms.last_error = ''
+                stats['sent'] += 1
+            elif result['retryable'] and sms.attempts < settings.SMS_MAX_ATTEMPTS:
+                backoff = settings.SMS_RETRY_BACKOFF_SECONDS * 2 ** (sms.attempts - 1)
+                sms.status = 'queued'
+                sms.next_attempt_at = now + timedelta(seconds=min(backoff, 3600))
+                sms.last_error = result['error']
+                stats['retried'] += 1
+            else:
+                sms.status = 'dead'
+                sms.last_error = result['error']
+                stats['dead'] += 1
+
+        OutboundSMS.objects.bulk_update(
+            messages,
+            ['status', 'attempts', 'next_attempt_at', 'sent_at', 'provider_sid', 'last_error']
+        )
+        SMSOutboxService._mark_notifications_sent([sms for sms in messages if sms.status == 'sent'])
+
+        SMSOutboxService._record_metrics(stats)
+        stats['elapsed'] = round(time.perf_counter() - started, 3)
+
+        logger.info(
+            f'SMS outbox ({queue}): sent {stats["sent"]}, retried {stats["retried"]}, '
+            f'dead {stats["dead"]} in {stats["elapsed"]}s'
+        )
+        return stats
+
+    @staticmethod
+    def _mark_notifications_sent(messages: List[OutboundSMS]) -> int:
+        """
+        Flag the inbox notifications behind delivered SMS as sent_via_sms.
+        Alert SMS match on their related object; a digest SMS covers the
+        user's digest_sms notifications created before it was queued.
+
+        Returns:
+            int: Notifications updated
+        """
+        conditions = []
+        for sms in messages:
+            if sms.user_id is None:
+                continue
+            if sms.related_object_type == 'digest':
+                conditions.append(Q(user_id=sms.user_id, digest_sms=True, created_at__lte=sms.created_at))
+            elif sms.related_object_type and sms.related_object_id is not None:
+                conditions.append(Q(
+                    user_id=sms.user_id,
+                    related_object_type=sms.related_object_type,
+                    related_object_id=sms.related_object_id,
+                ))
+
+        updated = 0
+        for chunk in chunk_list(conditions, 500):
+            query = Q()
+            for condition in chunk:
+                query |= condition
+            updated += Notification.objects.filter(query, sent_via_sms=False).update(sent_via_sms=True)
+        return updated
+
+    @staticmethod
+    def _record_metrics(stats: Dict):
+        """Add drain outcomes to the per-minute throughput counters"""
+        minute = int(time.time() // 60)
+        for outcome in ('sent', 'retried', 'dead'):
+            if not stats[outcome]:
+                continue
+            key = f'sms:metrics:{minute}:{outcome}'
+            cache.add(key, 0, SMSOutboxService.METRICS_TIMEOUT)
+            try:
+                cache.incr(key, stats[outcome])
+            except ValueError:
+                cache.set(key, stats[outcome], SMSOutboxService.METRICS_TIMEOUT)
+
+    @staticmethod
+    def get_metrics(minutes: int = 15) -> Dict:
+        """
+        Get SMS throughput and queue depth
+        
+        Args:
+            minutes: Number of most recent minutes to report
+            
+        Returns:
+            dict: Per-minute sent/retried/dead counts, totals and queue depth
+        """
+        current = int(time.time() // 60)
+        window = range(current - minutes + 1, current + 1)
+        keys = [
+            f'sms:metrics:{minute}:{outcome}'
+            for minute in window
+            for outcome in ('sent', 'retried', 'dead')
+        ]
+        counters = cache.get_many(keys)
+
+        per_minute = []
+        for minute in window:
+            per_minute.append({
+                'minute': datetime.fromtimestamp(
+                    minute * 60, tz=timezone.get_current_timezone()
+                ).isoformat(),
+                'sent': counters.get(f'sms:metrics:{minute}:sent', 0),
+                'retried': counters.get(f'sms:metrics:{minute}:retried', 0),
+                'dead': counters.get(f'sms:metrics:{minute}:dead', 0),
+            })
+
+        total_sent = sum(m['sent'] for m in per_minute)
+        depth = (
+            OutboundSMS.objects
+            .filter(status__in=['queued', 'sending'])
+            .values('priority')
+            .annotate(count=Count('id'))
+        )
+        labels = dict(OutboundSMS.PRIORITY_CHOICES)
+
+        return {
+            'period_minutes': minutes,
+            'sent': total_sent,
+            'sent_per_second': round(total_sent / (minutes * 60), 3),
+            'retried': sum(m['retried'] for m in per_minute),
+            'dead': sum(m['dead'] for m in per_minute),
+            'queue_depth': {labels[row['priority']]: row['count'] for row in depth},
+            'dead_letter_total': OutboundSMS.objects.filter(status='dead').count(),
+            'per_minute': per_minute,
+        }
+
+
+class UnreadCounterService:
+    """
+    Per-user unread notification counters kept in the cache so inbox
+    badges never hit the notifications table. Counters are adjusted by
+    the writers, seeded from the DB on a miss and reconciled periodically.
+    """
+    
+    RECONCILE_BATCH_SIZE = 1000
+    
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f'notifications:unread:{user_id}'
+    
+    @staticmethod
+    def get(user_id: int) -> int:
+        """Unread count for a user, seeded from the DB on a cache miss"""
+        key = UnreadCounterService._key(user_id)
+        count = cache.get(key)
+        if count is None:
+            count = Notification.objects.filter(user_id=user_id, is_read=False).count()
+            cache.add(key, count, settings.NOTIFICATION_UNREAD_CACHE_TIMEOUT)
+        return max(count, 0)
+    
+    @staticmethod
+    def increment(user_ids: List[int], amount: int = 1):
+        """
+        Bump the counters that are already cached. Missing counters are
+        left alone; the next read seeds them from the DB.
+        """
+        keys = [UnreadCounterService._key(user_id) for user_id in user_ids]
+        for key in cache.get_many(keys):
+            try:
+                cache.incr(key, amount)
+            except ValueError:
+                pass  # Expired between get_many and incr
+    
+    @staticmethod
+    def decrement(user_id: int, amount: int = 1):
+        """Lower a user's counter after notifications are marked read"""
+        if amount <= 0:
+            return
+        key = UnreadCounterService._key(user_id)
+        try:
+            if cache.decr(key, amount) < 0:
+                cache.delete(key)
+        except ValueError:
+            pass
+    
+    @staticmethod
+    def mark_read(user: User, notification_ids: Optional[List[int]] = None) -> int:
+        """
+        Mark a user's unread notifications as read and adjust the counter
+        by the rows actually changed, so repeated calls don't double count
+        
+        Args:
+            user: Notification owner
+            notification_ids: Specific notifications, or all unread if None
+            
+        Returns:
+            int: Number of notifications marked read
+        """
+        queryset = Notification.objects.filter(user=user, is_read=False)
+        if notification_ids is not None:
+            queryset = queryset.filter(id__in=notification_ids)
+        
+        updated = queryset.update(is_read=True, read_at=timezone.now())
+        UnreadCounterService.decrement(user.id, updated)
+        return updated
+    
+    @staticmethod
+    def reconcile(hours: int = 2) -> int:
+        """
+        Overwrite the cached counters of users whose inbox changed in the
+        last `hours` with a fresh count from the DB
+        
+        Returns:
+            int: Number of counters refreshed
+        """
+        since = timezone.now() - timedelta(hours=hours)
+        user_ids = list(
+            Notification.objects
+            .filter(Q(created_at__gte=since) | Q(read_at__gte=since))
+            .values_list('user_id', flat=True)
+            .distinct()
+        )
+        
+        for chunk in chunk_list(user_ids, UnreadCounterService.RECONCILE_BATCH_SIZE):
+            counts = dict.fromkeys(chunk, 0)
+            counts.update(
+                Notification.objects
+                .filter(user_id__in=chunk, is_read=False)
+                .values('user_id')
+                .annotate(unread=Count('id'))
+                .values_list('user_id', 'unread')
+            )
+            cache.set_many(
+                {UnreadCounterService._key(user_id): count for user_id, count in counts.items()},
+                settings.NOTIFICATION_UNREAD_CACHE_TIMEOUT
+            )
+        
+        logger.info(f'Reconciled unread counters for {len(user_ids)} users')
+        return len(user_ids)
+
+
+class NotificationRetentionService:
+    """
+    Retention for the notifications table. On Postgres the table is range
+    partitioned by month (migration 0006): expired months are detached and
+    dropped or archived whole. Rows outside monthly partitions, and every
+    row on other databases, are deleted in small batches.
+    """
+    
+    TABLE = 'notifications'
+    DEFAULT_PARTITION = 'notifications_default'
+    PARTITION_PREFIX = 'notifications_p'
+    ARCHIVE_PREFIX = 'notifications_archive_'
+    
+    @staticmethod
+    def is_partitioned() -> bool:
+        """Whether the notifications table is a partitioned Postgres table"""
+        if connection.vendor != 'postgresql':
+            return False
+        
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)',
+                [NotificationRetentionService.TABLE]
+            )
+            return cursor.fetchone() is not None
+    
+    @staticmethod
+    def list_partitions() -> Dict[str, date]:
+        """Monthly partitions currently attached, mapped to their month"""
+        prefix = NotificationRetentionService.PARTITION_PREFIX
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+                'WHERE i.inhparent = to_regclass(%s)',
+                [NotificationRetentionService.TABLE]
+            )
+            names = [row[0] for row in cursor.fetchall()]
+        
+        return {
+            name: datetime.strptime(name[len(prefix):], '%Y%m').date()
+            for name in names if name.startswith(prefix)
+        }
+    
+    @staticmethod
+    def list_detached() -> List[str]:
+        """
+        Monthly partitions that were detached but never dropped or archived,
+        e.g. because the worker died while retiring them. They are no longer
+        in pg_inherits, so list_partitions does not see them.
+        """
+        prefix = NotificationRetentionService.PARTITION_PREFIX
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname FROM pg_class c "
+                "WHERE c.relkind = 'r' AND NOT c.relispartition "
+                "AND c.relnamespace = current_schema()::regnamespace AND c.relname LIKE %s",
+                [prefix.replace('_', '\\_') + '%']
+            )
+            names = [row[0] for row in cursor.fetchall()]
+        
+        return sorted(name for name in names if name[len(prefix):].isdigit())
+    
+    @staticmethod
+    def ensure_partitions(months_ahead: int = 3) -> List[str]:
+        """
+        Create monthly partitions up to `months_ahead` months from now
+        
+        Returns:
+            list: Names of partitions created
+        """
+        if not NotificationRetentionService.is_partitioned():
+            return []
+        
+        table = NotificationRetentionService.TABLE
+        existing = NotificationRetentionService.list_partitions()
+        this_month = month_start(timezone.now().date())
+        created = []
+        
+        for offset in range(months_ahead + 1):
+            month = add_months(this_month, offset)
+            name = f'{NotificationRetentionService.PARTITION_PREFIX}{month:%Y%m}'
+            if name in existing:
+                continue
+            
+            try:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute(
+                        f'CREATE TABLE {name} PARTITION OF {table} '
+                        f"FOR VALUES FROM ('{month.isoformat()}') "
+                        f"TO ('{add_months(month, 1).isoformat()}')"
+                    )
+                created.append(name)
+            except Exception as e:
+                # Usually rows for that month already landed in the default partition
+                logger.error(f'Could not create partition {name}: {str(e)}')
+        
+        if created:
+            logger.info(f'Created notification partitions: {", ".join(created)}')
+        return created
+    
+    @staticmethod
+    def cleanup(days: int = 30) -> Dict:
+        """
+        Retire read notifications older than `days`: whole expired
+        partitions first, then batched deletes for whatever is left
+        
+        Returns:
+            dict: Rows reclaimed, partitions retired and time taken
+        """
+        started = time.monotonic()
+        cutoff = timezone.now() - timedelta(days=days)
+        archive = settings.NOTIFICATION_ARCHIVE_PARTITIONS
+        stats = {
+            'rows_reclaimed': 0,
+            'partitions_dropped': [],
+            'partitions_archived': [],
+        }
+        
+        table = NotificationRetentionService.TABLE
+        if NotificationRetentionService.is_partitioned():
+            # Finish partitions an earlier run detached but failed to retire
+            expired = NotificationRetentionService.list_detached()
+            partitions = NotificationRetentionService.list_partitions()
+            for name, month in sorted(partitions.items(), key=lambda item: item[1]):
+                if add_months(month, 1) > cutoff.date():
+                    continue
+                if NotificationRetentionService._detach(name):
+                    expired.append(name)
+            
+            for name in expired:
+                try:
+                    stats['rows_reclaimed'] += NotificationRetentionService._retire_partition(name, archive)
+                except Exception as e:
+                    logger.error(f'Could not retire detached partition {name}, will retry next run: {str(e)}')
+                    continue
+                stats['partitions_archived' if archive else 'partitions_dropped'].append(name)
+            table = NotificationRetentionService.DEFAULT_PARTITION
+        
+        stats['rows_reclaimed'] += NotificationRetentionService._delete_in_batches(table, cutoff)
+        stats['duration_ms'] = int((time.monotonic() - started) * 1000)
+        
+        logger.info(
+            f'Notification retention reclaimed {stats["rows_reclaimed"]} rows in '
+            f'{stats["duration_ms"]}ms (dropped: {len(stats["partitions_dropped"])}, '
+            f'archived: {len(stats["partitions_archived"])})'
+        )
+        return stats
+    
+    @staticmethod
+    def _retire_partition(name: str, archive: bool) -> int:
+        """
+        Drop or archive a partition that _detach has taken out of the table.
+        Unread rows are first moved back into the table in batches (landing
+        in the default partition) so nobody loses an unread notification;
+        they cannot be moved before the detach, since inserts for the
+        partition's month route straight back into it while it is attached.
+        
+        Returns:
+            int: Read rows reclaimed
+        """
+        table = NotificationRetentionService.TABLE
+        batch_size = settings.NOTIFICATION_CLEANUP_BATCH_SIZE
+        
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f'WITH moved AS (DELETE FROM {name} WHERE id IN ('
+                    f'SELECT id FROM {name} WHERE NOT is_read LIMIT %s) RETURNING *) '
+                    f'INSERT INTO {table} SELECT * FROM moved',
+                    [batch_size]
+                )
+                moved = cursor.rowcount
+            if moved < batch_size:
+                break
+        
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {name}')
+            reclaimed = cursor.fetchone()[0]
+            
+            if archive:
+                suffix = name[len(NotificationRetentionService.PARTITION_PREFIX):]
+                cursor.execute(
+                    f'ALTER TABLE {name} RENAME TO {NotificationRetentionService.ARCHIVE_PREFIX}{suffix}'
+                )
+            else:
+                cursor.execute(f'DROP TABLE {name}')
+        
+        return reclaimed
+    
+    @staticmethod
+    def _detach(name: str) -> bool:
+        """
+        Detach a partition on its own, so the parent table is only locked
+        for the detach itself. Migration 0006 always creates a default
+        partition, which rules out DETACH ... CONCURRENTLY, so this is a
+        plain DETACH that gives up after NOTIFICATION_DETACH_LOCK_TIMEOUT
+        rather than queue behind long queries with every later query
+        queued behind it.
+        
+        Returns:
+            bool: True if the partition is now detached
+        """
+        table = NotificationRetentionService.TABLE
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT set_config(%s, %s, true)',
+                    ['lock_timeout', settings.NOTIFICATION_DETACH_LOCK_TIMEOUT]
+                )
+                cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {name}')
+        except Exception as e:
+            logger.warning(f'Could not detach partition {name}, will retry next run: {str(e)}')
+            return False
+        
+        return True
+    
+    @staticmethod
+    def _delete_in_batches(table: str, cutoff: datetime) -> int:
+        """
+        Delete old read rows a batch at a time, each in its own short
+        transaction, so no single DELETE holds locks for long
+        """
+        batch_size = settings.NOTIFICATION_CLEANUP_BATCH_SIZE
+        cutoff_value = connection.ops.adapt_datetimefield_value(cutoff)
+        deleted = 0
+        
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {table} WHERE id IN ('
+                    f'SELECT id FROM {table} WHERE is_read = %s AND created_at < %s LIMIT %s)',
+                    [True, cutoff_value, batch_size]
+                )
+                count = cursor.rowcount
+            
+            deleted += count
+            if count < batch_size:
+                break
+        
+        return deleted
+
+
+class DigestService:
+    """
+    Coalesces low/medium priority notifications per user. Inbox rows are
+    written straight away; push and SMS are held and merged into a single
+    digest once the user's oldest pending notification is a window old.
+    """
+    
+    SMS_LENGTH = 160
+    
+    @staticmethod
+    def should_buffer(priority: str) -> bool:
+        return (
+            settings.NOTIFICATION_DIGEST_WINDOW_SECONDS > 0 and
+            priority in settings.NOTIFICATION_DIGEST_PRIORITIES
+        )
+    
+    @staticmethod
+    def build_digest(notifications: List[Notification], language: str = 'en') -> Dict:
+        """Title and body for a user's digest; a lone notification goes out as-is"""
+        if len(notifications) == 1:
+            return {'title': notifications[0].title, 'message': notifications[0].message}
+        
+        digest = message_catalog.render(
+            'digest', language,
+            count=len(notifications),
+            titles='; '.join(notification.title for notification in notifications)
+        )
+        return {'title': digest.title, 'message': digest.message}
+    
+    @staticmethod
+    def flush(batch_size: int = 1000) -> Dict:
+        """
+        Send digests to users whose window has elapsed
+        
+        Returns:
+            dict: Users flushed, notifications merged and provider calls made
+        """
+        cutoff = timezone.now() - timedelta(seconds=settings.NOTIFICATION_DIGEST_WINDOW_SECONDS)
+        due_user_ids = list(
+            Notification.objects
+            .filter(digest_pending=True)
+            .values('user_id')
+            .annotate(oldest=Min('created_at'))
+            .filter(oldest__lte=cutoff)
+            .values_list('user_id', flat=True)[:batch_size]
+        )
+        stats = {'users': 0, 'notifications': 0, 'push_sent': 0, 'sms_queued': 0}
+        if not due_user_ids:
+            return stats
+        
+        with transaction.atomic():
+            pending = list(
+                Notification.objects
+                .select_for_update(skip_locked=True, of=('self',))
+                .filter(user_id__in=due_user_ids, digest_pending=True)
+                .select_related('user')
+                .order_by('created_at', 'id')
+            )
+            if not pending:
+                return stats
+            Notification.objects.filter(id__in=[n.id for n in pending]).update(digest_pending=False)
+        
+        by_user = {}
+        for notification in pending:
+            by_user.setdefault(notification.user_id, []).append(notification)
+        
+        # Users whose digests read the same share one multicast
+        push_groups = {}
+        sms_messages = []
+        for notifications in by_user.values():
+            user = notifications[0].user
+            # Notifications a topic broadcast already delivered stay out of the push
+            push_notifications = [n for n in notifications if not n.sent_via_push]
+            
+            if push_notifications and user.receive_push_notifications and user.fcm_token:
+                digest = DigestService.build_digest(push_notifications, user.language)
+                key = (digest['title'], digest['message'])
+                push_groups.setdefault(key, []).append((user, push_notifications))
+            
+            sms_notifications = [n for n in notifications if n.digest_sms]
+            if sms_notifications and user.receive_sms_notifications:
+                sms_messages.append(OutboundSMS(
+                    user=user,
+                    phone_number=str(user.phone_number),
+                    message=truncate_text(
+                        DigestService.build_digest(sms_notifications, user.language)['message'],
+                        DigestService.SMS_LENGTH
+                    ),
+                    priority=OutboundSMS.PRIORITY_BULK,
+                    related_object_type='digest',
+                ))
+        
+        pushed_ids = []
+        for (title, message), recipients in push_groups.items():
+            result = notification_service.send_multicast_notification(
+                [user.fcm_token for user, _ in recipients], title, message, {'type': 'digest'}
+            )
+            failed = set(result['failed_tokens'])
+            UserService.prune_fcm_tokens(result['invalid_tokens'])
+            stats['push_sent'] += result['success_count']
+            for user, notifications in recipients:
+                if user.fcm_token not in failed:
+                    pushed_ids.extend(n.id for n in notifications)
+        
+        if sms_messages:
+            SMSOutboxService.enqueue_bulk(sms_messages)
+            stats['sms_queued'] = len(sms_messages)
+        
+        for chunk in chunk_list(pushed_ids, 1000):
+            Notification.objects.filter(id__in=chunk).update(sent_via_push=True)
+        
+        stats['users'] = len(by_user)
+        stats['notifications'] = len(pending)
+        logger.info(
+            f'Flushed digests for {stats["users"]} users covering '
+            f'{stats["notifications"]} notifications'
+        )
+        return stats
+
+
+class OutboxLeaseLost(Exception):
+    """Another worker took over an outbox event while its handler ran"""
+
+
+class OutboxService:
+    """
+    Transactional outbox. Writers call publish() inside the transaction
+    that saves the domain row; once it commits, the relay hands claimed
+    events to Celery in batches. A worker claims an event with a lease
+    token and runs the handler in one transaction with the flip to 'done',
+    which only lands if it still holds the lease, so the handler's writes
+    are committed exactly once. Calls a handler makes to outside services
+    are not covered; events whose lease runs out are retried.
+    """
+    
+    HANDLERS = {
+        'alerts.alert_created': 'apps.alerts.services.AlertService.handle_alert_created',
+        'observations.pest_report_created': 'apps.observations.services.ObservationService.handle_pest_report_created',
+        'weather.advisory_created': 'apps.weather.services.WeatherService.handle_advisory_created',
+    }
+    
+    @staticmethod
+    def get_handler(event_type: str):
+        """Resolve a 'module.Class.method' handler path"""
+        class_path, method = OutboxService.HANDLERS[event_type].rsplit('.', 1)
+        return getattr(import_string(class_path), method)
+    
+    @staticmethod
+    def publish(event_type: str, payload: Dict) -> OutboxEvent:
+        """
+        Record an event in the current transaction and wake the relay
+        once it commits
+        
+        Args:
+            event_type: Key in HANDLERS
+            payload: JSON-serialisable handler arguments
+            
+        Returns:
+            OutboxEvent instance
+        """
+        if event_type not in OutboxService.HANDLERS:
+            raise ValueError(f'Unknown outbox event type: {event_type}')
+        
+        event = OutboxEvent.objects.create(event_type=event_type, payload=payload)
+        OutboxService.schedule_relay()
+        return event
+    
+    @staticmethod
+    def publish_many(event_type: str, payloads: List[Dict]) -> List[OutboxEvent]:
+        """Record several events of one type with a single insert"""
+        if event_type not in OutboxService.HANDLERS:
+            raise ValueError(f'Unknown outbox event type: {event_type}')
+        if not payloads:
+            return []
+        
+        events = OutboxEvent.objects.bulk_create(
+            [OutboxEvent(event_type=event_type, payload=payload) for payload in payloads]
+        )
+        OutboxService.schedule_relay()
+        return events
+    
+    @staticmethod
+    def schedule_relay():
+        """Run the relay once the current transaction commits"""
+        from .tasks import relay_outbox_events
+        
+        transaction.on_commit(relay_outbox_events.delay)
+    
+    @staticmethod
+    def relay(batch_size: Optional[int] = None) -> int:
+        """
+        Claim due events and enqueue them as batched Celery tasks
+        
+        Returns:
+            int: Number of events dispatched
+        """
+        from .tasks import process_outbox_events
+        
+        batch_size = batch_size or settings.OUTBOX_RELAY_BATCH_SIZE
+        now = timezone.now()
+        
+        # Events whose worker died (or whose task was lost) are retried,
+        # or parked once they have used up their attempts
+        expired = OutboxEvent.objects.filter(status__in=['dispatched', 'processing'], available_at__lte=now)
+        expired.filter(attempts__gte=settings.OUTBOX_MAX_ATTEMPTS).update(
+            status='failed', lease_token=None, last_error='Lease expired'
+        )
+        expired.update(status='pending', lease_token=None)
+        
+        with transaction.atomic():
+            ids = list(
+                OutboxEvent.objects
+                .select_for_update(skip_locked=True)
+                .filter(status='pending', available_at__lte=now)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            OutboxEvent.objects.filter(id__in=ids).update(
+                status='dispatched',
+                available_at=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+            )
+        
+        for chunk in chunk_list(ids, settings.OUTBOX_EVENTS_PER_TASK):
+            process_outbox_events.delay(chunk)
+        
+        if ids:
+            logger.info(f'Relayed {len(ids)} outbox events')
+        return len(ids)
+    
+    @staticmethod
+    def process(event_ids: List[int]) -> Dict:
+        """
+        Run the handlers for dispatched events. An event that another
+        worker already claimed (e.g. a redelivered task) is skipped, and a
+        handler whose lease was taken over meanwhile is rolled back.
+        
+        Returns:
+            dict: done, retried, failed and skipped counts
+        """
+        stats = {'done': 0, 'retried': 0, 'failed': 0, 'skipped': 0}
+        
+        for event_id in event_ids:
+            token = uuid.uuid4()
+            claimed = OutboxEvent.objects.filter(id=event_id, status='dispatched').update(
+                status='processing',
+                lease_token=token,
+                attempts=F('attempts') + 1,
+                available_at=timezone.now() + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+            )
+            if not claimed:
+                stats['skipped'] += 1
+                continue
+            
+            event = OutboxEvent.objects.get(id=event_id)
+            leased = OutboxEvent.objects.filter(id=event_id, status='processing', lease_token=token)
+            try:
+                with transaction.atomic():
+                    OutboxService.get_handler(event.event_type)(event.payload)
+                    if not leased.update(status='done', lease_token=None, processed_at=timezone.now(), last_error=''):
+                        raise OutboxLeaseLost(f'Lease on outbox event {event_id} was lost')
+                stats['done'] += 1
+            except OutboxLeaseLost as e:
+                logger.warning(str(e))
+                stats['skipped'] += 1
+            except Exception as e:
+                logger.error(f'Outbox event {event.id} ({event.event_type}) failed: {str(e)}')
+                if event.attempts < settings.OUTBOX_MAX_ATTEMPTS:
+                    backoff = settings.OUTBOX_RETRY_BACKOFF_SECONDS * 2 ** (event.attempts - 1)
+                    leased.update(
+                        status='pending',
+                        lease_token=None,
+                        available_at=timezone.now() + timedelta(seconds=min(backoff, 3600)),
+                        last_error=str(e)
+                    )
+                    stats['retried'] += 1
+                else:
+                    leased.update(status='failed', lease_token=None, last_error=str(e))
+                    stats['failed'] += 1
+        
+        return stats
+
+
+class FarmLocationIndex:
+    """
+    Grid index over farm coordinates for geofenced targeting. The point
+    arrays are cached; each process keeps its built index until a farm
+    location changes, which bumps the cache version. A lost version key
+    is re-seeded from the clock, so an evicted or flushed cache never
+    hands out a version a process has already built.
+    """
+    
+    VERSION_KEY = 'farms:location_index:version'
+    _local = {'version': None, 'index': None}
+    
+    @staticmethod
+    def invalidate():
+        """Force every process to rebuild the index on next use"""
+        key = FarmLocationIndex.VERSION_KEY
+        if not cache.add(key, time.time_ns(), None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, time.time_ns(), None)
+    
+    @staticmethod
+    def get() -> GridIndex:
+        """Current index, rebuilt from the cache or the DB when stale"""
+        version = cache.get(FarmLocationIndex.VERSION_KEY)
+        if version is None:
+            seed = time.time_ns()
+            cache.add(FarmLocationIndex.VERSION_KEY, seed, None)
+            version = cache.get(FarmLocationIndex.VERSION_KEY, seed)
+        
+        local = FarmLocationIndex._local
+        if local['version'] == version and local['index'] is not None:
+            return local['index']
+        
+        data_key = f'farms:location_index:{version}'
+        points = cache.get(data_key)
+        if points is None:
+            points = FarmLocationIndex._load_points()
+            cache.set(data_key, points, settings.FARM_INDEX_CACHE_TIMEOUT)
+        
+        index = GridIndex(*points, cell_size=settings.FARM_INDEX_CELL_DEGREES)
+        local.update(version=version, index=index)
+        return index
+    
+    @staticmethod
+    def _load_points():
+        """(user_ids, lats, lons) arrays for active farmers with a location"""
+        rows = list(
+            FarmerProfile.objects
+            .filter(latitude__isnull=False, longitude__isnull=False, user__is_active=True)
+            .values_list('user_id', 'latitude', 'longitude')
+        )
+        points = np.array(rows, dtype=float).reshape(-1, 3)
+        return points[:, 0].astype(np.int64), points[:, 1], points[:, 2]
+
+
+class OfficerAssignmentService:
+    """
+    Which farms fall inside each field officer's coverage radius, stored
+    as OfficerFarmAssignment rows so officer-scoped lists are a join on
+    an indexed table. An officer moving (or changing radius) is matched
+    against the farm location index; a farm moving is matched against
+    every officer's circle. Either way only the difference is written.
+    """
+    
+    @staticmethod
+    def _officers():
+        """(user_ids, lats, lons, radii) arrays for active officers with a base location"""
+        rows = list(
+            FieldOfficerProfile.objects
+            .filter(base_latitude__isnull=False, base_longitude__isnull=False, user__is_active=True)
+            .values_list('user_id', 'base_latitude', 'base_longitude', 'coverage_area_radius')
+        )
+        points = np.array(rows, dtype=float).reshape(-1, 4)
+        return points[:, 0].astype(np.int64), points[:, 1], points[:, 2], points[:, 3]
+    
+    @staticmethod
+    def _sync(filter_field: str, owner_id: int, other_field: str, wanted) -> Dict:
+        """Make one officer's (or farmer's) assignments match `wanted` IDs"""
+        wanted = {int(other_id) for other_id in wanted}
+        current = set(
+            OfficerFarmAssignment.objects
+            .filter(**{filter_field: owner_id})
+            .values_list(other_field, flat=True)
+        )
+        
+        with transaction.atomic():
+            removed = OfficerFarmAssignment.objects.filter(
+                **{filter_field: owner_id, f'{other_field}__in': current - wanted}
+            ).delete()[0] if current - wanted else 0
+            OfficerFarmAssignment.objects.bulk_create(
+                [OfficerFarmAssignment(**{filter_field: owner_id, other_field: other_id})
+                 for other_id in wanted - current],
+                batch_size=1000,
+                ignore_conflicts=True
+            )
+        return {'added': len(wanted - current), 'removed': removed}
+    
+    @staticmethod
+    def assign_officer(officer_id: int) -> Dict:
+        """
+        Recompute the farms inside an officer's coverage radius
+        
+        Returns:
+            dict: Assignments added and removed
+        """
+        profile = (
+            FieldOfficerProfile.objects
+            .filter(user_id=officer_id, user__is_active=True)
+            .values('base_latitude', 'base_longitude', 'coverage_area_radius')
+            .first()
+        )
+        farmer_ids = []
+        if profile and profile['base_latitude'] is not None and profile['base_longitude'] is not None:
+            farmer_ids = FarmLocationIndex.get().within_radius(
+                float(profile['base_latitude']),
+                float(profile['base_longitude']),
+                profile['coverage_area_radius']
+            )
+        return OfficerAssignmentService._sync('officer_id', officer_id, 'farmer_id', farmer_ids)
+    
+    @staticmethod
+    def assign_farm(farmer_id: int) -> Dict:
+        """
+        Recompute the officers whose coverage radius contains a farm
+        
+        Returns:
+            dict: Assignments added and removed
+        """
+        location = (
+            FarmerProfile.objects
+            .filter(user_id=farmer_id, user__is_active=True)
+            .values_list('latitude', 'longitude')
+            .first()
+        )
+        officer_ids = []
+        if location and None not in location:
+            ids, lats, lons, radii = OfficerAssignmentService._officers()
+            distances = haversine_km(float(location[0]), float(location[1]), lats, lons)
+            officer_ids = ids[distances <= radii]
+        return OfficerAssignmentService._sync('farmer_id', farmer_id, 'officer_id', officer_ids)
+    
+    @staticmethod
+    def rebuild_all() -> int:
+        """
+        Recompute every officer's assignments and drop those of officers
+        without a base location
+        
+        Returns:
+            int: Assignments added or removed
+        """
+        ids = OfficerAssignmentService._officers()[0]
+        changed = OfficerFarmAssignment.objects.exclude(officer_id__in=ids.tolist()).delete()[0]
+        for officer_id in ids.tolist():
+            result = OfficerAssignmentService.assign_officer(officer_id)
+            changed += result['added'] + result['removed']
+        
+        logger.info(f'Rebuilt assignments for {len(ids)} field officers ({changed} changes)')
+        return changed
+    
+    @staticmethod
+    def scope_farmers(officer: User, queryset):
+        """
+        Limit a User queryset to an officer's farmers: the assigned farms
+        when the officer has a base location, otherwise the farmers in
+        their assigned counties (or every farmer if they have none)
+        """
+        queryset = queryset.filter(role='farmer')
+        profile = getattr(officer, 'field_officer_profile', None)
+        if profile is None:
+            return queryset
+        if profile.base_latitude is not None and profile.base_longitude is not None:
+            return queryset.filter(officer_assignments__officer=officer)
+        if profile.assigned_counties:
+            return queryset.filter(county__in=profile.assigned_counties)
+        return queryset
+
+
+class AudienceSegmentService:
+    """
+    Audience segments kept in the cache as sorted int64 arrays of user IDs:
+    active users per county, per role and county, and farmers per primary
+    crop. Save signals patch the affected segments in place; a missing
+    segment is rebuilt from the DB on first use.
+    
+    Segments are described by tuples: ('county', county),
+    ('role_county', role, county) or ('crop', crop).
+    """
+    
+    LOCK_ATTEMPTS = 5
+    KNOWN_KEYS = 'segments:known'
+    
+    @staticmethod
+    def key(segment: tuple) -> str:
+        return 'segments:' + ':'.join(slugify(part) for part in segment)
+    
+    @staticmethod
+    def segments_for(role: str, county: str, is_active: bool, crop: str = '') -> set:
+        """Segments a user with these attributes belongs to"""
+        if not is_active:
+            return set()
+        
+        segments = set()
+        if county:
+            segments.add(('county', county))
+            segments.add(('role_county', role, county))
+        if role == 'farmer' and crop:
+            segments.add(('crop', crop))
+        return segments
+    
+    @staticmethod
+    def segments_for_user(user: User) -> set:
+        crop = ''
+        if user.role == 'farmer':
+            crop = (
+                FarmerProfile.objects.filter(user_id=user.id)
+                .values_list('primary_crop', flat=True).first() or ''
+            )
+        return AudienceSegmentService.segments_for(user.role, user.county, user.is_active, crop)
+    
+    @staticmethod
+    def _build(segment: tuple) -> np.ndarray:
+        """Load a segment's member IDs from the DB"""
+        kind = segment[0]
+        users = User.objects.filter(is_active=True)
+        if kind == 'county':
+            users = users.filter(county__iexact=segment[1])
+        elif kind == 'role_county':
+            users = users.filter(role=segment[1], county__iexact=segment[2])
+        elif kind == 'crop':
+            users = users.filter(role='farmer', farmer_profile__primary_crop__iexact=segment[1])
+        else:
+            raise ValueError(f'Unknown audience segment: {segment}')
+        
+        return np.sort(np.fromiter(users.values_list('id', flat=True), dtype=np.int64))
+    
+    @staticmethod
+    def get_many(segments) -> Dict[tuple, np.ndarray]:
+        """Member arrays for several segments, building any that are missing"""
+        keys = {AudienceSegmentService.key(segment): segment for segment in segments}
+        found = cache.get_many(list(keys))
+        
+        result = {keys[key]: members for key, members in found.items()}
+        missing = {}
+        for key, segment in keys.items():
+            if key not in found:
+                result[segment] = missing[key] = AudienceSegmentService._build(segment)
+        
+        if missing:
+            cache.set_many(missing, settings.AUDIENCE_SEGMENT_TIMEOUT)
+        return result
+    
+    @staticmethod
+    def union(segments) -> np.ndarray:
+        arrays = list(AudienceSegmentService.get_many(segments).values())
+        if not arrays:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(arrays))
+    
+    @staticmethod
+    def resolve(
+        counties: Optional[List[str]] = None,
+        roles: Optional[List[str]] = None,
+        crops: Optional[List[str]] = None
+    ) -> np.ndarray:
+        """
+        Sorted IDs of active users matching every given filter: in any of
+        the counties, with any of the roles, growing any of the crops
+        
+        Returns:
+            np.ndarray: User IDs
+        """
+        if counties is None and crops is None:
+            raise ValueError('Audience needs at least counties or crops')
+        
+        audience = None
+        if counties is not None:
+            if roles:
+                audience = AudienceSegmentService.union(
+                    ('role_county', role, county) for role in roles for county in counties
+                )
+            else:
+                audience = AudienceSegmentService.union(('county', county) for county in counties)
+        
+        if crops is not None:
+            growers = AudienceSegmentService.union(('crop', crop) for crop in crops)
+            audience = growers if audience is None else np.intersect1d(audience, growers, assume_unique=True)
+        
+        return audience
+    
+    @staticmethod
+    def load_users(user_ids: np.ndarray, chunk_size: int = 1000, **filters) -> List[User]:
+        """
+        Users for a resolved audience, fetched a chunk of IDs at a time
+        so no single query carries an unbounded IN list
+        
+        Args:
+            user_ids: IDs from resolve() or the farm location index
+            filters: Extra User filters, e.g. is_active=True
+            
+        Returns:
+            list: User instances
+        """
+        users = []
+        for chunk in chunk_list(user_ids.tolist(), chunk_size):
+            users.extend(User.objects.filter(id__in=chunk, **filters))
+        return users
+    
+    @staticmethod
+    def apply_change(user_id: int, before: set, after: set):
+        """Move a user between segments after a save"""
+        for segment in before - after:
+            AudienceSegmentService._patch(segment, user_id, add=False)
+        for segment in after - before:
+            AudienceSegmentService._patch(segment, user_id, add=True)
+    
+    @staticmethod
+    def _patch(segment: tuple, user_id: int, add: bool):
+        """
+        Add or remove one ID under a short lock. Segments not in the cache
+        are left alone (they are rebuilt on use); if the lock can't be
+        taken the segment is dropped so the next read rebuilds it.
+        """
+        key = AudienceSegmentService.key(segment)
+        lock_key = f'{key}:lock'
+        
+        for _ in range(AudienceSegmentService.LOCK_ATTEMPTS):
+            if cache.add(lock_key, 1, 5):
+                break
+            time.sleep(0.01)
+        else:
+            cache.delete(key)
+            return
+        
+        try:
+            members = cache.get(key)
+            if members is None:
+                return
+            if add:
+                members = np.union1d(members, np.array([user_id], dtype=np.int64))
+            else:
+                members = members[members != user_id]
+            cache.set(key, members, settings.AUDIENCE_SEGMENT_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+    
+    @staticmethod
+    def invalidate(segments: set):
+        """Drop cached segments so they are rebuilt on next use (after bulk writes)"""
+        cache.delete_many([AudienceSegmentService.key(segment) for segment in segments])
+    
+    @staticmethod
+    def rebuild_all() -> int:
+        """
+        Rebuild every segment from the DB in one pass to correct drift.
+        Segments that have no active members any more are written empty:
+        every county, role and crop still on a users row counts, as does
+        every key the previous rebuild wrote.
+        
+        Returns:
+            int: Number of segments written
+        """
+        members = {key: [] for key in cache.get(AudienceSegmentService.KNOWN_KEYS, [])}
+        known = (
+            User.objects
+            .values_list('role', 'county', 'farmer_profile__primary_crop')
+            .distinct()
+            .iterator(chunk_size=5000)
+        )
+        for role, county, crop in known:
+            for segment in AudienceSegmentService.segments_for(role, county, True, crop or ''):
+                members.setdefault(AudienceSegmentService.key(segment), [])
+        
+        rows = (
+            User.objects.filter(is_active=True)
+            .values_list('id', 'role', 'county', 'farmer_profile__primary_crop')
+            .iterator(chunk_size=5000)
+        )
+        for user_id, role, county, crop in rows:
+            for segment in AudienceSegmentService.segments_for(role, county, True, crop or ''):
+                members[AudienceSegmentService.key(segment)].append(user_id)
+        
+        for chunk in chunk_list(list(members.items()), 500):
+            cache.set_many(
+                {key: np.unique(np.array(ids, dtype=np.int64)) for key, ids in chunk},
+                settings.AUDIENCE_SEGMENT_TIMEOUT
+            )
+        cache.set(AudienceSegmentService.KNOWN_KEYS, list(members), None)
+        
+        logger.info(f'Rebuilt {len(members)} audience segments')
+        return len(members)
+
+
+class OTPService:
+    """
+    One-time codes kept in the cache rather than on the users row. Each
+    user has at most one live code, with a TTL, a failed-attempt counter
+    and a resend cooldown. Codes are sent through the SMS outbox at OTP
+    priority, so requesting one never waits on the SMS provider.
+    """
+    
+    @staticmethod
+    def _key(user_id: int, part: str = 'code') -> str:
+        return f'otp:{user_id}:{part}'
+    
+    @staticmethod
+    def issue(user: User, message_key: str = 'login_otp') -> Dict:
+        """
+        Queue a code for the user, reusing the live one if there is one
+        
+        Args:
+            user: User instance
+            message_key: Catalogue message the code is sent in
+        
+        Returns:
+            dict: sent, and retry_after (seconds) while the cooldown holds
+        """
+        now = time.time()
+        cooldown_key = OTPService._key(user.id, 'cooldown')
+        cooldown_until = now + settings.OTP_RESEND_COOLDOWN_SECONDS
+        if not cache.add(cooldown_key, cooldown_until, settings.OTP_RESEND_COOLDOWN_SECONDS):
+            retry_after = int((cache.get(cooldown_key) or now) - now) + 1
+            return {'sent': False, 'retry_after': max(retry_after, 1)}
+        
+        code_key = OTPService._key(user.id)
+        stored = cache.get(code_key)
+        if stored is None:
+            stored = {'code': generate_verification_code(), 'created_at': now}
+            cache.set(code_key, stored, settings.OTP_TTL_SECONDS)
+            cache.delete(OTPService._key(user.id, 'attempts'))
+        
+        remaining = settings.OTP_TTL_SECONDS - (now - stored['created_at'])
+        rendered = message_catalog.render(
+            message_key, user.language,
+            code=stored['code'],
+            minutes=max(1, int(remaining // 60))
+        )
+        SMSOutboxService.enqueue(
+            str(user.phone_number),
+            rendered.sms,
+            priority=OutboundSMS.PRIORITY_OTP,
+            user=user,
+            related_object_type='otp',
+        )
+        
+        logger.info(f'OTP queued for user {user.id}')
+        return {'sent': True, 'retry_after': 0}
+    
+    @staticmethod
+    def verify(user: User, code: str) -> str:
+        """
+        Check a code. The code is consumed on success and discarded once
+        OTP_MAX_ATTEMPTS wrong guesses have been made.
+        
+        Returns:
+            str: 'valid', 'invalid', 'expired' or 'locked'
+        """
+        code_key = OTPService._key(user.id)
+        attempts_key = OTPService._key(user.id, 'attempts')
+        
+        stored = cache.get(code_key)
+        if stored is None:
+            return 'expired'
+        
+        cache.add(attempts_key, 0, settings.OTP_TTL_SECONDS)
+        try:
+            attempts = cache.incr(attempts_key)
+        except ValueError:
+            cache.set(attempts_key, 1, settings.OTP_TTL_SECONDS)
+            attempts = 1
+        
+        if attempts > settings.OTP_MAX_ATTEMPTS:
+            cache.delete(code_key)
+            return 'locked'
+        
+        if not constant_time_compare(stored['code'], (code or '').strip()):
+            return 'invalid'
+        
+        cache.delete_many([code_key, attempts_key])
+        return 'valid'
+    
+    @staticmethod
+    def peek(user: User) -> Optional[Dict]:
+        """Live code and its age, for the DEBUG-only OTP endpoint"""
+        stored = cache.get(OTPService._key(user.id))
+        if stored is None:
+            return None
+        return {
+            'code': stored['code'],
+            'age_seconds': round(time.time() - stored['created_at'], 1),
+            'attempts': cache.get(OTPService._key(user.id, 'attempts'), 0),
+        }
+
+
+class DashboardFragmentService:
+    """
+    Cached fragments the farmer dashboard is assembled from. County
+    weather and county active-alert counts are shared by every farmer in
+    the county and dropped by the writes that change them (see signals);
+    the unread count comes from UnreadCounterService and the farm summary
+    from the cached authenticated user's profile.
+    """
+    
+    @staticmethod
+    def _key(fragment: str, county: str) -> str:
+        return f'dashboard:{fragment}:{slugify(county)}'
+    
+    @staticmethod
+    def invalidate(fragment: str, counties: List[str]):
+        cache.delete_many([DashboardFragmentService._key(fragment, county) for county in counties if county])
+    
+    @staticmethod
+    def county_weather(county: str) -> Optional[Dict]:
+        """Latest reading for a county"""
+        key = DashboardFragmentService._key('weather', county)
+        fragment = cache.get(key)
+        if fragment is None:
+            from apps.weather.models import WeatherData
+            
+            reading = WeatherData.objects.filter(county__iexact=county).order_by('-recorded_at').first()
+            fragment = {'reading': reading and {
+                'temperature': float(reading.temperature),
+                'condition': reading.condition,
+                'rainfall': float(reading.rainfall),
+                'recorded_at': reading.recorded_at.isoformat()
+            }}
+            cache.set(key, fragment, settings.DASHBOARD_FRAGMENT_TIMEOUT)
+        return fragment['reading']
+    
+    @staticmethod
+    def county_active_alerts(county: str) -> int:
+        """
+        Number of alerts active in a county right now. The fragment also
+        expires when the next alert in the county starts or ends.
+        """
+        key = DashboardFragmentService._key('alerts', county)
+        now = timezone.now()
+        fragment = cache.get(key)
+        if fragment is None or fragment['valid_until'] <= now:
+            from apps.alerts.models import Alert
+            
+            windows = list(
+                Alert.objects
+                .filter(status='active', counties__contains=[county], end_time__gte=now)
+                .values_list('start_time', 'end_time')
+            )
+            timeout = settings.DASHBOARD_FRAGMENT_TIMEOUT
+            boundaries = [start for start, _ in windows if start > now] + [end for _, end in windows]
+            fragment = {
+                'count': sum(1 for start, _ in windows if start <= now),
+                'valid_until': min(boundaries + [now + timedelta(seconds=timeout)]),
+            }
+            ttl = max(1, min(timeout, int((fragment['valid_until'] - now).total_seconds()) + 1))
+            cache.set(key, fragment, ttl)
+        return fragment['count']
+    
+    @staticmethod
+    def etag(data: Dict) -> str:
+        """Strong ETag over an assembled dashboard"""
+        payload = json.dumps(data, sort_keys=True, default=str).encode()
+        return f'"{hashlib.md5(payload).hexdigest()}"'
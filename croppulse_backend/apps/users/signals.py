@@ -1,8 +1,10 @@
 """
 Signals for Users app
 """
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
+from services.images import IMAGE_FIELDS
 from .models import User, FarmerProfile, FieldOfficerProfile
 
 
@@ -15,7 +17,7 @@ def create_user_profile(sender, instance, created, **kwargs):
                 user=instance,
                 defaults={
                     'farm_size': 0,
-                    'primary_crop': 'maize'
+                    'primary_crop': FarmerProfile.DEFAULT_PRIMARY_CROP
                 }
             )
         elif instance.role == 'field_officer' and not hasattr(instance, 'field_officer_profile'):
@@ -25,3 +27,181 @@ def create_user_profile(sender, instance, created, **kwargs):
                     'employee_id': f'FO-{instance.id:06d}'
                 }
             )
+
+
+@receiver(post_save, sender=FarmerProfile)
+def sync_farmer_push_topics(sender, instance, created, **kwargs):
+    """Primary crop drives a push topic; re-sync once the change commits"""
+    if created or not instance.user.fcm_token:
+        return
+
+    from .tasks import sync_push_topics
+    transaction.on_commit(lambda: sync_push_topics.delay(instance.user_id))
+
+
+@receiver(post_save, sender=FarmerProfile)
+@receiver(post_delete, sender=FarmerProfile)
+def invalidate_farm_location_index(sender, instance, **kwargs):
+    """Farm coordinates feed the geofencing index; rebuild only when they move"""
+    from .services import FarmLocationIndex
+
+    location = (instance.latitude, instance.longitude)
+    if kwargs.get('signal') is post_save and location == getattr(instance, '_previous_location', (None, None)):
+        return
+
+    transaction.on_commit(FarmLocationIndex.invalidate)
+
+
+@receiver(pre_save, sender=User)
+def capture_user_segments(sender, instance, **kwargs):
+    """Remember which audience segments the user was in before this save"""
+    from .services import AudienceSegmentService
+
+    instance._previous_segments = None
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not {'role', 'county', 'is_active'} & set(update_fields):
+        return
+
+    instance._previous_segments = set()
+    instance._segment_crop = None
+    if instance.pk:
+        previous = (
+            User.objects.filter(pk=instance.pk)
+            .values('role', 'county', 'is_active', 'farmer_profile__primary_crop').first()
+        )
+        if previous:
+            # A User save never changes the crop; post_save reuses it
+            instance._segment_crop = previous['farmer_profile__primary_crop'] or ''
+            instance._previous_segments = AudienceSegmentService.segments_for(
+                previous['role'], previous['county'], previous['is_active'],
+                instance._segment_crop if previous['role'] == 'farmer' else ''
+            )
+
+
+@receiver(post_save, sender=User)
+def update_user_segments(sender, instance, created, **kwargs):
+    """Move the user between cached audience segments once the save commits"""
+    from .services import AudienceSegmentService
+
+    before = getattr(instance, '_previous_segments', None)
+    if before is None:
+        return
+
+    crop = getattr(instance, '_segment_crop', None)
+    if crop is None:
+        after = AudienceSegmentService.segments_for_user(instance)
+    else:
+        after = AudienceSegmentService.segments_for(
+            instance.role, instance.county, instance.is_active,
+            crop if instance.role == 'farmer' else ''
+        )
+    if before != after:
+        transaction.on_commit(lambda: AudienceSegmentService.apply_change(instance.id, before, after))
+
+
+@receiver(pre_save, sender=FarmerProfile)
+def capture_crop_segment(sender, instance, **kwargs):
+    """Remember the farmer's crop and farm location before this save"""
+    instance._previous_crop = ''
+    instance._previous_location = (None, None)
+    if instance.pk:
+        previous = (
+            FarmerProfile.objects.filter(pk=instance.pk)
+            .values_list('primary_crop', 'latitude', 'longitude').first()
+        )
+        if previous:
+            instance._previous_crop = previous[0] or ''
+            instance._previous_location = previous[1:]
+
+
+@receiver(post_save, sender=FarmerProfile)
+def update_crop_segment(sender, instance, **kwargs):
+    """Primary crop drives a crop audience segment"""
+    from .services import AudienceSegmentService
+
+    previous = getattr(instance, '_previous_crop', '')
+    if previous == instance.primary_crop:
+        return
+
+    user = instance.user
+    before = AudienceSegmentService.segments_for(user.role, user.county, user.is_active, previous)
+    after = AudienceSegmentService.segments_for(user.role, user.county, user.is_active, instance.primary_crop)
+    transaction.on_commit(lambda: AudienceSegmentService.apply_change(user.id, before, after))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_auth_user(sender, instance, **kwargs):
+    """Drop the cached authenticated user; again after commit so no stale copy is re-cached"""
+    from core.authentication import AuthUserCache
+
+    user_id = instance.pk
+    AuthUserCache.invalidate(user_id)
+    transaction.on_commit(lambda: AuthUserCache.invalidate(user_id))
+
+
+@receiver(post_save, sender=FarmerProfile)
+@receiver(post_delete, sender=FarmerProfile)
+@receiver(post_save, sender=FieldOfficerProfile)
+@receiver(post_delete, sender=FieldOfficerProfile)
+def invalidate_auth_user_profile(sender, instance, **kwargs):
+    """Profiles are cached with their user"""
+    from core.authentication import AuthUserCache
+
+    AuthUserCache.invalidate(instance.user_id)
+    transaction.on_commit(lambda: AuthUserCache.invalidate(instance.user_id))
+
+
+@receiver(post_save, sender=FarmerProfile)
+@receiver(post_delete, sender=FarmerProfile)
+def reassign_farm_officers(sender, instance, **kwargs):
+    """A farm that moved may enter or leave field officers' coverage"""
+    from .tasks import assign_farm_officers
+
+    location = (instance.latitude, instance.longitude)
+    if kwargs.get('signal') is post_save and location == getattr(instance, '_previous_location', (None, None)):
+        return
+
+    user_id = instance.user_id
+    transaction.on_commit(lambda: assign_farm_officers.delay(user_id))
+
+
+@receiver(pre_save, sender=FieldOfficerProfile)
+def capture_officer_coverage(sender, instance, **kwargs):
+    """Remember the officer's coverage circle before this save"""
+    instance._previous_coverage = None
+    if instance.pk:
+        instance._previous_coverage = (
+            FieldOfficerProfile.objects.filter(pk=instance.pk)
+            .values_list('base_latitude', 'base_longitude', 'coverage_area_radius').first()
+        )
+
+
+@receiver(post_save, sender=FieldOfficerProfile)
+def reassign_officer_farms(sender, instance, **kwargs):
+    """Recompute an officer's farms when their coverage circle changes"""
+    from .tasks import assign_officer_farms
+
+    coverage = (instance.base_latitude, instance.base_longitude, instance.coverage_area_radius)
+    previous = getattr(instance, '_previous_coverage', None)
+    if previous == coverage or (previous is None and None in coverage[:2]):
+        return
+
+    user_id = instance.user_id
+    transaction.on_commit(lambda: assign_officer_farms.delay(user_id))
+
+
+def queue_image_derivatives(sender, instance, **kwargs):
+    """Resize newly uploaded images once the save commits"""
+    from services.images import ImageDerivativeService
+
+    fields = IMAGE_FIELDS[sender._meta.label]
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not set(fields) & set(update_fields):
+        return
+
+    ImageDerivativeService.queue([getattr(instance, field).name for field in fields if getattr(instance, field)])
+
+
+for label in IMAGE_FIELDS:
+    post_save.connect(queue_image_derivatives, sender=label, dispatch_uid=f'image_derivatives:{label}')
@@ -2,7 +2,11 @@
 Celery tasks for Users app
 """
 from celery import shared_task
-from .services import UserService
+from django.conf import settings
+from .services import (
+    UserService, SMSOutboxService, UnreadCounterService, NotificationRetentionService,
+    DigestService, OutboxService, AudienceSegmentService, OfficerAssignmentService
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,9 +15,17 @@ logger = logging.getLogger(__name__)
 @shared_task
 def cleanup_old_notifications():
     """Clean up old read notifications"""
-    deleted_count = UserService.cleanup_old_notifications(days=30)
-    logger.info(f'Cleaned up {deleted_count} old notifications')
-    return deleted_count
+    stats = UserService.cleanup_old_notifications(days=settings.NOTIFICATION_RETENTION_DAYS)
+    logger.info(
+        f'Cleaned up {stats["rows_reclaimed"]} old notifications in {stats["duration_ms"]}ms'
+    )
+    return stats
+
+
+@shared_task
+def maintain_notification_partitions():
+    """Keep monthly notification partitions created ahead of time"""
+    return NotificationRetentionService.ensure_partitions(months_ahead=3)
 
 
 @shared_task
@@ -35,3 +47,91 @@ def send_bulk_notification(user_ids, notification_type, title, message, priority
     
     logger.info(f'Sent {count} notifications')
     return count
+
+
+@shared_task
+def drain_sms_outbox(queue='bulk'):
+    """Send due SMS from the outbox; re-queues itself while a backlog remains"""
+    stats = SMSOutboxService.drain(queue)
+    
+    if stats['claimed'] >= settings.SMS_BATCH_SIZE:
+        drain_sms_outbox.apply_async(
+            args=[queue],
+            queue=SMSOutboxService.CELERY_QUEUES[queue]
+        )
+    
+    return stats
+
+
+@shared_task
+def sync_push_topics(user_id, previous_token=''):
+    """Re-sync a user's FCM topic subscriptions after a profile or token change"""
+    from .models import User
+    
+    try:
+        user = User.objects.select_related('farmer_profile').get(id=user_id)
+    except User.DoesNotExist:
+        return None
+    
+    return UserService.sync_push_topics(user, previous_token=previous_token)
+
+
+@shared_task
+def backfill_push_topics():
+    """Subscribe existing device tokens to their county/crop topics"""
+    return UserService.backfill_push_topics()
+
+
+@shared_task
+def reconcile_unread_counters():
+    """Correct drift in the cached unread counters of recently active inboxes"""
+    return UnreadCounterService.reconcile(hours=2)
+
+
+@shared_task
+def rebuild_audience_segments():
+    """Rebuild every cached audience segment to correct drift"""
+    return AudienceSegmentService.rebuild_all()
+
+
+@shared_task
+def assign_farm_officers(farmer_id):
+    """Match a moved farm against field officers' coverage"""
+    return OfficerAssignmentService.assign_farm(farmer_id)
+
+
+@shared_task
+def assign_officer_farms(officer_id):
+    """Recompute the farms inside an officer's coverage radius"""
+    return OfficerAssignmentService.assign_officer(officer_id)
+
+
+@shared_task
+def rebuild_officer_assignments():
+    """Recompute every officer's farm assignments to correct drift"""
+    return OfficerAssignmentService.rebuild_all()
+
+
+@shared_task
+def generate_image_derivatives(name):
+    """Write the resized copies of an uploaded image"""
+    from services.images import ImageDerivativeService
+    return ImageDerivativeService.generate(name)
+
+
+@shared_task
+def flush_notification_digests():
+    """Send merged digests for users whose coalescing window has elapsed"""
+    return DigestService.flush()
+
+
+@shared_task
+def relay_outbox_events():
+    """Hand committed outbox events to the workers"""
+    return OutboxService.relay()
+
+
+@shared_task
+def process_outbox_events(event_ids):
+    """Run the side effects for a batch of outbox events"""
+    return OutboxService.process(event_ids)
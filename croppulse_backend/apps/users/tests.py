@@ -5,7 +5,7 @@ from django.test import TestCase
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
-from .models import FarmerProfile, FieldOfficerProfile, Notification
+from .models import FarmerProfile, FieldOfficerProfile, Notification, OutboundSMS
 
 User = get_user_model()
 
@@ -94,3 +94,934 @@ class AuthenticationTests(APITestCase):
         self.assertIn('access', response.data)
         self.assertIn('refresh', response.data)
         self.assertIn('user', response.data)
+
+
+class PushDispatchTests(TestCase):
+    """Tests for batched FCM delivery"""
+    
+    def setUp(self):
+        from services.notifications import notification_service
+        self.service = notification_service
+        self.original = (self.service.initialized, self.service.send_batch, self.service.batch_size)
+        self.service.initialized = True
+        self.service.batch_size = 2
+        self.batches = []
+        
+        for i in range(3):
+            User.objects.create_user(
+                phone_number=f'+25471234560{i}',
+                password='testpass123',
+                full_name=f'Farmer {i}',
+                role='farmer',
+                fcm_token=f'token-{i}'
+            )
+    
+    def tearDown(self):
+        self.service.initialized, self.service.send_batch, self.service.batch_size = self.original
+    
+    def fake_fcm(self, multicast_message):
+        """Stand-in for FCM that reports token-1 as unregistered"""
+        from firebase_admin import messaging
+        self.batches.append(list(multicast_message.tokens))
+        responses = []
+        for token in multicast_message.tokens:
+            if token == 'token-1':
+                responses.append(messaging.SendResponse(None, messaging.UnregisteredError('gone')))
+            else:
+                responses.append(messaging.SendResponse({'name': f'msg-{token}'}, None))
+        return messaging.BatchResponse(responses)
+    
+    def test_multicast_is_chunked_and_dead_tokens_pruned(self):
+        from django.core.cache import cache
+        from core.authentication import AuthUserCache
+        from .services import UserService
+        self.service.send_batch = self.fake_fcm
+        dead = User.objects.get(full_name='Farmer 1')
+        AuthUserCache.get(dead.id, dead.token_version)
+        
+        count = UserService.bulk_create_notifications(
+            users=User.objects.all(),
+            notification_type='alert',
+            title='Heavy Rain',
+            message='Expect heavy rain',
+            priority='high',
+            data={'alert_id': 1}
+        )
+        
+        self.assertEqual(count, 3)
+        self.assertEqual(sorted(len(batch) for batch in self.batches), [1, 2])
+        self.assertEqual(User.objects.get(full_name='Farmer 1').fcm_token, '')
+        self.assertEqual(Notification.objects.filter(sent_via_push=True).count(), 2)
+        # The cached copy would otherwise write the dead token back on its next save
+        self.assertIsNone(cache.get(AuthUserCache.key(dead.id)))
+    
+    def test_topic_send_skips_multicast_for_subscribed_users(self):
+        from .services import UserService
+        self.service.send_batch = self.fake_fcm
+        topics_sent = []
+        self.service.send_topic_notification = lambda topic, *args, **kwargs: topics_sent.append(topic) or True
+        self.addCleanup(delattr, self.service, 'send_topic_notification')
+        
+        User.objects.update(county='Nairobi')
+        User.objects.exclude(full_name='Farmer 2').update(fcm_topics=['county-nairobi'])
+        self.assertEqual(
+            UserService.get_push_topics(User.objects.get(full_name='Farmer 2')),
+            ['county-nairobi', 'crop-maize']
+        )
+        
+        UserService.bulk_create_notifications(
+            users=User.objects.all(),
+            notification_type='alert',
+            title='Heavy Rain',
+            message='Expect heavy rain',
+            priority='high',
+            push_topics=['county-nairobi']
+        )
+        
+        self.assertEqual(topics_sent, ['county-nairobi'])
+        self.assertEqual(self.batches, [['token-2']])
+        self.assertEqual(Notification.objects.filter(sent_via_push=True).count(), 3)
+    
+    def test_low_priority_notifications_are_merged_into_one_digest(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .services import UserService, DigestService
+        self.service.send_batch = self.fake_fcm
+        farmer = User.objects.filter(full_name='Farmer 0')
+        
+        for title in ('Planting advice', 'Market prices', 'Pest report nearby'):
+            UserService.bulk_create_notifications(
+                users=farmer, notification_type='advisory', title=title, message=title
+            )
+        UserService.bulk_create_notifications(
+            users=farmer, notification_type='alert', title='Flood', message='Flood', priority='urgent'
+        )
+        # Only the urgent alert went out immediately
+        self.assertEqual(self.batches, [['token-0']])
+        self.assertEqual(DigestService.flush()['users'], 0)
+        
+        Notification.objects.filter(digest_pending=True).update(
+            created_at=timezone.now() - timedelta(hours=1)
+        )
+        stats = DigestService.flush()
+        
+        self.assertEqual((stats['users'], stats['notifications'], stats['push_sent']), (1, 3, 1))
+        self.assertEqual(self.batches, [['token-0'], ['token-0']])
+        self.assertEqual(Notification.objects.filter(sent_via_push=True).count(), 4)
+        self.assertFalse(Notification.objects.filter(digest_pending=True).exists())
+    
+    def test_buffered_priority_still_sends_topics(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .services import UserService, DigestService
+        self.service.send_batch = self.fake_fcm
+        topics_sent = []
+        self.service.send_topic_notification = lambda topic, *args, **kwargs: topics_sent.append(topic) or True
+        self.addCleanup(delattr, self.service, 'send_topic_notification')
+        User.objects.exclude(full_name='Farmer 2').update(fcm_topics=['county-nairobi'])
+        
+        UserService.bulk_create_notifications(
+            users=User.objects.all(),
+            notification_type='advisory',
+            title='Planting advice',
+            message='Plant after the first rains',
+            push_topics=['county-nairobi']
+        )
+        
+        self.assertEqual(topics_sent, ['county-nairobi'])
+        self.assertEqual(self.batches, [])
+        self.assertEqual(Notification.objects.filter(sent_via_push=True).count(), 2)
+        
+        # Only the unsubscribed farmer is left for the digest
+        Notification.objects.filter(digest_pending=True).update(
+            created_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(DigestService.flush()['users'], 1)
+        self.assertEqual(self.batches, [['token-2']])
+    
+    def test_sync_localized_topics_moves_non_english_devices(self):
+        from io import StringIO
+        from django.core.management import call_command
+        changes = []
+        self.service.subscribe_to_topic = lambda tokens, topic: changes.append(('+', topic)) or {'success_count': 1}
+        self.service.unsubscribe_from_topic = lambda tokens, topic: changes.append(('-', topic)) or {'success_count': 1}
+        self.addCleanup(delattr, self.service, 'subscribe_to_topic')
+        self.addCleanup(delattr, self.service, 'unsubscribe_from_topic')
+        
+        User.objects.update(county='Nairobi', fcm_topics=['county-nairobi', 'crop-maize'])
+        User.objects.filter(full_name='Farmer 0').update(language='sw')
+        
+        call_command('sync_localized_topics', stdout=StringIO())
+        
+        self.assertEqual(
+            User.objects.get(full_name='Farmer 0').fcm_topics,
+            ['county-nairobi-sw', 'crop-maize-sw']
+        )
+        self.assertEqual(len(changes), 4)
+        self.assertEqual(User.objects.get(full_name='Farmer 1').fcm_topics, ['county-nairobi', 'crop-maize'])
+
+
+class SMSOutboxTests(TestCase):
+    """Tests for the SMS outbox workers"""
+    
+    def setUp(self):
+        from services.sms import sms_service
+        self.sms_service = sms_service
+        self.original_deliver = sms_service.deliver
+    
+    def tearDown(self):
+        self.sms_service.deliver = self.original_deliver
+    
+    def fake_twilio(self, phone_number, message, segments=1):
+        """Stand-in for Twilio: +254700000001 times out, +254700000002 is invalid"""
+        if phone_number == '+254700000001':
+            return {'success': False, 'sid': '', 'error': 'timeout', 'retryable': True}
+        if phone_number == '+254700000002':
+            return {'success': False, 'sid': '', 'error': 'invalid number', 'retryable': False}
+        return {'success': True, 'sid': f'SM{phone_number[-4:]}', 'error': '', 'retryable': False}
+    
+    def test_drain_sends_retries_and_dead_letters(self):
+        from .models import OutboundSMS
+        from .services import SMSOutboxService
+        self.sms_service.deliver = self.fake_twilio
+        
+        SMSOutboxService.enqueue_bulk([
+            OutboundSMS(phone_number=phone, message='Flood warning', priority=OutboundSMS.PRIORITY_ALERT)
+            for phone in ['+254700000000', '+254700000001', '+254700000002']
+        ])
+        SMSOutboxService.enqueue('+254700000003', 'Your code is 123456', priority=OutboundSMS.PRIORITY_OTP)
+        
+        stats = SMSOutboxService.drain('bulk')
+        
+        self.assertEqual((stats['sent'], stats['retried'], stats['dead']), (1, 1, 1))
+        retried = OutboundSMS.objects.get(phone_number='+254700000001')
+        self.assertEqual((retried.status, retried.attempts), ('queued', 1))
+        self.assertGreater(retried.next_attempt_at, retried.created_at)
+        self.assertEqual(OutboundSMS.objects.get(phone_number='+254700000002').status, 'dead')
+        # OTPs are only drained by the OTP queue
+        self.assertEqual(OutboundSMS.objects.get(phone_number='+254700000003').status, 'queued')
+        self.assertEqual(SMSOutboxService.drain('otp')['sent'], 1)
+    
+    def test_notification_marked_sent_via_sms_on_delivery(self):
+        from .services import UserService, SMSOutboxService
+        self.sms_service.deliver = self.fake_twilio
+        user = User.objects.create_user(phone_number='+254700000004', password='testpass123', full_name='SMS Farmer')
+        
+        notification = UserService.deliver_notifications(
+            [user], 'alert', 'Flood warning', 'Move livestock to high ground', 'critical', {},
+            send_push=False, send_sms=True, related_object_type='alert', related_object_id=7
+        )[0]
+        self.assertTrue(notification.sms_queued)
+        notification.refresh_from_db()
+        self.assertFalse(notification.sent_via_sms)
+        
+        SMSOutboxService.drain('bulk')
+        notification.refresh_from_db()
+        self.assertTrue(notification.sent_via_sms)
+    
+    def test_rate_slot_does_not_spin_without_a_cache(self):
+        from django.test import override_settings
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            self.sms_service._acquire_rate_slot()
+
+
+class UnreadCounterTests(TestCase):
+    """Tests for the cached unread notification counters"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(
+            phone_number='+254712345670',
+            password='testpass123',
+            full_name='Counter Farmer',
+            role='farmer'
+        )
+    
+    def notify(self):
+        from .services import UserService
+        UserService.bulk_create_notifications(
+            users=[self.user],
+            notification_type='system',
+            title='Hello',
+            message='Welcome',
+            send_push=False
+        )
+    
+    def test_counter_tracks_writes_and_reads(self):
+        from .services import UnreadCounterService
+        self.notify()
+        self.assertEqual(UnreadCounterService.get(self.user.id), 1)
+        
+        self.notify()
+        self.notify()
+        self.assertEqual(UnreadCounterService.get(self.user.id), 3)
+        
+        first = Notification.objects.filter(user=self.user).first()
+        UnreadCounterService.mark_read(self.user, [first.id])
+        UnreadCounterService.mark_read(self.user, [first.id])
+        self.assertEqual(UnreadCounterService.get(self.user.id), 2)
+        
+        # Drift (e.g. rows written outside the service) is fixed by reconcile
+        Notification.objects.filter(user=self.user).update(is_read=True)
+        UnreadCounterService.reconcile()
+        self.assertEqual(UnreadCounterService.get(self.user.id), 0)
+
+
+class NotificationInboxTests(APITestCase):
+    """Tests for the notification inbox pagination modes"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            phone_number='+254712345671',
+            password='testpass123',
+            full_name='Inbox Farmer',
+            role='farmer'
+        )
+        Notification.objects.bulk_create([
+            Notification(user=self.user, type='system', title=f'Note {i}', message='Hi')
+            for i in range(5)
+        ])
+        self.client.force_authenticate(user=self.user)
+        self.url = '/api/v1/users/notifications/'
+    
+    def test_mobile_clients_walk_inbox_by_cursor(self):
+        response = self.client.get(self.url, {'page_size': 2}, HTTP_X_CLIENT_PLATFORM='android')
+        
+        self.assertNotIn('count', response.data)
+        self.assertEqual(response.data['unread_count'], 5)
+        
+        seen = [item['id'] for item in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'], HTTP_X_CLIENT_PLATFORM='android')
+            seen.extend(item['id'] for item in response.data['results'])
+        
+        expected = list(Notification.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        
+        # Web clients keep page numbers
+        self.assertEqual(self.client.get(self.url).data['count'], 5)
+
+
+class NotificationRetentionTests(TestCase):
+    """Tests for notification retention cleanup"""
+    
+    def test_cleanup_deletes_old_read_rows_in_batches(self):
+        from datetime import timedelta
+        from django.test import override_settings
+        from django.utils import timezone
+        from .services import UserService
+        
+        user = User.objects.create_user(
+            phone_number='+254712345672',
+            password='testpass123',
+            full_name='Retention Farmer',
+            role='farmer'
+        )
+        Notification.objects.bulk_create([
+            Notification(user=user, type='system', title=f'Note {i}', message='Hi', is_read=i != 0)
+            for i in range(6)
+        ])
+        Notification.objects.filter(title__in=['Note 0', 'Note 1', 'Note 2', 'Note 3', 'Note 4']).update(
+            created_at=timezone.now() - timedelta(days=45)
+        )
+        
+        with override_settings(NOTIFICATION_CLEANUP_BATCH_SIZE=2):
+            stats = UserService.cleanup_old_notifications(days=30)
+        
+        self.assertEqual(stats['rows_reclaimed'], 4)
+        self.assertIn('duration_ms', stats)
+        # Unread and recent notifications are kept
+        self.assertEqual(
+            sorted(Notification.objects.values_list('title', flat=True)),
+            ['Note 0', 'Note 5']
+        )
+
+
+class AudienceSegmentTests(TestCase):
+    """Tests for the cached audience segments"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+    
+    def make_user(self, phone, role='farmer', county='Nakuru'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return User.objects.create_user(
+                phone_number=phone,
+                password='testpass123',
+                full_name='Segment User',
+                role=role,
+                county=county
+            )
+    
+    def test_resolve_matches_filters_and_follows_saves(self):
+        from .services import AudienceSegmentService
+        farmer = self.make_user('+254712345680')
+        officer = self.make_user('+254712345681', role='field_officer')
+        self.make_user('+254712345682', county='Kisumu')
+        
+        self.assertEqual(
+            AudienceSegmentService.resolve(counties=['Nakuru']).tolist(),
+            sorted([farmer.id, officer.id])
+        )
+        self.assertEqual(
+            AudienceSegmentService.resolve(counties=['nakuru'], roles=['field_officer']).tolist(),
+            [officer.id]
+        )
+        self.assertEqual(
+            AudienceSegmentService.resolve(counties=['Nakuru'], crops=['maize']).tolist(),
+            [farmer.id]
+        )
+        
+        # Cached segments are patched in place as users move or deactivate
+        # One query for the previous segments, one for the UPDATE
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(2):
+            farmer.county = 'Kisumu'
+            farmer.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            officer.is_active = False
+            officer.save(update_fields=['is_active'])
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = farmer.farmer_profile
+            profile.primary_crop = 'beans'
+            profile.save()
+        
+        self.assertEqual(AudienceSegmentService.resolve(counties=['Nakuru']).tolist(), [])
+        self.assertEqual(len(AudienceSegmentService.resolve(counties=['Kisumu'])), 2)
+        self.assertEqual(AudienceSegmentService.resolve(crops=['maize']).size, 1)
+        self.assertEqual(AudienceSegmentService.resolve(crops=['beans']).tolist(), [farmer.id])
+    
+    def test_rebuild_all_empties_segments_that_lost_their_members(self):
+        from .services import AudienceSegmentService
+        farmer = self.make_user('+254712345680')
+        self.assertEqual(AudienceSegmentService.resolve(counties=['Nakuru']).tolist(), [farmer.id])
+        
+        # Bulk updates skip the signals that patch segments
+        User.objects.filter(id=farmer.id).update(is_active=False)
+        AudienceSegmentService.rebuild_all()
+        
+        self.assertEqual(AudienceSegmentService.resolve(counties=['Nakuru']).tolist(), [])
+        self.assertEqual(AudienceSegmentService.resolve(crops=['maize']).tolist(), [])
+
+
+class MessageCatalogTests(TestCase):
+    """Tests for the multilingual message catalogue"""
+    
+    def test_render_all_falls_back_and_counts_segments(self):
+        from services.message_catalog import message_catalog, sms_segments
+        
+        rendered = message_catalog.render_all(
+            'alert', ['ki', 'sw', 'en'], title='Mafuriko', message='Mvua kubwa – hamia mahali salama'
+        )
+        # Kikuyu falls back to Swahili and shares the rendered instance
+        self.assertIs(rendered['ki'], rendered['sw'])
+        self.assertEqual(rendered['sw'].language, 'sw')
+        # The en dash is swapped so the SMS stays GSM-7
+        self.assertEqual(rendered['sw'].sms_encoding, 'gsm7')
+        self.assertIn('–', rendered['sw'].message)
+        
+        self.assertEqual(sms_segments('a' * 160), ('gsm7', 1))
+        self.assertEqual(sms_segments('a' * 161), ('gsm7', 2))
+        self.assertEqual(sms_segments('[' * 81), ('gsm7', 2))
+        self.assertEqual(sms_segments('Ω' * 10 + '😀' * 30), ('ucs2', 1))
+        self.assertEqual(sms_segments('😀' * 36), ('ucs2', 2))
+    
+    def test_fan_out_sends_one_push_per_language(self):
+        from services.message_catalog import message_catalog
+        from services.notifications import notification_service
+        from .services import UserService
+        
+        sent = []
+        originals = (notification_service.initialized, notification_service.send_multicast_notification)
+        notification_service.initialized = True
+        notification_service.send_multicast_notification = lambda tokens, title, message, data=None: (
+            sent.append((sorted(tokens), title)) or
+            {'success_count': len(tokens), 'failed_tokens': [], 'invalid_tokens': []}
+        )
+        self.addCleanup(lambda: setattr(notification_service, 'initialized', originals[0]))
+        self.addCleanup(lambda: setattr(notification_service, 'send_multicast_notification', originals[1]))
+        
+        for i, language in enumerate(['en', 'sw', 'ki']):
+            User.objects.create_user(
+                phone_number=f'+25471234569{i}', password='testpass123', full_name=f'Farmer {i}',
+                role='farmer', language=language, fcm_token=f'token-{language}'
+            )
+        users = list(User.objects.all())
+        messages = message_catalog.render_all(
+            'pest_disease_alert', {user.language for user in users},
+            name='Fall armyworm', kind='Pest', crop='maize', severity='severe', county='Nakuru', area=2
+        )
+        UserService.bulk_create_notifications(
+            users, 'alert', messages['en'].title, messages['en'].message,
+            priority='high', send_sms=True, messages=messages
+        )
+        
+        # Kikuyu falls back to Swahili, so they share one multicast
+        self.assertEqual(sorted(sent), [
+            (['token-en'], 'Pest/Disease Alert: Fall armyworm'),
+            (['token-ki', 'token-sw'], 'Tahadhari ya Wadudu/Magonjwa: Fall armyworm'),
+        ])
+        self.assertEqual(
+            Notification.objects.get(user__language='ki').title,
+            'Tahadhari ya Wadudu/Magonjwa: Fall armyworm'
+        )
+        self.assertEqual(set(OutboundSMS.objects.values_list('segments', flat=True)), {1})
+
+
+class OTPTests(APITestCase):
+    """Tests for cache-held OTPs"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(
+            phone_number='+254712345677',
+            password='testpass123',
+            full_name='OTP Farmer',
+            role='farmer',
+            language='sw'
+        )
+    
+    def test_request_otp_queues_sms_and_enforces_cooldown(self):
+        url = '/api/v1/users/farmer-auth/request_otp/'
+        
+        response = self.client.post(url, {'phone_number': '+254712345677'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        sms = OutboundSMS.objects.get(user=self.user)
+        self.assertEqual(sms.priority, OutboundSMS.PRIORITY_OTP)
+        self.assertIn('Nambari yako ya kuingia', sms.message)
+        # The users row is not touched
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.verification_code)
+        
+        response = self.client.post(url, {'phone_number': '+254712345677'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(response.data['retry_after'], 0)
+        self.assertEqual(OutboundSMS.objects.filter(user=self.user).count(), 1)
+    
+    def test_verify_consumes_code_and_locks_after_max_attempts(self):
+        from django.core.cache import cache
+        from django.test import override_settings
+        from .services import OTPService
+        
+        OTPService.issue(self.user)
+        code = OTPService.peek(self.user)['code']
+        wrong = '000000' if code != '000000' else '111111'
+        
+        response = self.client.post(
+            '/api/v1/users/farmer-auth/verify_otp/', {'phone_number': '+254712345677', 'otp_code': code}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(OTPService.verify(self.user, code), 'expired')
+        
+        with override_settings(OTP_MAX_ATTEMPTS=2):
+            cache.clear()
+            OTPService.issue(self.user)
+            code = OTPService.peek(self.user)['code']
+            self.assertEqual(OTPService.verify(self.user, wrong), 'invalid')
+            self.assertEqual(OTPService.verify(self.user, wrong), 'invalid')
+            self.assertEqual(OTPService.verify(self.user, code), 'locked')
+            self.assertIsNone(OTPService.peek(self.user))
+
+
+class CachedAuthenticationTests(APITestCase):
+    """Tests for the cached JWT user"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        from core.authentication import VersionedRefreshToken
+        cache.clear()
+        self.user = User.objects.create_user(
+            phone_number='+254712345676',
+            password='testpass123',
+            full_name='Cached Farmer',
+            role='farmer',
+            county='Nakuru'
+        )
+        self.token = VersionedRefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+    
+    def test_warm_cache_authenticates_without_queries(self):
+        url = '/api/v1/users/users/me/'
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.data['farmer_profile']['primary_crop'], 'maize')
+        
+        # Profile saves drop the cached copy
+        profile = FarmerProfile.objects.get(user=self.user)
+        profile.primary_crop = 'beans'
+        profile.save()
+        self.assertEqual(self.client.get(url).data['farmer_profile']['primary_crop'], 'beans')
+    
+    def test_revoked_tokens_are_rejected(self):
+        from core.authentication import AuthUserCache, VersionedRefreshToken
+        url = '/api/v1/users/users/me/'
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        
+        AuthUserCache.revoke_tokens(self.user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+        
+        fresh = VersionedRefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {fresh}')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+
+class TokenBlacklistTests(APITestCase):
+    """Tests for the cache token blacklist"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        from core.authentication import VersionedRefreshToken
+        cache.clear()
+        self.user = User.objects.create_user(
+            phone_number='+254712345675',
+            password='testpass123',
+            full_name='Blacklist Farmer',
+            role='farmer',
+            county='Nakuru'
+        )
+        self.refresh = VersionedRefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+    
+    def test_rotated_and_logged_out_tokens_are_rejected(self):
+        url = '/api/v1/users/auth/refresh/'
+        response = self.client.post(url, {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rotated = response.data['refresh']
+        
+        # The rotated-out token is blacklisted; a warm refresh makes no queries
+        self.assertEqual(self.client.post(url, {'refresh': str(self.refresh)}).status_code, 401)
+        with self.assertNumQueries(0):
+            response = self.client.post(url, {'refresh': rotated})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        latest = response.data['refresh']
+        self.assertEqual(self.client.post('/api/v1/users/auth/logout/', {'refresh': latest}).status_code, 200)
+        self.assertEqual(self.client.post(url, {'refresh': latest}).status_code, 401)
+    
+    def test_concurrent_refresh_with_one_token_rotates_once(self):
+        from unittest.mock import patch
+        from core.authentication import VersionedRefreshToken
+        url = '/api/v1/users/auth/refresh/'
+        
+        # Both requests pass the blacklist check before either has written it
+        with patch.object(VersionedRefreshToken, 'check_blacklist'):
+            first = self.client.post(url, {'refresh': str(self.refresh)})
+            second = self.client.post(url, {'refresh': str(self.refresh)})
+        
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_migrate_command_moves_live_rows_and_prunes_expired(self):
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from django.db import connection
+        from django.utils import timezone
+        from core.authentication import TokenBlacklist
+        
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TABLE token_blacklist_outstandingtoken '
+                '(id integer PRIMARY KEY, jti varchar(255), expires_at datetime)'
+            )
+            cursor.execute(
+                'CREATE TABLE token_blacklist_blacklistedtoken (id integer PRIMARY KEY, token_id integer)'
+            )
+            now = timezone.now()
+            for id, jti, expires_at in [(1, 'live', now + timedelta(days=1)),
+                                        (2, 'old', now - timedelta(days=1)),
+                                        (3, 'unused', now - timedelta(days=1))]:
+                cursor.execute('INSERT INTO token_blacklist_outstandingtoken VALUES (%s, %s, %s)',
+                               [id, jti, expires_at])
+            cursor.execute('INSERT INTO token_blacklist_blacklistedtoken VALUES (1, 1), (2, 2)')
+        
+        call_command('migrate_token_blacklist', '--batch-size', '1', stdout=StringIO())
+        
+        self.assertTrue(TokenBlacklist.contains('live'))
+        self.assertFalse(TokenBlacklist.contains('old'))
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM token_blacklist_blacklistedtoken')
+            self.assertEqual(cursor.fetchone()[0], 0)
+            cursor.execute('SELECT jti FROM token_blacklist_outstandingtoken')
+            self.assertEqual(cursor.fetchall(), [('live',)])
+
+
+class FarmerDashboardTests(APITestCase):
+    """Tests for the fragment-cached farmer dashboard"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        from core.authentication import VersionedRefreshToken
+        cache.clear()
+        self.user = User.objects.create_user(
+            phone_number='+254712345674',
+            password='testpass123',
+            full_name='Dashboard Farmer',
+            role='farmer',
+            county='Nakuru'
+        )
+        token = VersionedRefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    
+    def tearDown(self):
+        from django.core.cache import cache
+        cache.clear()  # User IDs are reused by later tests
+    
+    def record_weather(self, temperature):
+        from django.utils import timezone
+        from apps.weather.models import WeatherData
+        with self.captureOnCommitCallbacks(execute=True):
+            WeatherData.objects.create(
+                latitude=-0.3, longitude=36.07, county='Nakuru', temperature=temperature,
+                humidity=60, pressure=1012, wind_speed=3, rainfall=0, condition='Clear',
+                recorded_at=timezone.now()
+            )
+    
+    def test_repeat_open_is_not_modified_until_a_fragment_changes(self):
+        from unittest.mock import patch
+        from .services import DashboardFragmentService
+        
+        url = '/api/v1/users/dashboard/farmer/'
+        self.record_weather(21)
+        # SQLite has no JSON contains lookup for alert counties
+        with patch.object(DashboardFragmentService, 'county_active_alerts', return_value=0):
+            response = self.client.get(url)
+            self.assertEqual(response.data['recent_weather']['temperature'], 21.0)
+            etag = response['ETag']
+            
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            
+            self.record_weather(25)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['recent_weather']['temperature'], 25.0)
+            self.assertNotEqual(response['ETag'], etag)
+
+
+class FarmerImportTests(APITestCase):
+    """Tests for bulk farmer enrolment"""
+    
+    def setUp(self):
+        self.officer = User.objects.create_user(
+            phone_number='+254712345673',
+            password='testpass123',
+            full_name='Import Officer',
+            role='field_officer',
+            county='Nakuru'
+        )
+        User.objects.create_user(
+            phone_number='+254722000001',
+            password='testpass123',
+            full_name='Existing Farmer',
+            role='farmer'
+        )
+        self.client.force_authenticate(self.officer)
+    
+    def test_csv_upload_creates_farmers_and_reports_rejected_rows(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        
+        csv = (
+            'Phone,Name,County,Language,Crop\n'
+            '0722 000 002,Wanjiru Kamau,nakuru,sw,Beans\n'
+            '254-722-000-003,Otieno Odhiambo,Kisumu,,\n'
+            '+254722000002,Wanjiru Again,Nakuru,,\n'
+            '0722000001,Existing Farmer,Nakuru,,\n'
+            '12345,Bad Number,Nakuru,,\n'
+            '0722000004,Nowhere Farmer,Atlantis,,\n'
+        )
+        upload = SimpleUploadedFile('farmers.csv', csv.encode(), content_type='text/csv')
+        response = self.client.post('/api/v1/users/farmer-profiles/bulk_import/', {'file': upload}, format='multipart')
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['welcome_sms_queued'], 2)
+        self.assertEqual(
+            [(error['row'], error['error']) for error in response.data['errors']],
+            [(4, 'Duplicate phone number in file'), (5, 'Phone number already registered'),
+             (6, 'Invalid Kenyan mobile number'), (7, 'Unknown county')]
+        )
+        
+        farmer = User.objects.get(phone_number='+254722000002')
+        self.assertEqual((farmer.county, farmer.language, farmer.farmer_profile.primary_crop), ('Nakuru', 'sw', 'beans'))
+        self.assertFalse(farmer.has_usable_password())
+        self.assertTrue(OutboundSMS.objects.get(user=farmer).message.startswith('Karibu CropPulse Africa, Wanjiru Kamau'))
+        self.assertEqual(FarmerProfile.objects.filter(user__phone_number='+254722000003').count(), 1)
+    
+    def test_rows_that_keep_failing_are_reported_not_raised(self):
+        from unittest.mock import patch
+        from django.db import IntegrityError
+        from .bulk_import import FarmerImportService
+        
+        rows = [
+            {'phone_number': f'072200001{i}', 'full_name': f'Farmer {i}', 'county': 'Nakuru'}
+            for i in range(3)
+        ]
+        create_batch = FarmerImportService._create_batch
+        
+        def flaky(rows, phones, batch, send_welcome_sms):
+            if 1 in batch:
+                raise IntegrityError('violates a constraint')
+            return create_batch(rows, phones, batch, send_welcome_sms)
+        
+        with patch.object(FarmerImportService, '_create_batch', staticmethod(flaky)):
+            report = FarmerImportService.run(rows, send_welcome_sms=False)
+        
+        self.assertEqual(report['created'], 2)
+        self.assertEqual(
+            [(error['row'], error['error']) for error in report['errors']],
+            [(3, 'Could not create farmer: violates a constraint')]
+        )
+        self.assertEqual(
+            FarmerProfile.objects.get(user__phone_number='+254722000010').primary_crop,
+            FarmerProfile.DEFAULT_PRIMARY_CROP
+        )
+    
+    def test_farmers_cannot_import(self):
+        farmer = User.objects.get(phone_number='+254722000001')
+        self.client.force_authenticate(farmer)
+        response = self.client.post('/api/v1/users/farmer-profiles/bulk_import/', {}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class OfficerAssignmentTests(APITestCase):
+    """Tests for field officer farm assignments"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.near = self.farmer('+254722100001', -0.30, 36.08)
+        self.far = self.farmer('+254722100002', -1.29, 36.82)  # Nairobi, ~120 km away
+        self.officer = User.objects.create_user(
+            phone_number='+254722100003',
+            password='testpass123',
+            full_name='Nakuru Officer',
+            role='field_officer'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = self.officer.field_officer_profile
+            profile.base_latitude = -0.28
+            profile.base_longitude = 36.07
+            profile.coverage_area_radius = 30
+            profile.save()
+    
+    def tearDown(self):
+        from django.core.cache import cache
+        cache.clear()
+    
+    def farmer(self, phone, lat, lon):
+        user = User.objects.create_user(phone_number=phone, password='testpass123', full_name=phone, role='farmer')
+        with self.captureOnCommitCallbacks(execute=True):
+            FarmerProfile.objects.filter(user=user).update(latitude=lat, longitude=lon)
+            FarmerProfile.objects.get(user=user).save()
+        return user
+    
+    def assigned(self):
+        from .models import OfficerFarmAssignment
+        return set(OfficerFarmAssignment.objects.filter(officer=self.officer).values_list('farmer_id', flat=True))
+    
+    def test_assignments_follow_farm_and_officer_moves(self):
+        self.assertEqual(self.assigned(), {self.near.id})
+        
+        # The far farm moves into range
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = self.far.farmer_profile
+            profile.latitude, profile.longitude = -0.35, 36.10
+            profile.save()
+        self.assertEqual(self.assigned(), {self.near.id, self.far.id})
+        
+        # The officer relocates to Nairobi with a small radius
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = FieldOfficerProfile.objects.get(user=self.officer)
+            profile.base_latitude, profile.base_longitude = -1.29, 36.82
+            profile.coverage_area_radius = 5
+            profile.save()
+        self.assertEqual(self.assigned(), set())
+    
+    def test_officer_lists_only_assigned_farmers(self):
+        self.client.force_authenticate(self.officer)
+        response = self.client.get('/api/v1/users/users/')
+        self.assertEqual([user['id'] for user in response.data['results']], [self.near.id])
+
+
+class ImageDerivativeTests(TestCase):
+    """Tests for resized image derivatives"""
+    
+    def setUp(self):
+        import tempfile
+        from django.core.cache import cache
+        from django.test import override_settings
+        cache.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings_override.enable()
+    
+    def tearDown(self):
+        from django.core.cache import cache
+        self.settings_override.disable()
+        self.media.cleanup()
+        cache.clear()
+    
+    def upload(self):
+        import io
+        from PIL import Image
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        image = Image.new('RGB', (2000, 1000), 'green')
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees on display
+        exif[0x010F] = 'PhoneMaker'
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile('farm.jpg', buffer.getvalue(), content_type='image/jpeg')
+    
+    def test_upload_generates_rotated_stripped_derivatives(self):
+        from PIL import Image
+        from django.core.cache import cache
+        from django.core.files.storage import default_storage
+        from services.images import ImageDerivativeService
+        from .serializers import UserSerializer
+        
+        user = User.objects.create_user(phone_number='+254722200001', password='testpass123', full_name='Photo Farmer')
+        self.assertIsNone(UserSerializer(user).data['profile_picture_urls'])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            user.profile_picture = self.upload()
+            user.save()
+        
+        thumb = ImageDerivativeService.path(user.profile_picture.name, 'thumb')
+        with default_storage.open(thumb, 'rb') as handle:
+            image = Image.open(handle)
+            image.load()
+        # Portrait after applying the orientation, and no EXIF left
+        self.assertEqual(image.size, (80, 160))
+        self.assertFalse(image.getexif())
+        
+        urls = UserSerializer(user).data['profile_picture_urls']
+        self.assertTrue(urls['original'].endswith('.jpg'))
+        self.assertTrue(urls['thumb'].endswith(thumb.rsplit('/', 1)[-1]))
+        
+        # A lost marker is recovered from storage instead of regenerating
+        cache.clear()
+        self.assertEqual(ImageDerivativeService.pending([user.profile_picture.name]), [])
+        self.assertTrue(UserSerializer(user).data['profile_picture_urls']['thumb'].endswith(thumb.rsplit('/', 1)[-1]))
+    
+    def test_unrelated_update_does_not_requeue(self):
+        from unittest.mock import patch
+        user = User.objects.create_user(phone_number='+254722200002', password='testpass123', full_name='Photo Farmer')
+        with self.captureOnCommitCallbacks(execute=True):
+            user.profile_picture = self.upload()
+            user.save()
+        
+        with patch('apps.users.tasks.generate_image_derivatives.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                user.full_name = 'Renamed'
+                user.save(update_fields=['full_name'])
+                user.save()
+        delay.assert_not_called()
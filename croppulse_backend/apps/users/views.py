@@ -4,9 +4,12 @@ Views for Users app
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import TokenError
+from core.authentication import VersionedRefreshToken, VersionedTokenRefreshSerializer, AuthUserCache
 from django.utils import timezone
+from django.utils.http import parse_etags
 from django.db import IntegrityError, transaction
 from .models import User, Notification, FarmerProfile, FieldOfficerProfile
 from .serializers import (
@@ -17,10 +20,17 @@ from .serializers import (
     FarmerProfileSerializer, FieldOfficerProfileSerializer,
     FarmerSimpleRegistrationSerializer, FarmerSMSLoginRequestSerializer,
     FarmerSMSLoginVerifySerializer, OnboardingStatusSerializer,
-    AuthActionSerializer
+    FarmerImportSerializer, AuthActionSerializer
+)
+from .services import (
+    UserService, UnreadCounterService, OTPService, DashboardFragmentService, OfficerAssignmentService
+)
+from .tasks import sync_push_topics
+from .bulk_import import FarmerImportService, read_rows
+from core.permissions import IsFieldOfficerOrHQAnalyst
+from core.pagination import (
+    StandardResultsSetPagination, NotificationPagination, NotificationCursorPagination
 )
-from .services import UserService
-from core.pagination import StandardResultsSetPagination, NotificationPagination
 
 
 class AuthViewSet(viewsets.GenericViewSet):
@@ -36,6 +46,7 @@ class AuthViewSet(viewsets.GenericViewSet):
             'login': UserLoginSerializer,
             'verify_phone': VerifyPhoneSerializer,
             'resend_verification': ResendVerificationSerializer,
+            'refresh': VersionedTokenRefreshSerializer,
         }
         return mapping.get(self.action, AuthActionSerializer)
 
@@ -67,7 +78,7 @@ class AuthViewSet(viewsets.GenericViewSet):
         user.last_login = timezone.now()
         user.save(update_fields=['last_login'])
 
-        refresh = RefreshToken.for_user(user)
+        refresh = VersionedRefreshToken.for_user(user)
         return Response({
             'access': str(refresh.access_token),
             'refresh': str(refresh),
@@ -81,10 +92,9 @@ class AuthViewSet(viewsets.GenericViewSet):
         user = serializer.validated_data['user']
 
         user.is_verified = True
-        user.verification_code = ''
-        user.save(update_fields=['is_verified', 'verification_code'])
+        user.save(update_fields=['is_verified'])
 
-        refresh = RefreshToken.for_user(user)
+        refresh = VersionedRefreshToken.for_user(user)
         return Response({
             'message': 'Phone number verified successfully',
             'access': str(refresh.access_token),
@@ -108,14 +118,23 @@ class AuthViewSet(viewsets.GenericViewSet):
         except User.DoesNotExist:
             return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=False, methods=['post'])
+    def refresh(self, request):
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            return Response({'error': str(e)}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response(serializer.validated_data)
+
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
     def logout(self, request):
         try:
             refresh_token = request.data.get('refresh')
             if refresh_token:
-                RefreshToken(refresh_token).blacklist()
+                VersionedRefreshToken(refresh_token).blacklist()
             return Response({'message': 'Logout successful'})
-        except Exception:
+        except TokenError:
             return Response({'error': 'Invalid token'}, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -132,7 +151,7 @@ class UserViewSet(viewsets.ModelViewSet):
         if user.is_hq_analyst:
             return User.objects.all()
         elif user.is_field_officer:
-            return User.objects.filter(role='farmer')
+            return OfficerAssignmentService.scope_farmers(user, User.objects.all())
         else:
             return User.objects.filter(id=user.id)
 
@@ -148,6 +167,11 @@ class UserViewSet(viewsets.ModelViewSet):
         )
         serializer.is_valid(raise_exception=True)
         serializer.save()
+
+        if request.user.fcm_token:
+            user_id = request.user.id
+            transaction.on_commit(lambda: sync_push_topics.delay(user_id))
+
         return Response(UserSerializer(request.user).data)
 
     @action(detail=False, methods=['post'])
@@ -160,16 +184,31 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Invalid old password'}, status=status.HTTP_400_BAD_REQUEST)
 
         user.set_password(serializer.validated_data['new_password'])
-        user.save()
-        return Response({'message': 'Password changed successfully'})
+        # request.user may be the cached copy; only write what changed
+        user.save(update_fields=['password', 'updated_at'])
+
+        # Sign out other devices; this one gets fresh tokens
+        AuthUserCache.revoke_tokens(user)
+        refresh = VersionedRefreshToken.for_user(user)
+        return Response({
+            'message': 'Password changed successfully',
+            'access': str(refresh.access_token),
+            'refresh': str(refresh)
+        })
 
     @action(detail=False, methods=['post'])
     def update_fcm_token(self, request):
         serializer = UpdateFCMTokenSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
+        previous_token = request.user.fcm_token
         request.user.fcm_token = serializer.validated_data['fcm_token']
         request.user.save(update_fields=['fcm_token'])
+
+        if request.user.fcm_token != previous_token:
+            user_id = request.user.id
+            transaction.on_commit(lambda: sync_push_topics.delay(user_id, previous_token))
+
         return Response({'message': 'FCM token updated'})
 
 
@@ -185,6 +224,22 @@ class FarmerProfileViewSet(viewsets.ModelViewSet):
             return FarmerProfile.objects.all()
         return FarmerProfile.objects.none()
 
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser],
+            permission_classes=[IsFieldOfficerOrHQAnalyst], serializer_class=FarmerImportSerializer)
+    def bulk_import(self, request):
+        """Enrol farmers from an uploaded CSV or XLSX file"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        upload = serializer.validated_data['file']
+        try:
+            rows = read_rows(upload, upload.name)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        report = FarmerImportService.run(rows, send_welcome_sms=serializer.validated_data['send_welcome_sms'])
+        return Response(report, status=status.HTTP_201_CREATED if report['created'] else status.HTTP_200_OK)
+
 
 class FieldOfficerProfileViewSet(viewsets.ModelViewSet):
     serializer_class = FieldOfficerProfileSerializer
@@ -203,6 +258,25 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = NotificationPagination
+    MOBILE_PLATFORMS = ('android', 'ios')
+
+    @property
+    def paginator(self):
+        """
+        Mobile clients (X-Client-Platform header) and ?cursor= requests get
+        keyset pagination; ?paginate=page forces page numbers.
+        """
+        if not hasattr(self, '_paginator'):
+            request = self.request
+            mode = request.query_params.get('paginate')
+            platform = request.headers.get('X-Client-Platform', '').lower()
+            use_cursor = mode == 'cursor' or 'cursor' in request.query_params or (
+                mode != 'page' and platform in self.MOBILE_PLATFORMS
+            )
+            self._paginator = (
+                NotificationCursorPagination() if use_cursor else NotificationPagination()
+            )
+        return self._paginator
 
     def get_queryset(self):
         return Notification.objects.filter(user=self.request.user)
@@ -210,19 +284,17 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
         notif = self.get_object()
-        notif.mark_as_read()
+        UnreadCounterService.mark_read(request.user, [notif.id])
         return Response({'message': 'Notification marked as read'})
 
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
-        updated = Notification.objects.filter(
-            user=request.user, is_read=False
-        ).update(is_read=True, read_at=timezone.now())
+        updated = UnreadCounterService.mark_read(request.user)
         return Response({'message': f'{updated} notifications marked as read'})
 
     @action(detail=False, methods=['get'])
     def unread_count(self, request):
-        count = Notification.objects.filter(user=request.user, is_read=False).count()
+        count = UnreadCounterService.get(request.user.id)
         return Response({'unread_count': count})
 
 
@@ -273,15 +345,9 @@ class FarmerAuthViewSet(viewsets.GenericViewSet):
                 user = serializer.save()
                 logger.info(f"✅ User created: {user.full_name}")
             
-            # Send OTP
-            logger.info("📤 Sending OTP...")
+            # Queue OTP
             success = UserService.send_login_otp(user)
-            
-            # Reload user to get updated OTP
-            user.refresh_from_db()
-            
-            logger.info(f"OTP: {user.verification_code}")
-            logger.info(f"SMS sent: {success}")
+            logger.info(f"📤 OTP queued: {success}")
             logger.info("=" * 70)
             
             return Response({
@@ -303,7 +369,13 @@ class FarmerAuthViewSet(viewsets.GenericViewSet):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = User.objects.get(phone_number=serializer.validated_data['phone_number'])
-        UserService.send_login_otp(user)
+        result = OTPService.issue(user, 'login_otp')
+        if not result['sent']:
+            return Response(
+                {'error': 'Please wait before requesting another code', 'retry_after': result['retry_after']},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={'Retry-After': str(result['retry_after'])}
+            )
         return Response({'message': 'Login code sent via SMS', 'phone_number': str(user.phone_number)})
 
     @action(detail=False, methods=['post'])
@@ -335,14 +407,12 @@ class FarmerAuthViewSet(viewsets.GenericViewSet):
         user.last_login = timezone.now()
         user.is_active = True
         user.is_verified = True
-        user.verification_code = None
-        user.verification_code_created_at = None
-        user.save()
+        user.save(update_fields=['last_login', 'is_active', 'is_verified'])
         
         logger.info("✅ User updated and activated")
         
         # Generate tokens
-        refresh = RefreshToken.for_user(user)
+        refresh = VersionedRefreshToken.for_user(user)
         
         # Get additional data
         try:
@@ -381,7 +451,15 @@ class DashboardViewSet(viewsets.GenericViewSet):
         if not request.user.is_farmer:
             return Response({'error': 'Only for farmers'}, status=status.HTTP_403_FORBIDDEN)
         data = UserService.get_farmer_dashboard_data(request.user)
-        return Response(data)
+        etag = DashboardFragmentService.etag(data)
+        
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
 
     @action(detail=False, methods=['get'])
     def field_officer(self, request):
@@ -437,13 +515,7 @@ def debug_otp(request):
     try:
         user = User.objects.get(phone_number=phone)
         
-        # Calculate OTP age if exists
-        otp_age_seconds = None
-        otp_expired = None
-        if user.verification_code_created_at:
-            elapsed = timezone.now() - user.verification_code_created_at
-            otp_age_seconds = elapsed.total_seconds()
-            otp_expired = otp_age_seconds > 600
+        otp = OTPService.peek(user)
         
         response_data = {
             "user_id": user.id,
@@ -452,16 +524,11 @@ def debug_otp(request):
             "role": user.role,
             "is_active": user.is_active,
             "is_verified": user.is_verified,
-            "otp": {
-                "code": user.verification_code or None,
-                "created_at": user.verification_code_created_at.isoformat() if user.verification_code_created_at else None,
-                "age_seconds": otp_age_seconds,
-                "expired": otp_expired,
-            },
+            "otp": otp,
             "has_farmer_profile": hasattr(user, 'farmer_profile'),
         }
         
-        logger.info(f"🔍 DEBUG OTP CHECK: {phone} - OTP: {user.verification_code}")
+        logger.info(f"🔍 DEBUG OTP CHECK: {phone} - OTP: {otp['code'] if otp else None}")
         
         return Response(response_data)
         
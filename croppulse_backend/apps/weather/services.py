@@ -2,13 +2,16 @@
 Business logic services for Weather app
 """
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Q, Avg
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 from .models import WeatherData, WeatherForecast, WeatherAdvisory, WeatherStation
 from services.weather_api import weather_api
 from services.geocoding import geocoding_service
-from apps.users.services import UserService
+from apps.users.services import UserService, OutboxService, AudienceSegmentService
+from services.notifications import notification_service
+from services.message_catalog import message_catalog
 from apps.users.models import User
 import logging
 
@@ -183,22 +186,32 @@ class WeatherService:
         Returns:
             WeatherAdvisory instance
         """
-        advisory = WeatherAdvisory.objects.create(
-            title=title,
-            message=message,
-            severity=severity,
-            counties=counties,
-            recommendations=recommendations,
-            valid_from=valid_from,
-            valid_until=valid_until,
-            created_by=created_by
-        )
-        
-        # Notify affected users
-        WeatherService.notify_advisory(advisory)
+        with transaction.atomic():
+            advisory = WeatherAdvisory.objects.create(
+                title=title,
+                message=message,
+                severity=severity,
+                counties=counties,
+                recommendations=recommendations,
+                valid_from=valid_from,
+                valid_until=valid_until,
+                created_by=created_by
+            )
+            
+            # Notify affected users once the advisory is committed
+            OutboxService.publish('weather.advisory_created', {'advisory_id': advisory.id})
         
         return advisory
     
+    @staticmethod
+    def handle_advisory_created(payload: dict):
+        """Outbox handler: notify users in the advisory's counties"""
+        advisory = WeatherAdvisory.objects.filter(id=payload['advisory_id']).first()
+        if advisory is None:
+            logger.warning(f'Advisory {payload["advisory_id"]} no longer exists')
+            return
+        WeatherService.notify_advisory(advisory)
+    
     @staticmethod
     def notify_advisory(advisory: WeatherAdvisory):
         """
@@ -208,14 +221,17 @@ class WeatherService:
             advisory: WeatherAdvisory instance
         """
         # Get users in affected counties
-        users = User.objects.filter(
-            county__in=advisory.counties,
-            is_active=True
+        users = AudienceSegmentService.load_users(
+            AudienceSegmentService.resolve(counties=advisory.counties), is_active=True
+        )
+        messages = message_catalog.render_all(
+            'advisory', {user.language for user in users},
+            title=advisory.title, message=advisory.message
         )
         
         # Send notifications
         UserService.bulk_create_notifications(
-            users=list(users),
+            users=users,
             notification_type='advisory',
             title=advisory.title,
             message=advisory.message,
@@ -226,10 +242,15 @@ class WeatherService:
                 'recommendations': advisory.recommendations
             },
             send_push=True,
-            send_sms=advisory.severity in ['warning', 'emergency']
+            send_sms=advisory.severity in ['warning', 'emergency'],
+            push_topics=[
+                notification_service.topic_name('county', county)
+                for county in advisory.counties
+            ],
+            messages=messages
         )
         
-        logger.info(f'Sent advisory notifications to {users.count()} users')
+        logger.info(f'Sent advisory notifications to {len(users)} users')
     
     @staticmethod
     def get_active_advisories(county: Optional[str] = None) -> List[WeatherAdvisory]:
@@ -0,0 +1,17 @@
+"""
+Signals for Weather app
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import WeatherData
+
+
+@receiver(post_save, sender=WeatherData)
+@receiver(post_delete, sender=WeatherData)
+def invalidate_dashboard_weather(sender, instance, **kwargs):
+    """A new reading replaces the county's latest weather"""
+    from apps.users.services import DashboardFragmentService
+
+    county = instance.county
+    transaction.on_commit(lambda: DashboardFragmentService.invalidate('weather', [county]))
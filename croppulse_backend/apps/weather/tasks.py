@@ -14,6 +14,10 @@ def fetch_weather_updates():
     try:
         count = WeatherService.update_weather_for_all_stations()
         logger.info(f'Updated weather for {count} stations')
+        
+        # Re-run the alert rules against the fresh data
+        from apps.alerts.tasks import evaluate_weather_rules
+        evaluate_weather_rules.delay()
         return count
     except Exception as e:
         logger.error(f'Error fetching weather updates: {str(e)}')
@@ -25,38 +29,41 @@ def send_daily_summaries():
     """Send daily weather summaries to users"""
     from apps.users.models import User
     from apps.users.services import UserService
+    from services.message_catalog import message_catalog
     
-    # Get all farmers
-    farmers = User.objects.filter(role='farmer', is_active=True)
-    sent_count = 0
-    
+    # Get all farmers, grouped by county so each summary is computed once
+    farmers = User.objects.filter(role='farmer', is_active=True).exclude(county='')
+    by_county = {}
     for farmer in farmers:
-        if farmer.county:
-            try:
-                summary = WeatherService.get_weather_summary(farmer.county, days=1)
-                
-                if summary:
-                    message = (
-                        f"Today's weather in {farmer.county}: "
-                        f"Avg temp {summary['average_temperature']}°C, "
-                        f"Humidity {summary['average_humidity']}%, "
-                        f"Rainfall {summary['average_rainfall']}mm"
-                    )
-                    
-                    UserService.create_notification(
-                        user=farmer,
-                        notification_type='advisory',
-                        title='Daily Weather Summary',
-                        message=message,
-                        priority='low',
-                        send_push=True,
-                        send_sms=False
-                    )
-                    
-                    sent_count += 1
-                    
-            except Exception as e:
-                logger.error(f'Error sending summary to {farmer.id}: {str(e)}')
+        by_county.setdefault(farmer.county, []).append(farmer)
+    
+    sent_count = 0
+    for county, county_farmers in by_county.items():
+        try:
+            summary = WeatherService.get_weather_summary(county, days=1)
+            if not summary:
+                continue
+            
+            messages = message_catalog.render_all(
+                'daily_weather_summary', {farmer.language for farmer in county_farmers},
+                county=county,
+                temperature=summary['average_temperature'],
+                humidity=summary['average_humidity'],
+                rainfall=summary['average_rainfall']
+            )
+            sent_count += UserService.bulk_create_notifications(
+                users=county_farmers,
+                notification_type='advisory',
+                title=messages['en'].title,
+                message=messages['en'].message,
+                priority='low',
+                send_push=True,
+                send_sms=False,
+                messages=messages
+            )
+            
+        except Exception as e:
+            logger.error(f'Error sending summaries for {county}: {str(e)}')
     
     logger.info(f'Sent daily summaries to {sent_count} farmers')
     return sent_count
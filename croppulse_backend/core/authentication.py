@@ -0,0 +1,211 @@
+"""
+JWT authentication backed by a cached user for CropPulse Africa
+
+Tokens carry the user's token_version. The authenticated user (with its
+farmer/field officer profile) is cached per user ID, so a request with a
+warm cache resolves request.user, its role and county without touching
+the database. Saves to the user or their profile drop the cache entry;
+bumping token_version revokes every token issued before the bump.
+
+Revoked refresh tokens (logout, rotation) are kept in the cache by JTI
+until they would have expired anyway, so the blacklist prunes itself and
+a refresh never queries simplejwt's token_blacklist tables.
+"""
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import F
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+TOKEN_VERSION_CLAIM = 'token_version'
+
+
+class TokenBlacklist:
+    """Revoked token JTIs, each cached for the rest of its token's lifetime"""
+
+    @staticmethod
+    def key(jti) -> str:
+        return f'auth:blacklist:{jti}'
+
+    @staticmethod
+    def add(jti, exp) -> bool:
+        """
+        Blacklist a JTI until its token expires. The write is a cache.add,
+        so of two requests racing to revoke the same token only one wins.
+
+        Args:
+            jti: Token ID
+            exp: Token expiry as a unix timestamp
+
+        Returns:
+            bool: False if the token has already expired or was already
+                  blacklisted
+        """
+        remaining = int(exp - datetime.now(dt_timezone.utc).timestamp()) + 1
+        if remaining <= 0:
+            return False
+        return cache.add(TokenBlacklist.key(jti), 1, remaining)
+
+    @staticmethod
+    def add_many(entries) -> int:
+        """
+        Blacklist (jti, exp) pairs in one cache round trip
+
+        Returns:
+            int: Number of unexpired JTIs stored
+        """
+        now = datetime.now(dt_timezone.utc).timestamp()
+        by_timeout = {}
+        for jti, exp in entries:
+            remaining = int(exp - now) + 1
+            if remaining > 0:
+                by_timeout.setdefault(remaining, {})[TokenBlacklist.key(jti)] = 1
+
+        for remaining, values in by_timeout.items():
+            cache.set_many(values, remaining)
+        return sum(len(values) for values in by_timeout.values())
+
+    @staticmethod
+    def contains(jti) -> bool:
+        return cache.get(TokenBlacklist.key(jti)) is not None
+
+
+class VersionedRefreshToken(RefreshToken):
+    """
+    Refresh token stamped with the user's token_version (copied to its
+    access tokens) and checked against TokenBlacklist
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token[TOKEN_VERSION_CLAIM] = user.token_version
+        return token
+
+    def verify(self, *args, **kwargs):
+        self.check_blacklist()
+        super().verify(*args, **kwargs)
+
+    def check_blacklist(self):
+        if TokenBlacklist.contains(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self) -> bool:
+        return TokenBlacklist.add(self.payload[api_settings.JTI_CLAIM], self.payload['exp'])
+
+
+class AuthUserCache:
+    """Authenticated users (with profiles) cached by user ID"""
+
+    @staticmethod
+    def key(user_id) -> str:
+        return f'auth:user:{user_id}'
+
+    @staticmethod
+    def load(user_id):
+        return (
+            get_user_model().objects
+            .select_related('farmer_profile', 'field_officer_profile__supervisor')
+            .filter(id=user_id)
+            .first()
+        )
+
+    @staticmethod
+    def get(user_id, token_version: int):
+        """
+        User for a token, from the cache when the cached copy is at the
+        token's version. A token older than the user's version is revoked.
+
+        Returns:
+            User instance, or None if the user no longer exists
+        """
+        user = cache.get(AuthUserCache.key(user_id))
+        if user is None or user.token_version < token_version:
+            user = AuthUserCache.load(user_id)
+            if user is None:
+                return None
+            cache.set(AuthUserCache.key(user_id), user, settings.AUTH_USER_CACHE_TIMEOUT)
+
+        if token_version < user.token_version:
+            raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
+        return user
+
+    @staticmethod
+    def invalidate(user_id):
+        cache.delete(AuthUserCache.key(user_id))
+
+    @staticmethod
+    def invalidate_many(user_ids):
+        """Drop several cached users, e.g. after a queryset update or bulk_update"""
+        cache.delete_many([AuthUserCache.key(user_id) for user_id in user_ids])
+
+    @staticmethod
+    def revoke_tokens(user) -> int:
+        """
+        Invalidate every token issued to the user so far
+
+        Returns:
+            int: The user's new token_version
+        """
+        get_user_model().objects.filter(id=user.id).update(token_version=F('token_version') + 1)
+        user.refresh_from_db(fields=['token_version'])
+        AuthUserCache.invalidate(user.id)
+        return user.token_version
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that resolves the user through AuthUserCache"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        user = AuthUserCache.get(user_id, validated_token.get(TOKEN_VERSION_CLAIM, 0))
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        return user
+
+
+class VersionedTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh (and rotate) a VersionedRefreshToken. The user comes from
+    AuthUserCache, so a refresh token older than the user's token_version
+    is rejected and a warm refresh makes no queries.
+    """
+
+    token_class = VersionedRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        user = AuthUserCache.get(user_id, refresh.payload.get(TOKEN_VERSION_CLAIM, 0)) if user_id else None
+        if user_id and (user is None or not api_settings.USER_AUTHENTICATION_RULE(user)):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            # Claiming the old token is the real check: a concurrent refresh
+            # with the same token gets past check_blacklist but loses here
+            if api_settings.BLACKLIST_AFTER_ROTATION and not refresh.blacklist():
+                raise InvalidToken(_('Token is blacklisted'))
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+
+        return data
@@ -0,0 +1,19 @@
+"""
+Custom serializer fields for CropPulse Africa
+"""
+from rest_framework import serializers
+from services.images import ImageDerivativeService
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    URLs of an image field's resized copies, so clients can pick the
+    smallest one that fits: {'original', 'thumb', 'small', 'medium'}
+    """
+
+    def to_representation(self, value):
+        urls = ImageDerivativeService.urls(value)
+        request = self.context.get('request')
+        if urls and request is not None:
+            urls = {size: request.build_absolute_uri(url) for size, url in urls.items()}
+        return urls
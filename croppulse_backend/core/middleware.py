@@ -0,0 +1,46 @@
+"""
+Middleware for CropPulse Africa
+"""
+import time
+from django.conf import settings
+from django.db import connection
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCountMiddleware:
+    """
+    Count the database queries each request makes. Adds X-DB-Query-Count
+    and X-DB-Query-Time-Ms headers and logs a per-endpoint line, so the
+    query cost of an endpoint can be compared before and after a change.
+    Enabled by QUERY_COUNT_HEADERS (on by default in DEBUG).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_COUNT_HEADERS:
+            return self.get_response(request)
+
+        stats = {'count': 0, 'time': 0.0}
+
+        def count_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats['count'] += 1
+                stats['time'] += time.perf_counter() - started
+
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+
+        response['X-DB-Query-Count'] = str(stats['count'])
+        response['X-DB-Query-Time-Ms'] = f'{stats["time"] * 1000:.2f}'
+
+        match = getattr(request, 'resolver_match', None)
+        endpoint = match.route if match else request.path
+        logger.debug(f'{request.method} {endpoint}: {stats["count"]} queries in {stats["time"] * 1000:.2f}ms')
+        return response
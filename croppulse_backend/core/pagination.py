@@ -86,5 +86,32 @@ class NotificationPagination(PageNumberPagination):
         ]))
 
     def get_unread_count(self):
-        """Override in view to provide unread count"""
-        return getattr(self, 'unread_count', 0)
+        """Unread badge from the cached per-user counter"""
+        from apps.users.services import UnreadCounterService
+        return UnreadCounterService.get(self.request.user.id)
+
+
+class NotificationCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the notification inbox.
+    Seeks on the (user, -created_at, -id) index instead of using
+    OFFSET, and never counts the table.
+    """
+    page_size = 30
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+    cursor_query_param = 'cursor'
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('unread_count', self.get_unread_count()),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_unread_count(self):
+        """Unread badge from the cached per-user counter"""
+        from apps.users.services import UnreadCounterService
+        return UnreadCounterService.get(self.request.user.id)
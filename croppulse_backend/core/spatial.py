@@ -0,0 +1,133 @@
+"""
+Spatial helpers for CropPulse Africa
+
+Points are indexed on a regular lat/lon grid. Queries take the grid cells
+overlapping the shape's bounding box, apply an exact bbox filter and then
+an exact vectorized test (haversine distance or point-in-polygon).
+"""
+from typing import Dict, Sequence, Tuple
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE_LAT = 111.32
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Distance in km from one point to arrays of points"""
+    lat1 = np.radians(lat)
+    lat2 = np.radians(lats)
+    delta_lat = lat2 - lat1
+    delta_lon = np.radians(lons) - np.radians(lon)
+
+    a = np.sin(delta_lat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(delta_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def points_in_polygon(lats: np.ndarray, lons: np.ndarray, polygon: Sequence[Sequence[float]]) -> np.ndarray:
+    """
+    Ray-casting point-in-polygon test over arrays of points
+
+    Args:
+        lats, lons: Point coordinates
+        polygon: [[lat, lon], ...] ring; closing the ring is optional
+
+    Returns:
+        np.ndarray: Boolean mask of points inside the polygon
+    """
+    ring = np.asarray(polygon, dtype=float)
+    inside = np.zeros(len(lats), dtype=bool)
+
+    for (lat_a, lon_a), (lat_b, lon_b) in zip(ring, np.roll(ring, -1, axis=0)):
+        crosses = (lat_a > lats) != (lat_b > lats)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            edge_lon = lon_a + (lats - lat_a) * (lon_b - lon_a) / (lat_b - lat_a)
+        inside ^= crosses & (lons < edge_lon)
+
+    return inside
+
+
+def radius_bbox(lat: float, lon: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """(min_lat, min_lon, max_lat, max_lon) enclosing a circle"""
+    delta_lat = radius_km / KM_PER_DEGREE_LAT
+    delta_lon = radius_km / (KM_PER_DEGREE_LAT * max(np.cos(np.radians(lat)), 1e-6))
+    return lat - delta_lat, lon - delta_lon, lat + delta_lat, lon + delta_lon
+
+
+def polygon_bbox(polygon: Sequence[Sequence[float]]) -> Tuple[float, float, float, float]:
+    """(min_lat, min_lon, max_lat, max_lon) enclosing a polygon"""
+    ring = np.asarray(polygon, dtype=float)
+    return ring[:, 0].min(), ring[:, 1].min(), ring[:, 0].max(), ring[:, 1].max()
+
+
+class GridIndex:
+    """
+    Uniform grid over point coordinates. Each cell holds the positions of
+    its points, so a query only touches the cells its bbox overlaps.
+    """
+
+    def __init__(self, ids: np.ndarray, lats: np.ndarray, lons: np.ndarray, cell_size: float = 0.05):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], np.ndarray] = {}
+
+        if not len(self.ids):
+            return
+
+        rows = np.floor(self.lats / cell_size).astype(np.int64)
+        cols = np.floor(self.lons / cell_size).astype(np.int64)
+        order = np.lexsort((cols, rows))
+        keys = np.stack([rows[order], cols[order]], axis=1)
+        boundaries = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+
+        for positions in np.split(order, boundaries):
+            self.cells[(int(rows[positions[0]]), int(cols[positions[0]]))] = positions
+
+    def __len__(self):
+        return len(self.ids)
+
+    def bbox_candidates(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> np.ndarray:
+        """Positions of points inside a bounding box"""
+        row_range = range(int(np.floor(min_lat / self.cell_size)), int(np.floor(max_lat / self.cell_size)) + 1)
+        col_range = range(int(np.floor(min_lon / self.cell_size)), int(np.floor(max_lon / self.cell_size)) + 1)
+
+        if len(row_range) * len(col_range) > len(self.cells):
+            # Box covers more cells than exist; scanning the cells is cheaper
+            parts = [
+                positions for (row, col), positions in self.cells.items()
+                if row in row_range and col in col_range
+            ]
+        else:
+            parts = [
+                self.cells[(row, col)]
+                for row in row_range for col in col_range
+                if (row, col) in self.cells
+            ]
+
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+
+        positions = np.concatenate(parts)
+        lats, lons = self.lats[positions], self.lons[positions]
+        mask = (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+        return positions[mask]
+
+    def within_radius(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """IDs of points within radius_km of (lat, lon)"""
+        positions = self.bbox_candidates(*radius_bbox(lat, lon, radius_km))
+        distances = haversine_km(lat, lon, self.lats[positions], self.lons[positions])
+        return self.ids[positions[distances <= radius_km]]
+
+    def within_polygon(self, polygon: Sequence[Sequence[float]]) -> np.ndarray:
+        """IDs of points inside a [[lat, lon], ...] polygon"""
+        positions = self.bbox_candidates(*polygon_bbox(polygon))
+        inside = points_in_polygon(self.lats[positions], self.lons[positions], polygon)
+        return self.ids[positions[inside]]
+
+    def within_geofence(self, geofence: Dict) -> np.ndarray:
+        """IDs of points inside a geofence dict (see validate_geofence)"""
+        if geofence['type'] == 'circle':
+            lat, lon = geofence['center']
+            return self.within_radius(lat, lon, geofence['radius_km'])
+        return self.within_polygon(geofence['coordinates'])
@@ -4,7 +4,7 @@ Utility functions for CropPulse Africa
 import uuid
 import hashlib
 import secrets
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from django.utils import timezone
 from django.core.cache import cache
@@ -151,6 +151,17 @@ def parse_date_range(
     return start, end
 
 
+def month_start(value: date) -> date:
+    """First day of the month containing value"""
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    """First day of the month `count` months after month"""
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
 def sanitize_filename(filename: str) -> str:
     """Sanitize filename to remove potentially dangerous characters"""
     # Keep only alphanumeric, dots, hyphens, and underscores
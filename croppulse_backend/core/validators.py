@@ -151,19 +151,20 @@ def validate_wind_speed(value):
         )
 
 
+KENYA_COUNTIES = [
+    'Mombasa', 'Kwale', 'Kilifi', 'Tana River', 'Lamu', 'Taita-Taveta',
+    'Garissa', 'Wajir', 'Mandera', 'Marsabit', 'Isiolo', 'Meru',
+    'Tharaka-Nithi', 'Embu', 'Kitui', 'Machakos', 'Makueni', 'Nyandarua',
+    'Nyeri', 'Kirinyaga', 'Murang\'a', 'Kiambu', 'Turkana', 'West Pokot',
+    'Samburu', 'Trans-Nzoia', 'Uasin Gishu', 'Elgeyo-Marakwet', 'Nandi',
+    'Baringo', 'Laikipia', 'Nakuru', 'Narok', 'Kajiado', 'Kericho',
+    'Bomet', 'Kakamega', 'Vihiga', 'Bungoma', 'Busia', 'Siaya', 'Kisumu',
+    'Homa Bay', 'Migori', 'Kisii', 'Nyamira', 'Nairobi'
+]
+
+
 def validate_county_name(value):
     """Validate county name is a valid Kenyan county"""
-    KENYA_COUNTIES = [
-        'Mombasa', 'Kwale', 'Kilifi', 'Tana River', 'Lamu', 'Taita-Taveta',
-        'Garissa', 'Wajir', 'Mandera', 'Marsabit', 'Isiolo', 'Meru',
-        'Tharaka-Nithi', 'Embu', 'Kitui', 'Machakos', 'Makueni', 'Nyandarua',
-        'Nyeri', 'Kirinyaga', 'Murang\'a', 'Kiambu', 'Turkana', 'West Pokot',
-        'Samburu', 'Trans-Nzoia', 'Uasin Gishu', 'Elgeyo-Marakwet', 'Nandi',
-        'Baringo', 'Laikipia', 'Nakuru', 'Narok', 'Kajiado', 'Kericho',
-        'Bomet', 'Kakamega', 'Vihiga', 'Bungoma', 'Busia', 'Siaya', 'Kisumu',
-        'Homa Bay', 'Migori', 'Kisii', 'Nyamira', 'Nairobi'
-    ]
-    
     if value not in KENYA_COUNTIES:
         raise ValidationError(
             _('Invalid Kenyan county name'),
@@ -185,3 +186,41 @@ def validate_crop_type(value):
             _('Invalid crop type. Please select from the allowed list.'),
             code='invalid_crop'
         )
+
+
+def validate_geofence(value):
+    """
+    Validate an alert geofence:
+    {'type': 'circle', 'center': [lat, lon], 'radius_km': 5} or
+    {'type': 'polygon', 'coordinates': [[lat, lon], ...]}
+    """
+    if not value:
+        return
+    
+    if not isinstance(value, dict) or value.get('type') not in ('circle', 'polygon'):
+        raise ValidationError(
+            _("Geofence must have type 'circle' or 'polygon'"),
+            code='invalid_geofence'
+        )
+    
+    def is_point(point):
+        return (
+            isinstance(point, (list, tuple)) and len(point) == 2 and
+            all(isinstance(v, (int, float)) for v in point) and
+            -90 <= point[0] <= 90 and -180 <= point[1] <= 180
+        )
+    
+    if value['type'] == 'circle':
+        radius = value.get('radius_km')
+        if not is_point(value.get('center')) or not isinstance(radius, (int, float)) or not 0 < radius <= 500:
+            raise ValidationError(
+                _('Circle geofence needs a [lat, lon] center and a radius_km between 0 and 500'),
+                code='invalid_geofence'
+            )
+    else:
+        coordinates = value.get('coordinates')
+        if not isinstance(coordinates, list) or len(coordinates) < 3 or not all(map(is_point, coordinates)):
+            raise ValidationError(
+                _('Polygon geofence needs at least three [lat, lon] coordinates'),
+                code='invalid_geofence'
+            )
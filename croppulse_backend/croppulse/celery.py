@@ -16,6 +16,12 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Auto-discover tasks from all registered Django apps
 app.autodiscover_tasks()
 
+# SMS outbox workers consume dedicated queues:
+#   celery -A croppulse worker -Q sms_otp,sms_bulk
+app.conf.task_routes = {
+    'apps.users.tasks.drain_sms_outbox': {'queue': 'sms_bulk'},
+}
+
 # Celery Beat schedule for periodic tasks
 app.conf.beat_schedule = {
     # Fetch weather updates every hour
@@ -28,6 +34,21 @@ app.conf.beat_schedule = {
         'task': 'apps.alerts.tasks.check_weather_alerts',
         'schedule': crontab(minute='*/30'),  # Every 30 minutes
     },
+    # Apply buffered alert acknowledgment counts
+    'flush-acknowledgment-counts': {
+        'task': 'apps.alerts.tasks.flush_acknowledgment_counts',
+        'schedule': crontab(minute='*'),  # Every minute
+    },
+    # Apply buffered Twilio/push delivery callbacks to alert logs
+    'flush-delivery-statuses': {
+        'task': 'apps.alerts.tasks.flush_delivery_statuses',
+        'schedule': crontab(minute='*'),  # Every minute
+    },
+    # Remind recipients who haven't acknowledged required alerts
+    'escalate-unacknowledged-alerts': {
+        'task': 'apps.alerts.tasks.escalate_unacknowledged_alerts',
+        'schedule': crontab(minute='*/10'),  # Every 10 minutes
+    },
     # Send daily weather summaries at 6 AM
     'send-daily-weather-summaries': {
         'task': 'apps.weather.tasks.send_daily_summaries',
@@ -38,6 +59,59 @@ app.conf.beat_schedule = {
         'task': 'apps.users.tasks.cleanup_old_notifications',
         'schedule': crontab(hour=2, minute=0, day_of_week=0),  # 2:00 AM on Sundays
     },
+    # Create upcoming monthly notification partitions
+    'maintain-notification-partitions': {
+        'task': 'apps.users.tasks.maintain_notification_partitions',
+        'schedule': crontab(hour=1, minute=30),  # 1:30 AM daily
+    },
+    # Pick up SMS retries whose backoff has elapsed
+    'drain-sms-outbox-otp': {
+        'task': 'apps.users.tasks.drain_sms_outbox',
+        'schedule': crontab(minute='*'),  # Every minute
+        'args': ('otp',),
+        'options': {'queue': 'sms_otp'},
+    },
+    'drain-sms-outbox-bulk': {
+        'task': 'apps.users.tasks.drain_sms_outbox',
+        'schedule': crontab(minute='*'),  # Every minute
+        'args': ('bulk',),
+        'options': {'queue': 'sms_bulk'},
+    },
+    # Safety net for outbox events whose on-commit relay was lost
+    'relay-outbox-events': {
+        'task': 'apps.users.tasks.relay_outbox_events',
+        'schedule': crontab(minute='*'),  # Every minute
+    },
+    # Deliver per-user notification digests
+    'flush-notification-digests': {
+        'task': 'apps.users.tasks.flush_notification_digests',
+        'schedule': crontab(minute='*'),  # Every minute
+    },
+    # Re-sync cached unread badges with the notifications table
+    'reconcile-unread-counters': {
+        'task': 'apps.users.tasks.reconcile_unread_counters',
+        'schedule': crontab(minute=15),  # Every hour
+    },
+    # Rebuild cached audience segments from the users table
+    'rebuild-audience-segments': {
+        'task': 'apps.users.tasks.rebuild_audience_segments',
+        'schedule': crontab(hour=3, minute=0),  # 3:00 AM daily
+    },
+    # Recompute field officer farm assignments from current locations
+    'rebuild-officer-assignments': {
+        'task': 'apps.users.tasks.rebuild_officer_assignments',
+        'schedule': crontab(hour=4, minute=0),  # 4:00 AM daily
+    },
+    # Re-sync cached observation counters with the observations table
+    'reconcile-observation-counters': {
+        'task': 'apps.observations.tasks.reconcile_observation_counters',
+        'schedule': crontab(hour=3, minute=30),  # 3:30 AM daily
+    },
+    # Remove abandoned resumable uploads and their staged chunks
+    'cleanup-upload-sessions': {
+        'task': 'apps.observations.tasks.cleanup_upload_sessions',
+        'schedule': crontab(minute=45),  # Every hour
+    },
 }
 
 @app.task(bind=True)
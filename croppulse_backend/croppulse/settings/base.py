@@ -45,6 +45,7 @@ MIDDLEWARE = [
     'debug_toolbar.middleware.DebugToolbarMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'core.middleware.QueryCountMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -117,7 +118,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -152,8 +153,15 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
+    'TOKEN_REFRESH_SERIALIZER': 'core.authentication.VersionedTokenRefreshSerializer',
 }
 
+# Authenticated users are cached per ID (see core.authentication)
+AUTH_USER_CACHE_TIMEOUT = 60 * 60
+
+# Per-request query counts in response headers (see core.middleware)
+QUERY_COUNT_HEADERS = config('QUERY_COUNT_HEADERS', default=False, cast=bool)
+
 # CORS Configuration
 # CORS_ALLOWED_ORIGINS = config('CORS_ALLOWED_ORIGINS', default='').split(',')
 
@@ -262,17 +270,86 @@ OPENWEATHER_API_KEY = config('OPENWEATHER_API_KEY', default='')
 TWILIO_ACCOUNT_SID = config('TWILIO_ACCOUNT_SID', default='')
 TWILIO_AUTH_TOKEN = config('TWILIO_AUTH_TOKEN', default='')
 TWILIO_PHONE_NUMBER = config('TWILIO_PHONE_NUMBER', default='')
+TWILIO_API_BASE_URL = config('TWILIO_API_BASE_URL', default='')  # Override for a local fake Twilio server
+TWILIO_STATUS_CALLBACK_URL = config('TWILIO_STATUS_CALLBACK_URL', default='')  # Public URL of the status webhook
+
+# One-time codes (held in the cache)
+OTP_TTL_SECONDS = config('OTP_TTL_SECONDS', default=600, cast=int)
+OTP_MAX_ATTEMPTS = config('OTP_MAX_ATTEMPTS', default=5, cast=int)
+OTP_RESEND_COOLDOWN_SECONDS = config('OTP_RESEND_COOLDOWN_SECONDS', default=60, cast=int)
+
+# SMS outbox workers
+SMS_RATE_LIMIT_PER_SECOND = config('SMS_RATE_LIMIT_PER_SECOND', default=10, cast=int)
+SMS_MAX_CONCURRENCY = config('SMS_MAX_CONCURRENCY', default=8, cast=int)
+SMS_BATCH_SIZE = config('SMS_BATCH_SIZE', default=100, cast=int)
+SMS_MAX_ATTEMPTS = config('SMS_MAX_ATTEMPTS', default=5, cast=int)
+SMS_RETRY_BACKOFF_SECONDS = config('SMS_RETRY_BACKOFF_SECONDS', default=30, cast=int)
+SMS_SEND_LEASE_SECONDS = 300  # Claimed messages are requeued if not finished in time
+
+# Alert acknowledgments
+ALERT_ACK_DEADLINE_MINUTES = config('ALERT_ACK_DEADLINE_MINUTES', default=120, cast=int)
+ALERT_ACK_BUFFER_TIMEOUT = 60 * 60 * 24 * 7  # Buffered ack deltas for alerts ended up to a week ago
+
+# Delivery status callbacks
+DELIVERY_STATUS_BUFFER_TIMEOUT = 60 * 60 * 24
+DELIVERY_STATUS_FLUSH_BATCH = config('DELIVERY_STATUS_FLUSH_BATCH', default=5000, cast=int)
+
+# Geofenced alert targeting
+FARM_INDEX_CELL_DEGREES = 0.05  # ~5.5 km grid cells
+FARM_INDEX_CACHE_TIMEOUT = 60 * 60
+
+# Audience segments (rebuilt nightly; signals keep them current in between)
+AUDIENCE_SEGMENT_TIMEOUT = 60 * 60 * 26
+
+# Farmer dashboard fragments (dropped by signals when their data changes)
+DASHBOARD_FRAGMENT_TIMEOUT = 60 * 15
+
+# Field officer dashboard observation counters (reconciled nightly)
+OBSERVATION_COUNTER_TIMEOUT = 60 * 60 * 26
+
+# Resized copies of uploaded images (see services.images)
+IMAGE_DERIVATIVE_QUALITY = config('IMAGE_DERIVATIVE_QUALITY', default=75, cast=int)
+IMAGE_DERIVATIVE_RECHECK_SECONDS = 300  # How long a storage check that found no derivatives is trusted
+
+# Resumable observation media uploads
+UPLOAD_CHUNK_MAX_SIZE = config('UPLOAD_CHUNK_MAX_SIZE', default=1024 * 1024, cast=int)
+UPLOAD_SESSION_TTL_SECONDS = 60 * 60 * 24
+UPLOAD_PRESIGNED_EXPIRY_SECONDS = 60 * 60  # Direct-to-S3 upload URLs
+
+# Offline sync batches (observations, crop and pest reports)
+SYNC_MAX_BATCH_ITEMS = config('SYNC_MAX_BATCH_ITEMS', default=200, cast=int)
+
+# Bulk farmer enrolment (users created per transaction)
+FARMER_IMPORT_BATCH_SIZE = config('FARMER_IMPORT_BATCH_SIZE', default=1000, cast=int)
+
+# Transactional outbox
+OUTBOX_RELAY_BATCH_SIZE = config('OUTBOX_RELAY_BATCH_SIZE', default=500, cast=int)
+OUTBOX_EVENTS_PER_TASK = config('OUTBOX_EVENTS_PER_TASK', default=10, cast=int)
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_BACKOFF_SECONDS = 60
+OUTBOX_LEASE_SECONDS = 900  # Dispatched events are relayed again if not finished in time
 
 # AWS S3 Configuration (for production file storage)
 AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID', default='')
 AWS_SECRET_ACCESS_KEY = config('AWS_SECRET_ACCESS_KEY', default='')
 AWS_STORAGE_BUCKET_NAME = config('AWS_STORAGE_BUCKET_NAME', default='')
 AWS_S3_REGION_NAME = config('AWS_S3_REGION_NAME', default='us-east-1')
+AWS_S3_ENDPOINT_URL = config('AWS_S3_ENDPOINT_URL', default='')  # Override for a local S3 stand-in (MinIO, LocalStack)
 AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com'
 AWS_DEFAULT_ACL = 'public-read'
 
 # Firebase Configuration (for push notifications)
 FIREBASE_CREDENTIALS_PATH = config('FIREBASE_CREDENTIALS_PATH', default='')
+FCM_MULTICAST_BATCH_SIZE = config('FCM_MULTICAST_BATCH_SIZE', default=500, cast=int)  # FCM max is 500
+FCM_MAX_CONCURRENT_BATCHES = config('FCM_MAX_CONCURRENT_BATCHES', default=4, cast=int)
+FCM_ENDPOINT_URL = config('FCM_ENDPOINT_URL', default='')  # Override for a local fake FCM server
+NOTIFICATION_UNREAD_CACHE_TIMEOUT = 60 * 60 * 24 * 7  # Cached unread badge counters
+NOTIFICATION_RETENTION_DAYS = config('NOTIFICATION_RETENTION_DAYS', default=30, cast=int)
+NOTIFICATION_ARCHIVE_PARTITIONS = config('NOTIFICATION_ARCHIVE_PARTITIONS', default=False, cast=bool)  # Keep expired months as archive tables
+NOTIFICATION_CLEANUP_BATCH_SIZE = 5000
+NOTIFICATION_DETACH_LOCK_TIMEOUT = '5s'  # Skip a partition for this run rather than stall traffic waiting on its lock
+NOTIFICATION_DIGEST_WINDOW_SECONDS = config('NOTIFICATION_DIGEST_WINDOW_SECONDS', default=900, cast=int)  # 0 disables digests
+NOTIFICATION_DIGEST_PRIORITIES = ('low', 'medium')  # Anything higher is delivered immediately
 
 # Logging Configuration
 LOGGING = {
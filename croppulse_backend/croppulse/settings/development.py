@@ -5,6 +5,8 @@ from .base import *
 
 DEBUG = True
 
+QUERY_COUNT_HEADERS = True
+
 ALLOWED_HOSTS = ['localhost', '127.0.0.1', '0.0.0.0']
 
 # Database
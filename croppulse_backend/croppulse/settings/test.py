@@ -13,6 +13,9 @@ DATABASES = {
     }
 }
 
+# Covering-index INCLUDE columns are Postgres-only; SQLite just ignores them
+SILENCED_SYSTEM_CHECKS = ['models.W040']
+
 # Password hashers - Use fast hasher for tests
 PASSWORD_HASHERS = [
     'django.contrib.auth.hashers.MD5PasswordHasher',
@@ -0,0 +1,183 @@
+"""
+Image derivatives for CropPulse Africa
+
+Every uploaded image gets resized copies at IMAGE_SIZES, written next to
+the original as <name>__<size>.webp (JPEG where Pillow lacks WebP). The
+copies are EXIF-stripped after applying the EXIF orientation, so no GPS
+or camera metadata leaves the server. Generation runs in Celery after
+the upload commits; a cache marker records which originals have their
+derivatives, and until it is set every size falls back to the original.
+The cache may lose the marker, so a miss is settled by checking storage
+for the last derivative written and the answer is cached again.
+"""
+import io
+import os
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, features
+from services.storage import storage_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Longest edge in pixels for each derivative
+IMAGE_SIZES = {
+    'thumb': 160,
+    'small': 480,
+    'medium': 1080,
+}
+
+# Model image fields that get derivatives
+IMAGE_FIELDS = {
+    'users.User': ['profile_picture'],
+    'observations.FarmObservation': ['image1', 'image2', 'image3'],
+    'observations.CropReport': ['crop_image'],
+    'observations.PestDiseaseReport': ['image1', 'image2'],
+    'community.ForumPost': ['image'],
+    'community.KnowledgeArticle': ['featured_image'],
+}
+
+WEBP = features.check('webp')
+FORMAT, EXTENSION = ('WEBP', 'webp') if WEBP else ('JPEG', 'jpg')
+
+
+class ImageDerivativeService:
+    """Creates and resolves resized copies of uploaded images"""
+
+    @staticmethod
+    def _marker_key(name: str) -> str:
+        return f'images:derivatives:{name}'
+
+    @staticmethod
+    def path(name: str, size: str) -> str:
+        """Storage path of one derivative of an original"""
+        root, _ = os.path.splitext(name)
+        return f'{root}__{size}.{EXTENSION}'
+
+    @staticmethod
+    def is_ready(name: str) -> bool:
+        return not ImageDerivativeService.pending([name])
+
+    @staticmethod
+    def pending(names: List[str]) -> List[str]:
+        """
+        Originals whose derivatives do not exist yet. Cached markers answer
+        in one round trip; only misses go to storage, and a negative answer
+        is remembered for IMAGE_DERIVATIVE_RECHECK_SECONDS.
+        """
+        keys = {ImageDerivativeService._marker_key(name): name for name in names if name}
+        found = cache.get_many(list(keys) + [f'{key}:missing' for key in keys])
+
+        pending, ready, missing = [], {}, {}
+        for key, name in keys.items():
+            if key in found:
+                continue
+            if f'{key}:missing' not in found and storage_service.file_exists(
+                ImageDerivativeService.path(name, list(IMAGE_SIZES)[-1])
+            ):
+                ready[key] = 1
+                continue
+            missing[f'{key}:missing'] = 1
+            pending.append(name)
+
+        if ready:
+            cache.set_many(ready, None)
+        if missing:
+            cache.set_many(missing, settings.IMAGE_DERIVATIVE_RECHECK_SECONDS)
+        return pending
+
+    @staticmethod
+    def claim(name: str) -> bool:
+        """True if no other generation for this original is already queued"""
+        return cache.add(f'{ImageDerivativeService._marker_key(name)}:queued', 1, 60 * 60)
+
+    @staticmethod
+    def queue(names: List[str]) -> int:
+        """
+        Queue generation for originals that still need derivatives, once
+        the current transaction commits
+
+        Returns:
+            int: Originals queued
+        """
+        from apps.users.tasks import generate_image_derivatives
+
+        queued = 0
+        for name in ImageDerivativeService.pending(names):
+            if ImageDerivativeService.claim(name):
+                transaction.on_commit(lambda name=name: generate_image_derivatives.delay(name))
+                queued += 1
+        return queued
+
+    @staticmethod
+    def generate(name: str) -> Dict[str, str]:
+        """
+        Write every derivative of an original image
+
+        Args:
+            name: Storage name of the original (FieldFile.name)
+
+        Returns:
+            dict: size -> derivative path
+        """
+        with default_storage.open(name, 'rb') as source:
+            image = Image.open(source)
+            image.load()
+
+        # Bake the orientation into the pixels; saving without exif= drops the rest
+        image = ImageOps.exif_transpose(image)
+        mode = 'RGBA' if FORMAT == 'WEBP' and 'A' in image.getbands() else 'RGB'
+        if image.mode != mode:
+            image = image.convert(mode)
+
+        paths = {}
+        for size, edge in IMAGE_SIZES.items():
+            derivative = image.copy()
+            derivative.thumbnail((edge, edge), Image.LANCZOS)
+
+            buffer = io.BytesIO()
+            derivative.save(buffer, FORMAT, quality=settings.IMAGE_DERIVATIVE_QUALITY, optimize=True)
+
+            path = ImageDerivativeService.path(name, size)
+            if storage_service.file_exists(path):
+                storage_service.delete_file(path)
+            if storage_service.upload_file(ContentFile(buffer.getvalue()), path) is None:
+                raise IOError(f'Could not store {path}')
+            paths[size] = path
+
+        cache.set(ImageDerivativeService._marker_key(name), 1, None)
+        cache.delete_many([
+            f'{ImageDerivativeService._marker_key(name)}:queued',
+            f'{ImageDerivativeService._marker_key(name)}:missing',
+        ])
+        logger.info(f'Generated {len(paths)} derivatives for {name}')
+        return paths
+
+    @staticmethod
+    def urls(field_file) -> Optional[Dict[str, str]]:
+        """
+        URL per size for an image field, falling back to the original for
+        sizes not generated yet
+
+        Returns:
+            dict: {'original': url, 'thumb': url, ...} or None if empty
+        """
+        if not field_file:
+            return None
+
+        original = field_file.url
+        if not ImageDerivativeService.is_ready(field_file.name):
+            return {'original': original, **{size: original for size in IMAGE_SIZES}}
+
+        return {
+            'original': original,
+            **{
+                size: storage_service.get_file_url(ImageDerivativeService.path(field_file.name, size))
+                for size in IMAGE_SIZES
+            }
+        }
@@ -0,0 +1,272 @@
+"""
+Notification and SMS message catalogue
+
+Templates are compiled once per process when this module is imported.
+Fan-outs render each message once per language for a send and share the
+rendered strings across every recipient in that language. SMS text is
+normalised towards GSM-7 and its segment count worked out at render time,
+so the outbox never has to measure a message per recipient.
+"""
+import math
+from dataclasses import dataclass
+from string import Formatter
+from typing import Dict, Iterable, Tuple
+
+
+DEFAULT_LANGUAGE = 'en'
+
+# Kikuyu, Luhya and Kamba speakers get Swahili until translations exist
+LANGUAGE_FALLBACKS = {
+    'ki': ['sw', 'en'],
+    'lu': ['sw', 'en'],
+    'ka': ['sw', 'en'],
+    'sw': ['en'],
+}
+
+# Each message has a push title, push body and (optional) SMS text
+MESSAGES = {
+    'alert': {
+        'en': {
+            'title': '{title}',
+            'message': '{message}',
+            'sms': 'CropPulse Alert: {title}. {message}',
+        },
+        'sw': {
+            'title': '{title}',
+            'message': '{message}',
+            'sms': 'Tahadhari ya CropPulse: {title}. {message}',
+        },
+    },
+    'alert_reminder': {
+        'en': {
+            'title': 'Reminder: {title}',
+            'message': 'Please open CropPulse and acknowledge this alert.',
+            'sms': 'Reminder: {title}. Please open CropPulse and acknowledge this alert.',
+        },
+        'sw': {
+            'title': 'Kumbusho: {title}',
+            'message': 'Tafadhali fungua CropPulse na uthibitishe tahadhari hii.',
+            'sms': 'Kumbusho: {title}. Tafadhali fungua CropPulse na uthibitishe tahadhari hii.',
+        },
+    },
+    'advisory': {
+        'en': {
+            'title': '{title}',
+            'message': '{message}',
+            'sms': 'CropPulse Advisory: {title}. {message}',
+        },
+        'sw': {
+            'title': '{title}',
+            'message': '{message}',
+            'sms': 'Ushauri wa CropPulse: {title}. {message}',
+        },
+    },
+    'pest_disease_alert': {
+        'en': {
+            'title': 'Pest/Disease Alert: {name}',
+            'message': (
+                '{kind} outbreak reported on {crop}. Severity: {severity}. '
+                'Location: {county}. Affected area: {area}ha.'
+            ),
+        },
+        'sw': {
+            'title': 'Tahadhari ya Wadudu/Magonjwa: {name}',
+            'message': (
+                'Mlipuko wa {kind} umeripotiwa kwenye {crop}. Ukali: {severity}. '
+                'Mahali: {county}. Eneo lililoathirika: hekta {area}.'
+            ),
+        },
+    },
+    'daily_weather_summary': {
+        'en': {
+            'title': 'Daily Weather Summary',
+            'message': (
+                "Today's weather in {county}: Avg temp {temperature}°C, "
+                'Humidity {humidity}%, Rainfall {rainfall}mm'
+            ),
+        },
+        'sw': {
+            'title': 'Muhtasari wa Hali ya Hewa',
+            'message': (
+                'Hali ya hewa leo {county}: Wastani wa joto {temperature}°C, '
+                'Unyevu {humidity}%, Mvua {rainfall}mm'
+            ),
+        },
+    },
+    'login_otp': {
+        'en': {
+            'title': 'Login code',
+            'message': 'Your CropPulse Africa login code is: {code}. Valid for {minutes} minutes.',
+        },
+        'sw': {
+            'title': 'Nambari ya kuingia',
+            'message': 'Nambari yako ya kuingia CropPulse Africa ni: {code}. Inatumika kwa dakika {minutes}.',
+        },
+    },
+    'verification_code': {
+        'en': {
+            'title': 'Verification code',
+            'message': 'Your CropPulse verification code is: {code}. Valid for {minutes} minutes.',
+        },
+        'sw': {
+            'title': 'Nambari ya uthibitisho',
+            'message': 'Nambari yako ya uthibitisho ya CropPulse ni: {code}. Inatumika kwa dakika {minutes}.',
+        },
+    },
+    'welcome': {
+        'en': {
+            'title': 'Welcome to CropPulse Africa',
+            'message': (
+                'Welcome to CropPulse Africa, {name}! You will get weather alerts and farming '
+                'advice for {county}. Log in with this phone number to get started.'
+            ),
+        },
+        'sw': {
+            'title': 'Karibu CropPulse Africa',
+            'message': (
+                'Karibu CropPulse Africa, {name}! Utapokea tahadhari za hali ya hewa na ushauri '
+                'wa kilimo kwa {county}. Ingia kwa nambari hii ya simu kuanza.'
+            ),
+        },
+    },
+    'digest': {
+        'en': {
+            'title': '{count} new updates',
+            'message': '{titles}',
+        },
+        'sw': {
+            'title': 'Taarifa mpya {count}',
+            'message': '{titles}',
+        },
+    },
+}
+
+# GSM 03.38 basic character set; extension characters cost two septets
+GSM7_BASIC = set(
+    '@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !"#¤%&\'()*+,-./0123456789:;<=>?'
+    '¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà'
+)
+GSM7_EXTENDED = set('^{}\\[~]|€\f')
+
+# Typographic characters that would otherwise force the whole SMS to UCS-2
+GSM7_REPLACEMENTS = str.maketrans({
+    '‘': "'", '’': "'", '“': '"', '”': '"',
+    '–': '-', '—': '-', '…': '...', '\u00a0': ' ', '°': '',
+})
+
+
+def sms_segments(text: str) -> Tuple[str, int]:
+    """
+    Encoding and number of segments an SMS will be billed as
+
+    Returns:
+        tuple: ('gsm7' or 'ucs2', segment count)
+    """
+    if all(char in GSM7_BASIC or char in GSM7_EXTENDED for char in text):
+        units = len(text) + sum(1 for char in text if char in GSM7_EXTENDED)
+        single, multipart, encoding = 160, 153, 'gsm7'
+    else:
+        units = len(text.encode('utf-16-le')) // 2
+        single, multipart, encoding = 70, 67, 'ucs2'
+
+    if units <= single:
+        return encoding, 1
+    return encoding, math.ceil(units / multipart)
+
+
+class MessageTemplate:
+    """A format string parsed once into literal text and fields"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.parts = [
+            (literal, field, spec)
+            for literal, field, spec, _ in Formatter().parse(text)
+        ]
+        self.fields = {field for _, field, _ in self.parts if field}
+
+    def render(self, context: Dict) -> str:
+        return ''.join(
+            literal + (format(context[field], spec) if field is not None else '')
+            for literal, field, spec in self.parts
+        )
+
+
+@dataclass(frozen=True)
+class RenderedMessage:
+    """One message rendered for one language, shared by its recipients"""
+    language: str
+    title: str
+    message: str
+    sms: str
+    sms_encoding: str
+    sms_segments: int
+
+
+class MessageCatalog:
+    """Compiled MESSAGES with per-language fallback"""
+
+    def __init__(self, messages: Dict = MESSAGES):
+        self.templates = {}
+        for key, translations in messages.items():
+            fields = None
+            for language, parts in translations.items():
+                compiled = {name: MessageTemplate(text) for name, text in parts.items()}
+                used = set().union(*(template.fields for template in compiled.values()))
+                # Every translation must take the same placeholders as the others
+                if fields is not None and used != fields:
+                    raise ValueError(f'Message {key!r} ({language}) uses {sorted(used)}, expected {sorted(fields)}')
+                fields = used
+                self.templates[(key, language)] = compiled
+
+    def resolve_language(self, key: str, language: str) -> str:
+        """Language a message will actually be rendered in"""
+        for candidate in [language] + LANGUAGE_FALLBACKS.get(language, []) + [DEFAULT_LANGUAGE]:
+            if (key, candidate) in self.templates:
+                return candidate
+        raise KeyError(f'Unknown message {key!r}')
+
+    def render(self, key: str, language: str = DEFAULT_LANGUAGE, **context) -> RenderedMessage:
+        """
+        Render a message in a language (or its nearest fallback)
+
+        Args:
+            key: Message key in MESSAGES
+            language: User.language code
+            **context: Template placeholder values
+
+        Returns:
+            RenderedMessage
+        """
+        resolved = self.resolve_language(key, language)
+        compiled = self.templates[(key, resolved)]
+
+        title = compiled['title'].render(context)
+        message = compiled['message'].render(context)
+        sms = compiled['sms'].render(context) if 'sms' in compiled else message
+        sms = sms.translate(GSM7_REPLACEMENTS)
+        encoding, segments = sms_segments(sms)
+
+        return RenderedMessage(resolved, title, message, sms, encoding, segments)
+
+    def render_all(self, key: str, languages: Iterable[str], **context) -> Dict[str, RenderedMessage]:
+        """
+        Render a message for every language in a fan-out, once per
+        resolved language
+
+        Returns:
+            dict: language code -> RenderedMessage (fallback languages
+                  share the same instance)
+        """
+        rendered = {}
+        by_resolved = {}
+        for language in set(languages) | {DEFAULT_LANGUAGE}:
+            resolved = self.resolve_language(key, language)
+            if resolved not in by_resolved:
+                by_resolved[resolved] = self.render(key, resolved, **context)
+            rendered[language] = by_resolved[resolved]
+        return rendered
+
+
+# Singleton instance
+message_catalog = MessageCatalog()
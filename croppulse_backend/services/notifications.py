@@ -2,10 +2,14 @@
 Notification Service for CropPulse Africa
 Handles push notifications via Firebase Cloud Messaging
 """
+import time
+from concurrent.futures import ThreadPoolExecutor
 import firebase_admin
-from firebase_admin import credentials, messaging
+from firebase_admin import credentials, messaging, exceptions as firebase_exceptions
 from django.conf import settings
+from django.utils.text import slugify
 from typing import List, Dict, Optional
+from core.utils import chunk_list
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,8 +18,21 @@ logger = logging.getLogger(__name__)
 class NotificationService:
     """Service for sending push notifications via Firebase"""
     
+    # FCM rejects multicast requests with more than 500 tokens
+    MAX_MULTICAST_TOKENS = 500
+    
+    # firebase_admin major version whose internals _configure_endpoint relies on
+    FCM_URL_OVERRIDE_VERSION = '7.'
+    
     def __init__(self):
         self.initialized = False
+        self.batch_size = min(
+            getattr(settings, 'FCM_MULTICAST_BATCH_SIZE', self.MAX_MULTICAST_TOKENS),
+            self.MAX_MULTICAST_TOKENS
+        )
+        self.max_concurrent_batches = getattr(settings, 'FCM_MAX_CONCURRENT_BATCHES', 4)
+        # Transport used for each multicast batch (swappable for tests)
+        self.send_batch = messaging.send_each_for_multicast
         self._initialize_firebase()
     
     def _initialize_firebase(self):
@@ -23,13 +40,70 @@ class NotificationService:
         try:
             if settings.FIREBASE_CREDENTIALS_PATH and not self.initialized:
                 cred = credentials.Certificate(settings.FIREBASE_CREDENTIALS_PATH)
-                firebase_admin.initialize_app(cred)
+                app = firebase_admin.initialize_app(cred)
+                self._configure_endpoint(app)
                 self.initialized = True
                 logger.info('Firebase initialized successfully')
         except Exception as e:
             logger.warning(f'Firebase initialization failed: {str(e)}')
             self.initialized = False
     
+    def _configure_endpoint(self, app):
+        """
+        Point FCM sends at FCM_ENDPOINT_URL (e.g. a local fake FCM server)
+        
+        firebase_admin has no public option for this, so it is the one
+        place that touches SDK internals. It only does so on the major
+        version it was written against and otherwise leaves the SDK alone.
+        """
+        endpoint = getattr(settings, 'FCM_ENDPOINT_URL', '')
+        if not endpoint:
+            return
+        
+        service = messaging._get_messaging_service(app)
+        if not firebase_admin.__version__.startswith(self.FCM_URL_OVERRIDE_VERSION) or not hasattr(service, '_fcm_url'):
+            logger.warning(
+                f'FCM_ENDPOINT_URL ignored: not supported with firebase_admin {firebase_admin.__version__}'
+            )
+            return
+        
+        service._fcm_url = endpoint
+        logger.info(f'FCM endpoint overridden: {endpoint}')
+    
+    @staticmethod
+    def topic_name(kind: str, *parts: str) -> str:
+        """
+        Build an FCM-safe topic name, e.g. topic_name('county', 'Nairobi')
+        gives 'county-nairobi'
+        """
+        return '-'.join([kind] + [slugify(part) for part in parts if part])
+    
+    @staticmethod
+    def localized_topic(topic: str, language: str) -> str:
+        """
+        Language variant of a topic. English keeps the plain name, so
+        existing subscriptions stay valid; other languages get a suffix,
+        e.g. 'county-nairobi-sw'.
+        """
+        if not language or language == 'en':
+            return topic
+        return NotificationService.topic_name(topic, language)
+    
+    @staticmethod
+    def _stringify_data(data: Optional[Dict]) -> Dict:
+        """FCM data payloads only accept string values"""
+        return {str(k): '' if v is None else str(v) for k, v in (data or {}).items()}
+    
+    @staticmethod
+    def _is_invalid_token_error(exception) -> bool:
+        """Check if a per-token send error means the token is dead"""
+        if isinstance(exception, (messaging.UnregisteredError, messaging.SenderIdMismatchError)):
+            return True
+        return (
+            isinstance(exception, firebase_exceptions.InvalidArgumentError) and
+            'registration token' in str(exception).lower()
+        )
+    
     def send_push_notification(
         self,
         device_token: str,
@@ -59,7 +133,7 @@ class NotificationService:
                     title=title,
                     body=body,
                 ),
-                data=data or {},
+                data=self._stringify_data(data),
                 token=device_token,
             )
             
@@ -79,7 +153,9 @@ class NotificationService:
         data: Optional[Dict] = None
     ) -> Dict:
         """
-        Send push notification to multiple devices
+        Send push notification to multiple devices.
+        Tokens are chunked to the FCM multicast limit and the chunks are
+        sent concurrently (bounded by FCM_MAX_CONCURRENT_BATCHES).
         
         Args:
             device_tokens: List of FCM device tokens
@@ -88,42 +164,116 @@ class NotificationService:
             data: Additional data payload
             
         Returns:
-            dict: Results with success and failure counts
+            dict: Success/failure counts, failed and invalid (dead) tokens,
+                  and per-batch latency
         """
+        tokens = list(dict.fromkeys(token for token in device_tokens if token))
+        
         if not self.initialized:
             logger.error('Firebase not initialized')
-            return {'success_count': 0, 'failure_count': len(device_tokens)}
+            return {
+                'success_count': 0,
+                'failure_count': len(tokens),
+                'failed_tokens': tokens,
+                'invalid_tokens': [],
+                'batches': [],
+            }
         
-        try:
-            message = messaging.MulticastMessage(
-                notification=messaging.Notification(
-                    title=title,
-                    body=body,
-                ),
-                data=data or {},
-                tokens=device_tokens,
-            )
-            
-            response = messaging.send_multicast(message)
-            
-            logger.info(
-                f'Multicast sent. Success: {response.success_count}, '
-                f'Failure: {response.failure_count}'
-            )
-            
+        if not tokens:
             return {
-                'success_count': response.success_count,
-                'failure_count': response.failure_count,
-                'responses': response.responses,
+                'success_count': 0,
+                'failure_count': 0,
+                'failed_tokens': [],
+                'invalid_tokens': [],
+                'batches': [],
             }
+        
+        notification = messaging.Notification(title=title, body=body)
+        payload = self._stringify_data(data)
+        batches = chunk_list(tokens, self.batch_size)
+        workers = max(1, min(self.max_concurrent_batches, len(batches)))
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            batch_results = list(executor.map(
+                lambda batch: self._send_multicast_batch(batch, notification, payload),
+                batches
+            ))
+        
+        result = {
+            'success_count': sum(r['success_count'] for r in batch_results),
+            'failure_count': sum(r['failure_count'] for r in batch_results),
+            'failed_tokens': [t for r in batch_results for t in r.pop('failed_tokens')],
+            'invalid_tokens': [t for r in batch_results for t in r.pop('invalid_tokens')],
+            'batches': batch_results,
+        }
+        
+        logger.info(
+            f'Multicast sent in {len(batches)} batch(es). '
+            f'Success: {result["success_count"]}, Failure: {result["failure_count"]}, '
+            f'Invalid tokens: {len(result["invalid_tokens"])}'
+        )
+        
+        return result
+    
+    def _send_multicast_batch(
+        self,
+        tokens: List[str],
+        notification: messaging.Notification,
+        data: Dict
+    ) -> Dict:
+        """
+        Send one multicast batch and parse the per-token responses
+        
+        Args:
+            tokens: Device tokens (at most MAX_MULTICAST_TOKENS)
+            notification: Notification to send
+            data: Stringified data payload
             
+        Returns:
+            dict: Batch size, counts, failed/invalid tokens and latency in ms
+        """
+        started = time.perf_counter()
+        
+        try:
+            response = self.send_batch(messaging.MulticastMessage(
+                notification=notification,
+                data=data,
+                tokens=tokens,
+            ))
         except Exception as e:
-            logger.error(f'Failed to send multicast notification: {str(e)}')
+            latency_ms = round((time.perf_counter() - started) * 1000, 2)
+            logger.error(f'Failed to send multicast batch of {len(tokens)}: {str(e)}')
             return {
+                'size': len(tokens),
                 'success_count': 0,
-                'failure_count': len(device_tokens),
+                'failure_count': len(tokens),
+                'failed_tokens': list(tokens),
+                'invalid_tokens': [],
+                'latency_ms': latency_ms,
                 'error': str(e),
             }
+        
+        latency_ms = round((time.perf_counter() - started) * 1000, 2)
+        failed_tokens = []
+        invalid_tokens = []
+        
+        for token, send_response in zip(tokens, response.responses):
+            if send_response.success:
+                continue
+            failed_tokens.append(token)
+            if self._is_invalid_token_error(send_response.exception):
+                invalid_tokens.append(token)
+        
+        logger.debug(f'Multicast batch of {len(tokens)} sent in {latency_ms}ms')
+        
+        return {
+            'size': len(tokens),
+            'success_count': response.success_count,
+            'failure_count': response.failure_count,
+            'failed_tokens': failed_tokens,
+            'invalid_tokens': invalid_tokens,
+            'latency_ms': latency_ms,
+        }
     
     def send_topic_notification(
         self,
@@ -154,7 +304,7 @@ class NotificationService:
                     title=title,
                     body=body,
                 ),
-                data=data or {},
+                data=self._stringify_data(data),
                 topic=topic,
             )
             
@@ -2,8 +2,11 @@
 SMS Service with Console Logging for Development
 File: services/sms.py (update your existing file)
 """
+import time
 import logging
+from typing import Dict
 from django.conf import settings
+from django.core.cache import cache
 from twilio.rest import Client
 from twilio.base.exceptions import TwilioRestException
 
@@ -13,7 +16,14 @@ logger = logging.getLogger(__name__)
 class SMSService:
     """Service for sending SMS messages via Twilio with console fallback"""
     
+    # Twilio error codes that will never succeed on retry
+    # (invalid/unreachable number, unsubscribed recipient, etc.)
+    PERMANENT_ERROR_CODES = {21211, 21408, 21610, 21612, 21614}
+    
     def __init__(self):
+        # Provider rate limit shared by all SMS workers (messages per second)
+        self.rate_limit = getattr(settings, 'SMS_RATE_LIMIT_PER_SECOND', 0)
+        
         # Check if Twilio credentials are configured
         self.use_twilio = all([
             settings.TWILIO_ACCOUNT_SID,
@@ -27,6 +37,10 @@ class SMSService:
                     settings.TWILIO_ACCOUNT_SID,
                     settings.TWILIO_AUTH_TOKEN
                 )
+                # Point at a local fake Twilio server when configured
+                api_base_url = getattr(settings, 'TWILIO_API_BASE_URL', '')
+                if api_base_url:
+                    self.client.api.base_url = api_base_url
                 logger.info("✅ Twilio SMS client initialized")
             except Exception as e:
                 logger.error(f"❌ Failed to initialize Twilio: {e}")
@@ -47,6 +61,21 @@ class SMSService:
         Returns:
             bool: True if sent successfully
         """
+        return self.deliver(phone_number, message)['success']
+    
+    def deliver(self, phone_number: str, message: str, segments: int = 1) -> Dict:
+        """
+        Send SMS and report the provider outcome (used by the outbox workers)
+        
+        Args:
+            phone_number: Phone in E.164 format (+254...)
+            message: SMS content
+            segments: Parts the message is billed as; each takes a rate slot
+            
+        Returns:
+            dict: success, provider sid, error message and whether
+                  a failed send is worth retrying
+        """
         # DEVELOPMENT MODE: Log to console
         if settings.DEBUG and not self.use_twilio:
             logger.warning("\n" + "=" * 70)
@@ -64,26 +93,70 @@ class SMSService:
             print(f"MESSAGE: {message}")
             print("=" * 70 + "\n")
             
-            return True
+            return {'success': True, 'sid': '', 'error': '', 'retryable': False}
+        
+        if not self.use_twilio:
+            logger.error(f"❌ Cannot send SMS to {phone_number}: Twilio not configured")
+            return {'success': False, 'sid': '', 'error': 'Twilio not configured', 'retryable': False}
         
         # PRODUCTION MODE: Send via Twilio
+        self._acquire_rate_slot(segments)
+        
         try:
+            options = {}
+            if settings.TWILIO_STATUS_CALLBACK_URL:
+                options['status_callback'] = settings.TWILIO_STATUS_CALLBACK_URL
+            
             response = self.client.messages.create(
                 body=message,
                 from_=settings.TWILIO_PHONE_NUMBER,
-                to=phone_number
+                to=phone_number,
+                **options
             )
             
             logger.info(f"✅ SMS sent to {phone_number}. SID: {response.sid}")
-            return True
+            return {'success': True, 'sid': response.sid, 'error': '', 'retryable': False}
             
         except TwilioRestException as e:
             logger.error(f"❌ Twilio error sending to {phone_number}: {e.msg}")
-            return False
+            retryable = (
+                e.code not in self.PERMANENT_ERROR_CODES and
+                (e.status == 429 or e.status >= 500)
+            )
+            return {'success': False, 'sid': '', 'error': str(e.msg), 'retryable': retryable}
             
         except Exception as e:
             logger.error(f"❌ Failed to send SMS to {phone_number}: {str(e)}")
-            return False
+            return {'success': False, 'sid': '', 'error': str(e), 'retryable': True}
+    
+    def _acquire_rate_slot(self, segments: int = 1):
+        """
+        Block until a send slot is free under SMS_RATE_LIMIT_PER_SECOND.
+        Uses a one-second window counter in the shared cache so the limit
+        holds across all SMS workers. Providers throttle per segment, so a
+        multi-part message takes one slot per part.
+        """
+        if not self.rate_limit:
+            return
+        
+        weight = max(1, min(segments, self.rate_limit))
+        
+        while True:
+            window = int(time.time())
+            key = f'sms:rate:{window}'
+            cache.add(key, 0, timeout=2)
+            try:
+                count = cache.incr(key, weight)
+            except ValueError:
+                # Key gone between add and incr (expiry, eviction, or a cache
+                # that keeps nothing); start the window over instead of spinning
+                cache.set(key, weight, timeout=2)
+                count = weight
+            
+            if count <= self.rate_limit:
+                return
+            
+            time.sleep(max(0.0, window + 1 - time.time()))
     
     def send_verification_code(self, phone_number: str, code: str) -> bool:
         """
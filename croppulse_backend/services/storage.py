@@ -17,14 +17,15 @@ class StorageService:
     """Service for managing file storage"""
     
     def __init__(self):
-        self.use_s3 = settings.DEFAULT_FILE_STORAGE == 'storages.backends.s3boto3.S3Boto3Storage'
+        self.use_s3 = getattr(settings, 'DEFAULT_FILE_STORAGE', '') == 'storages.backends.s3boto3.S3Boto3Storage'
         
         if self.use_s3:
             self.s3_client = boto3.client(
                 's3',
                 aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
                 aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                region_name=settings.AWS_S3_REGION_NAME
+                region_name=settings.AWS_S3_REGION_NAME,
+                endpoint_url=settings.AWS_S3_ENDPOINT_URL or None
             )
             self.bucket_name = settings.AWS_STORAGE_BUCKET_NAME
     
@@ -122,6 +123,54 @@ class StorageService:
             logger.error(f'Failed to generate presigned URL: {str(e)}')
             return None
     
+    def generate_presigned_post(
+        self,
+        file_path: str,
+        size: int,
+        content_type: str = '',
+        expiration: int = 3600,
+        acl: Optional[str] = None
+    ) -> Optional[dict]:
+        """
+        Generate a presigned POST that lets a client upload one object
+        straight to S3, limited to this key and exactly this size
+        
+        Args:
+            file_path: Key the object must be stored under
+            size: Object size in bytes
+            content_type: Content-Type the upload must declare, if any
+            expiration: URL expiration time in seconds
+            acl: Canned ACL for the object (defaults to AWS_DEFAULT_ACL)
+            
+        Returns:
+            dict: {'url': ..., 'fields': {...}} to send as a multipart form
+                  (file last), or None if storage is not S3 or signing failed
+        """
+        if not self.use_s3:
+            return None
+        
+        fields = {}
+        conditions = [['content-length-range', size, size]]
+        if content_type:
+            fields['Content-Type'] = content_type
+            conditions.append({'Content-Type': content_type})
+        acl = acl or settings.AWS_DEFAULT_ACL
+        if acl:
+            fields['acl'] = acl
+            conditions.append({'acl': acl})
+        
+        try:
+            return self.s3_client.generate_presigned_post(
+                self.bucket_name,
+                file_path,
+                Fields=fields,
+                Conditions=conditions,
+                ExpiresIn=expiration
+            )
+        except ClientError as e:
+            logger.error(f'Failed to generate presigned POST: {str(e)}')
+            return None
+    
     def file_exists(self, file_path: str) -> bool:
         """
         Check if file exists in storage